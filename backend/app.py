@@ -2,14 +2,28 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import sqlite3
 import numpy as np
-from scipy.sparse import csc_matrix, csr_matrix, diags
-import re
+from scipy.sparse import csr_matrix, diags
 import os
-import re
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
+import functools
+import gc
 import nltk
 import joblib
+import index_store
+import text_analyzer
+import topk
+import inverted_index
+import svd_store
+from svd_cache import SVDCache
+import ivf_index
+import quantization
+import snippet_store
+import document_store
+from result_cache import ResultCache, query_key
+import live_index
+import svd_fold_in
+import shard_search
+from query_batcher import QueryBatcher
+import threading
 
 nltk.download('wordnet')
 nltk.download('stopwords')
@@ -22,301 +36,464 @@ CORS(app)
 DATABASE = 'database.db'
 TABLE = 'articles_180k'
 SVD_OUTPUT_DIR = 'svd_components'
+INDEX_DIR = 'index'
 DEFAULT_SVD_RANK = 300
+DEFAULT_RESULTS_LIMIT = 10
+MAX_RESULTS_LIMIT = 100
+MAX_BATCH_QUERIES = 1000
+BATCH_SCORING_CHUNK = 64 # Queries scored per matrix product (bounds the dense score block)
+SVD_CACHE_MAX_BYTES = 4 * 1024**3 # Memory budget for SVD ranks held in memory
+RESULT_CACHE_MAX_BYTES = 64 * 1024**2 # Memory budget for cached search results
+SEARCH_SHARDS = int(os.environ.get('SEARCH_SHARDS', 0)) # Worker processes of document-sharded search (0: search in this process)
+QUERY_BATCH_WINDOW_MS = float(os.environ.get('QUERY_BATCH_WINDOW_MS', 0)) # Micro-batching of concurrent searches (0: each query scored alone)
+QUERY_BATCH_MAX_SIZE = int(os.environ.get('QUERY_BATCH_MAX_SIZE', 64))
 
 dictionary = None
-documents_info = None  
+term_to_index = None
+doc_ids = None # Database id of each document
+doc_titles = None # Titles and links as string columns (see document_store.py)
+doc_links = None
+snippets = None
 A_normalized = None
-A_idf = None
+postings = None
 idf_vector = None
 N_docs = 0
 M_terms = 0
 
-current_svd_k = None
-U_k = None       
-s_k = None        
-V_k_T = None       
-s_k_inv = None     
-doc_svd_norms = None
+svd_components_store = None
+svd_store_lock = threading.Lock()
+# Failed loads are remembered with the index version and the modification time of
+# the file, and retried only once either changes (not on every request)
+svd_store_failed_load = None
+legacy_svd_failed_loads = {}
+
+# Added and deleted articles on top of the loaded index (see live_index.py)
+live = None
+index_lock = live_index.ReadWriteLock() # Searches read, live changes and merges write
+approximate_indexes_valid = True # IVF lists and quantized codes describe the documents of the loaded store
+shards = None # shard_search.ShardedIndex over the index artifact, if SEARCH_SHARDS > 0
+server_registration = None # Registers this process as a server of INDEX_DIR (see index_store.register_server)
+data_pid = None # Process that loaded the data
+
+# Versions of the loaded data; cached results of other versions are discarded
+index_version = 0
+svd_store_version = None
+
+def data_version(mode):
+    live_generation = live.generation if live is not None else 0
+    if mode == 'linear':
+        return (index_version, live_generation)
+    return (index_version, live_generation, svd_store_version)
+
+def reads_index(view):
+    # Live changes and merges are swapped in between requests, never during one
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with index_lock.reading():
+            return view(*args, **kwargs)
+    return wrapper
+
+def svd_store_matches_documents(store):
+    # Rows of the store must be the documents of the loaded index, in the same order
+    if doc_ids is None or store['doc_embeddings'].shape[0] != len(doc_ids):
+        return False
+    store_doc_ids = store.get('doc_ids')
+    if store_doc_ids is None:
+        return True
+    return snippet_store.doc_ids_checksum(store_doc_ids) == snippet_store.doc_ids_checksum(doc_ids)
 
-def load_svd_components(k):
-    global current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms
+def svd_load_attempt(filename):
+    try:
+        return index_version, os.stat(filename).st_mtime_ns
+    except OSError:
+        return index_version, None
+
+def get_svd_store():
+    global svd_components_store, svd_store_version, svd_store_failed_load
+    with svd_store_lock:
+        if svd_components_store is None:
+            attempt = svd_load_attempt(os.path.join(SVD_OUTPUT_DIR, svd_store.STORE_FILENAME))
+            if attempt == svd_store_failed_load:
+                return None
+            try:
+                store = svd_store.load_store(SVD_OUTPUT_DIR)
+                if store is not None and not svd_store_matches_documents(store):
+                    print("SVD store does not cover the loaded documents. Run 'python svd_fold_in.py' to update it.")
+                    store = None
+                svd_components_store = store
+                if svd_components_store is not None:
+                    svd_store_version = svd_store.store_fingerprint(SVD_OUTPUT_DIR)
+            except Exception as e:
+                print(f"An error occurred loading the SVD store: {e}")
+            if svd_components_store is None:
+                svd_store_failed_load = attempt
+        return svd_components_store
+
+def check_svd_rank(requested_k):
+    if not isinstance(requested_k, int) or isinstance(requested_k, bool) or requested_k <= 0:
+        print(f"Invalid k value received: {requested_k}")
+        return "Invalid 'k' parameter. Must be a positive integer."
+    store = get_svd_store()
+    if store is not None and requested_k > store['k_max']:
+        return f"Invalid 'k' parameter. The largest available SVD rank is {store['k_max']}."
+    return None
 
-    if current_svd_k == k and U_k is not None:
-        return True
+def load_svd_components(k):
+    store = get_svd_store()
+    if store is not None:
+        return svd_store.rank_view(store, k)
 
+    # Per-rank files written by older versions of generate_svd_files.py
     filename = os.path.join(SVD_OUTPUT_DIR, f'svd_k_{k}.joblib')
-    print(f"Attempting to load SVD components for k={k} from {filename}...")
+    attempt = svd_load_attempt(filename)
+    if legacy_svd_failed_loads.get(k) == attempt:
+        return None
+    print(f"SVD store not found, attempting to load SVD components for k={k} from {filename}...")
 
+    svd_components = None
     try:
-        svd_components = joblib.load(filename)
-        loaded_k_from_file = svd_components['s_k'].shape[0]
+        legacy_components = joblib.load(filename)
+        loaded_k_from_file = legacy_components['s_k'].shape[0]
         if loaded_k_from_file != k:
              print(f"Warning: SVD file '{filename}' contains components for rank {loaded_k_from_file}, but {k} was requested. Using loaded rank.")
-             k = loaded_k_from_file
-
-        U_k = svd_components['U_k']
-        s_k = svd_components['s_k']
-        V_k_T = svd_components['V_k_T']
-        s_k_inv = svd_components['s_k_inv']
-        doc_svd_norms = svd_components['doc_svd_norms']
-        current_svd_k = k
 
-        print(f"Successfully loaded SVD components for k={k}.")
-        return True
+        svd_components = svd_store.from_legacy_components(legacy_components)
+        # Same check as for the store: the rows must be the loaded documents (e.g. not those before a live merge)
+        if not svd_store_matches_documents(svd_components):
+            print(f"Error: SVD file {filename} has {svd_components['doc_embeddings'].shape[0]} documents, "
+                  f"but {N_docs} documents are loaded. Recompute it with generate_svd_files.py.")
+            svd_components = None
+        else:
+            print(f"Successfully loaded SVD components for k={loaded_k_from_file}.")
 
     except FileNotFoundError:
         print(f"Error: SVD file not found for k={k} at {filename}.")
-        current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms = [None] * 6
-        return False
     except KeyError as e:
          print(f"Error: Missing component in SVD file for k={k} at {filename}. Key '{e}' not found.")
-         current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms = [None] * 6
-         return False
-    except Exception as e:
-        print(f"An error occurred loading SVD components for k={k}: {e}")
-        current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms = [None] * 6
-        return False
 
-def clean_text(text):
-    if not text:
-        return ""
-    
-    text = re.sub(r'&lt;.*?&gt;', '', text)
-    text = re.sub(r'<.*?>', '', text)
-    text = re.sub(r'\{\{.*?\}\}', '', text)
-    text = re.sub(r'\[\[.*?\]\]', '', text)
-    
-    text = re.sub(r'formula[_ ]?\d+', '', text)
-    text = re.sub(r'\(formula[^)]*\)', '', text)
-    
-    text = re.sub(r'oc\+sc', '', text)
-    text = re.sub(r'oc sc', '', text)
-    
-    text = re.sub(r'[^a-zA-Z\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    text = text.lower()
-    
-    tokens = text.split()
-    
-    stop_words = set(stopwords.words('english'))
-    tokens = [token for token in tokens 
-              if token not in stop_words 
-              and len(token) > 2
-              and not token.isdigit()]
-    
-    lemmatizer = WordNetLemmatizer()
-    tokens = [lemmatizer.lemmatize(token) for token in tokens]
-    
-    unwanted_words = {'see', 'also', 'references', 'history', 'value', 'term'}
-    tokens = [token for token in tokens if token not in unwanted_words]
-
-    print(f"Przetworzono tekst: {text[:30]}...")
-    
-    return ' '.join(tokens)
+    if svd_components is None:
+        legacy_svd_failed_loads[k] = attempt
+    return svd_components
+
+svd_cache = SVDCache(load_svd_components, SVD_CACHE_MAX_BYTES)
+ivf_cache = SVDCache(lambda k: ivf_index.load_ivf(SVD_OUTPUT_DIR, k), SVD_CACHE_MAX_BYTES)
+# Keyed by (method, k); int8 codes serve every rank and are cached under k=None
+quantized_cache = SVDCache(lambda key: quantization.load_quantized(SVD_OUTPUT_DIR, *key), SVD_CACHE_MAX_BYTES)
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES)
+db_pool = snippet_store.ConnectionPool(DATABASE)
+
+def install_index(index, index_snippets):
+    global dictionary, term_to_index, doc_ids, doc_titles, doc_links, snippets, A_normalized, postings, idf_vector, N_docs, M_terms, index_version
+
+    doc_ids = index['doc_ids']
+    doc_titles = index['titles']
+    doc_links = index['links']
+    snippets = index_snippets
+    A_normalized = index['A_normalized']
+    postings = index['postings']
+    idf_vector = index['idf_vector']
+    M_terms, N_docs = A_normalized.shape
+    if dictionary is None:
+        term_to_index = text_analyzer.build_term_index(index['dictionary'])
+        dictionary = index['dictionary']
+    index_version += 1
+
+def start_shards(index):
+    global shards
+    try:
+        shards = shard_search.ShardedIndex(INDEX_DIR, SVD_OUTPUT_DIR, SEARCH_SHARDS, doc_ids=index['doc_ids'])
+        # Queries are weighted with the IDF of the whole collection, which must agree with the shards' statistics
+        if not np.allclose(shards.idf_vector, index['idf_vector']):
+            shards.close()
+            raise shard_search.ShardError("IDF of the shard statistics differs from the index artifact.")
+    except (shard_search.ShardError, OSError, ValueError) as e:
+        print(f"Could not start search shards, searching in this process: {e}")
+        shards = None
+
+def stop_shards(error):
+    global shards
+    print(f"Stopping search shards, searching in this process: {error}")
+    failed, shards = shards, None
+    if failed is not None:
+        failed.close()
+
+def fold_in_merged_index(new_index, changed_doc_ids):
+    # Runs in the merge thread: the loaded SVD store is updated for the merged documents
+    # (replaced articles are folded in again from their new content),
+    # the shards load the merged index artifact next to the one they serve
+    shards_ready = False
+    if shards is not None:
+        try:
+            shards.load(INDEX_DIR, doc_ids=new_index['doc_ids'])
+            shards_ready = True
+        except shard_search.ShardError as e:
+            print(f"Search shards could not load the merged index: {e}")
+
+    store = get_svd_store()
+    if store is None:
+        return None, shards_ready
+    store = dict(store)
+    if store.get('fold_in') is not None:
+        store['fold_in'] = dict(store['fold_in'])
+    if svd_fold_in.fold_in_store(store, new_index, changed_doc_ids) is None:
+        return None, shards_ready
+    drift, folded_fraction, recompute = svd_fold_in.drift_report(store)
+    if recompute:
+        print(f"Folded documents: {folded_fraction:.1%}, drift {drift:+.4f}. Recompute the decomposition with generate_svd_files.py.")
+    return store, shards_ready
+
+def install_merged_index(new_index, new_snippets, prepared):
+    # Called by the live index while no request is running
+    global svd_components_store, svd_store_version, approximate_indexes_valid
+    store, shards_ready = prepared
+    install_index(new_index, new_snippets)
+    if shards is not None:
+        try:
+            if not shards_ready:
+                raise shard_search.ShardError("The merged index was not loaded.")
+            shards.activate()
+        except shard_search.ShardError as e:
+            stop_shards(e)
+    with svd_store_lock:
+        svd_components_store = store
+        svd_store_version = ('merged', index_version) if store is not None else None
+    svd_cache.clear()
+    ivf_cache.clear()
+    quantized_cache.clear()
+    approximate_indexes_valid = False
+
+def live_updates_refused():
+    """
+    Reason why live changes are refused, or None. Changes are held in the
+    memory of the process that accepted them, so they need a single server
+    process: other processes would not find the articles, and their merges
+    would overwrite each other's index artifacts.
+    """
+    if os.getpid() != data_pid:
+        return ("Live updates are not available in worker processes forked after loading (e.g. gunicorn --preload). "
+                "Run a single server process.")
+    servers = index_store.count_servers(INDEX_DIR)
+    if servers > 1:
+        return f"Live updates need a single server process, {servers} processes are serving '{INDEX_DIR}'."
+    return None
 
 def load_data():
 
-    global dictionary, documents_info, A_normalized, A_idf, idf_vector, N_docs, M_terms
-
-    if not os.path.exists(DATABASE):
-        print(f"Database file not found at {DATABASE}")
-        return False
+    global dictionary, term_to_index, doc_ids, doc_titles, doc_links, snippets, A_normalized, postings, idf_vector, N_docs, M_terms, live
+    global server_registration, data_pid
 
     if dictionary is not None:
          print("Base data already loaded.")
          return True
 
-    print("Loading base data from database...")
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT content FROM dictionary")
-        dict_row = cursor.fetchone()
-        if dict_row:
-            dictionary = dict_row[0].split()
-            M_terms = len(dictionary)
-            print(f"Loaded dictionary with {M_terms} terms.")
-        else:
-            print("Dictionary not found in database or is empty.")
-            dictionary = []
-            M_terms = 0
-            return False
-
-        cursor.execute(f"SELECT id, vector, link, title FROM {TABLE}")
-        articles_rows = cursor.fetchall()
-        N_docs = len(articles_rows)
-        print(f"Loaded {N_docs} articles info.")
-
-        if N_docs == 0:
-            print("No articles found in database.")
-            documents_info = []
-            A_idf = None
-            A_normalized = None
-            idf_vector = None
+        # Registered before loading: a live change accepted by another process after this
+        # point is refused there, one accepted before is already in the database loaded here
+        if server_registration is None:
+            server_registration = index_store.register_server(INDEX_DIR)
+            data_pid = os.getpid()
+        # Memory-mapped, so that worker processes of one server share a single copy
+        index = index_store.load_or_build_index(DATABASE, TABLE, INDEX_DIR)
+        if index is None:
             return False
 
-        documents_info = []
-        data = []
-        row_ind = []
-        col_ind = []
-
-        for doc_idx, row in enumerate(articles_rows):
-            doc_id, vector_str, link, title = row
-            documents_info.append({"doc_idx": doc_idx, "id": doc_id, "link": link, "title": title})
-
-            if vector_str:
-                pairs = vector_str.split()
-                for pair in pairs:
-                    if '=' in pair:
-                        try:
-                            term_idx_str, count_str = pair.split('=')
-                            term_idx = int(term_idx_str)
-                            count = int(count_str)
-                            if 0 <= term_idx < M_terms and count > 0:
-                                data.append(count)
-                                row_ind.append(term_idx)
-                                col_ind.append(doc_idx)
-                        except ValueError as e:
-                            print(f"Warning: Could not parse vector pair '{pair}' for doc_id {doc_id}: {e}")
-                        except Exception as e:
-                            print(f"Warning: Unexpected error parsing pair '{pair}' for doc_id {doc_id}: {e}")
-
-
-        if not data:
-            print("No valid vector data found in articles.")
-            A_tf = csc_matrix(([], ([], [])), shape=(M_terms, N_docs))
-        else:
-             A_tf = csc_matrix((data, (row_ind, col_ind)), shape=(M_terms, N_docs))
-
-        print(f"Built TF matrix: shape {A_tf.shape}, {A_tf.nnz} non-zero elements.")
-
-        term_doc_counts = (A_tf > 0).sum(axis=1).A.flatten()
-        idf_values = np.zeros(M_terms)
-        non_zero_term_counts_mask = term_doc_counts > 0
-        if N_docs > 0:
-             idf_values[non_zero_term_counts_mask] = np.log(N_docs / term_doc_counts[non_zero_term_counts_mask])
-        idf_vector = idf_values
-        print("Calculated IDF vector.")
-
-        if idf_vector is not None and idf_vector.shape[0] == M_terms:
-             A_idf = A_tf.multiply(idf_vector[:, None])
-             print("Applied IDF weighting (A_idf).")
-        else:
-             print("Warning: IDF vector is invalid. Cannot calculate A_idf.")
-             A_idf = None
-             return False
-
-        if A_idf is not None:
-            A_idf_col_norms = np.sqrt(A_idf.power(2).sum(axis=0)).A.flatten()
-            inv_norms_data = np.zeros_like(A_idf_col_norms)
-            non_zero_norms_mask = A_idf_col_norms > 1e-9
-            inv_norms_data[non_zero_norms_mask] = 1.0 / A_idf_col_norms[non_zero_norms_mask]
-            if N_docs > 0:
-                D_inv_norms = diags(inv_norms_data, offsets=0, shape=(N_docs, N_docs), format='csc')
-                A_normalized = A_idf @ D_inv_norms
-                print("Normalized document vectors (A_normalized).")
-            else:
-                print("Warning: No documents to normalize.")
-                A_normalized = None
-                return False
-        else:
-            print("Warning: A_idf is not available. Cannot calculate A_normalized.")
-            A_normalized = None
-            return False
+        install_index(index, snippet_store.load_snippets(INDEX_DIR, index['doc_ids'], DATABASE, TABLE))
+        if SEARCH_SHARDS > 0:
+            start_shards(index)
+        live = live_index.LiveIndex(index, snippets, term_to_index, DATABASE, TABLE, INDEX_DIR, index_lock,
+                                    prepare_merge=fold_in_merged_index, install_merge=install_merged_index,
+                                    check_writable=live_updates_refused)
+        print(f"Base data ready: {M_terms} terms, {N_docs} documents.")
+        # The collector no longer visits the loaded objects, so workers forked after
+        # loading (e.g. gunicorn --preload) do not copy their pages by touching them
+        gc.freeze()
 
         return True
 
-    except sqlite3.Error as e:
-        print(f"Database error during base data loading: {e}")
-        dictionary, documents_info, A_normalized, A_idf, idf_vector = [None] * 5
-        N_docs, M_terms = 0, 0
-        global current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms
-        current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms = [None] * 6
-        return False
     except Exception as e:
         print(f"An unexpected error occurred during base data loading: {e}")
-        dictionary, documents_info, A_normalized, A_idf, idf_vector = [None] * 5
+        dictionary, term_to_index, doc_ids, doc_titles, doc_links, snippets, A_normalized, postings, idf_vector, live = [None] * 10
         N_docs, M_terms = 0, 0
-        current_svd_k, U_k, s_k, V_k_T, s_k_inv, doc_svd_norms = [None] * 6
         return False
-    finally:
-        if conn:
-            conn.close()
-
-def process_query_to_tfidf(query):
-    if dictionary is None or idf_vector is None or M_terms == 0:
-        print("Warning: Dictionary or IDF vector not loaded. Cannot process query.")
-        return None
 
-    query_tokens = re.findall(r'\w+', query.lower())
-    if not query_tokens:
-        return None
+def result_cache_key(mode, query_tokens, **params):
+    # Terms outside the dictionary do not change the results
+    return query_key(mode, [token for token in query_tokens if token in (term_to_index or {})], **params)
 
+def query_term_weights(query_tokens):
     query_tf = {}
     for token in query_tokens:
-        try:
-            term_idx = dictionary.index(token)
+        term_idx = term_to_index.get(token)
+        if term_idx is not None:
             query_tf[term_idx] = query_tf.get(term_idx, 0) + 1
-        except ValueError:
-            pass
 
-    if not query_tf:
+    q_col_ind = np.fromiter(query_tf.keys(), dtype=np.int64, count=len(query_tf))
+    q_tf = np.fromiter(query_tf.values(), dtype=np.float64, count=len(query_tf))
+    q_data = q_tf * idf_vector[q_col_ind]
+    non_zero_mask = q_data != 0
+    return q_col_ind[non_zero_mask], q_data[non_zero_mask]
+
+def process_queries_to_tfidf(queries_tokens):
+    if term_to_index is None or idf_vector is None or M_terms == 0:
+        print("Warning: Dictionary or IDF vector not loaded. Cannot process query.")
         return None
 
-    q_data = list(query_tf.values())
-    q_col_ind = list(query_tf.keys())
-    q_row_ind = [0] * len(q_data)
-    q_tf_sparse = csr_matrix((q_data, (q_row_ind, q_col_ind)), shape=(1, M_terms))
+    q_indptr = [0]
+    q_indices = []
+    q_data = []
+    for query_tokens in queries_tokens:
+        term_ids, weights = query_term_weights(query_tokens or [])
+        q_indices.append(term_ids)
+        q_data.append(weights)
+        q_indptr.append(q_indptr[-1] + len(term_ids))
+
+    return csr_matrix(
+        (np.concatenate(q_data), np.concatenate(q_indices), np.array(q_indptr)),
+        shape=(len(q_indptr) - 1, M_terms)
+    )
+
+def process_query_to_tfidf(query_tokens):
+    if not query_tokens:
+        return None
 
-    idf_vector_row = idf_vector.reshape(1, -1)
-    q_idf_sparse = q_tf_sparse.multiply(idf_vector_row)
+    q_idf_sparse = process_queries_to_tfidf([query_tokens])
+    if q_idf_sparse is None or q_idf_sparse.nnz == 0:
+        return None
 
     return q_idf_sparse
 
-
-def fetch_content_snippets(top_results_basic_info, snippet_length=50):
-    final_results = []
-    if not top_results_basic_info:
-        return final_results
-
-    conn = None
+def svd_query_vectors(q_idf_sparse, svd_components):
+    # Weighted sum of the term table rows of the query terms
+    term_ids = np.unique(q_idf_sparse.indices)
+    q_svd = q_idf_sparse[:, term_ids] @ svd_components['term_embeddings'][term_ids]
+
+    q_svd_norms = np.linalg.norm(q_svd, axis=1)
+    q_inv_norms = np.zeros_like(q_svd_norms)
+    q_inv_norms[q_svd_norms > 1e-9] = 1.0 / q_svd_norms[q_svd_norms > 1e-9]
+    return (q_svd * q_inv_norms[:, None]).astype(np.float32)
+
+def svd_scores(q_idf_sparse, svd_components):
+    q_unit = svd_query_vectors(q_idf_sparse, svd_components)
+
+    # One GEMV (GEMM for batches) over the row-major embeddings; document norms are precomputed
+    scores = (svd_components['doc_embeddings'] @ q_unit.T).T
+    scores *= svd_components['doc_inv_norms']
+    return scores
+
+
+def fetch_summaries(doc_indices, snippet_length=50):
+    """
+    Returns {document index: summary}, from the snippet file when it covers
+    snippet_length, otherwise from the database.
+    """
+    doc_indices = list(doc_indices)
+    live_summaries = {doc_idx: live.summary(doc_idx, snippet_length) for doc_idx in doc_indices if doc_idx >= N_docs}
+    doc_indices = [doc_idx for doc_idx in doc_indices if doc_idx < N_docs]
+    if not doc_indices:
+        return live_summaries
+    if snippets is not None and snippet_length <= snippets['max_length']:
+        return {**snippet_store.snippets_from_file(snippets, doc_indices, snippet_length), **live_summaries}
+
+    db_id_to_idx = dict(zip(doc_ids[doc_indices].tolist(), doc_indices))
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
-        for item in top_results_basic_info:
-            doc_db_id = item["id"]
-
-            cursor.execute("SELECT content FROM articles_180k WHERE id = ?", (doc_db_id,))
-            content_row = cursor.fetchone()
-            content_text = content_row[0] if content_row and content_row[0] else ""
-
-            summary = content_text[:snippet_length]
-            if len(content_text) > snippet_length:
-                summary += "..."
-
-            final_results.append({
-                "title": item["title"],
-                "link": item["link"],
-                "summary": summary
-            })
-
+        summaries = snippet_store.fetch_snippets_from_db(db_pool, TABLE, db_id_to_idx, snippet_length)
     except sqlite3.Error as e:
         print(f"Database error while fetching content for top results: {e}")
+        return live_summaries
     except Exception as e:
         print(f"An unexpected error occurred while fetching content: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return live_summaries
+    return {**{db_id_to_idx[doc_db_id]: summary for doc_db_id, summary in summaries.items()}, **live_summaries}
+
+def get_pagination_params(data):
+    limit = data.get('limit', DEFAULT_RESULTS_LIMIT)
+    offset = data.get('offset', 0)
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= MAX_RESULTS_LIMIT:
+        return None, None, f"Invalid 'limit' parameter. Must be an integer between 1 and {MAX_RESULTS_LIMIT}."
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        return None, None, "Invalid 'offset' parameter. Must be a non-negative integer."
+    return limit, offset, None
+
+def fetch_documents(doc_indices):
+    """
+    Returns {document index: (link, title)}; titles and links of the loaded
+    index are gathered from their columns for these documents only.
+    """
+    documents = {doc_idx: live.document(doc_idx) for doc_idx in doc_indices if doc_idx >= N_docs}
+    main_indices = np.array(sorted(doc_idx for doc_idx in doc_indices if doc_idx < N_docs), dtype=np.int64)
+    links = document_store.gather(doc_links, main_indices)
+    titles = document_store.gather(doc_titles, main_indices)
+    documents.update(zip(main_indices.tolist(), zip(links, titles)))
+    return documents
+
+def build_results_batch(ranked_lists, snippet_length):
+    doc_indices = {doc_idx for top_indices, _ in ranked_lists for doc_idx in top_indices.tolist()}
+    summaries = fetch_summaries(doc_indices, snippet_length=snippet_length)
+    documents = fetch_documents(doc_indices)
+
+    batch_results = []
+    for top_indices, top_scores in ranked_lists:
+        final_results = []
+        for doc_idx, score in zip(top_indices.tolist(), top_scores.tolist()):
+            link, title = documents[doc_idx]
+            final_results.append({
+                "title": title,
+                "link": link,
+                "summary": summaries.get(doc_idx, ""),
+                "score": score
+            })
+        batch_results.append(final_results)
+
+    return batch_results
+
+def build_results(top_indices, top_scores, snippet_length):
+    return build_results_batch([(top_indices, top_scores)], snippet_length)[0]
+
+def live_ranking(search_main, delta_scores, limit, offset, threshold):
+    """
+    search_main(limit, offset) ranks the loaded index. With live changes,
+    deleted documents are filtered out (enough extra candidates are taken to
+    make up for them) and delta_scores() of the added documents are merged in.
+    """
+    if live is None or not live.has_changes():
+        return search_main(limit, offset)
+    main_indices, main_scores = search_main(offset + limit + live.n_tombstones, 0)
+    return live_index.rank_live(main_indices, main_scores, live.tombstones, delta_scores(), N_docs, limit, offset, threshold)
+
+def main_ranks_needed(limit, offset):
+    # Ranks of the loaded index that live_ranking can ask for
+    if live is None or not live.has_changes():
+        return offset + limit
+    return offset + limit + live.n_tombstones
+
+def ranking_prefix(ranking):
+    # search_main for live_ranking over precomputed ranks [0, needed) of the loaded index
+    doc_indices, doc_scores = ranking
+    return lambda k, start: (doc_indices[start:start + k], doc_scores[start:start + k])
+
+def sharded_linear_rankings(queries, needed):
+    # Rankings from the search shards, or None when they are not running
+    if shards is None:
+        return None
+    try:
+        return shards.linear_search(queries, needed, threshold=1e-9)
+    except shard_search.ShardError as e:
+        stop_shards(e)
+        return None
 
-    return final_results
+def sharded_svd_rankings(q_units, k, needed):
+    # None also when the shards do not serve the loaded SVD store (e.g. folded in memory by a merge)
+    if shards is None:
+        return None
+    try:
+        return shards.svd_search(q_units, k, needed, threshold=1e-6, store_version=svd_store_version)
+    except shard_search.ShardError as e:
+        stop_shards(e)
+        return None
 
 
 @app.route('/linear_search', methods=['POST'])
+@reads_index
 def linear_search():
     if A_normalized is None:
         success = load_data()
@@ -326,115 +503,348 @@ def linear_search():
              return jsonify({"error": "Search data is empty (no dictionary or articles found)."}), 500
 
     data = request.get_json()
-    query = clean_text(data.get('query', ''))
-    print(f"Received linear search query: '{query}'")
+    limit, offset, error = get_pagination_params(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    query_tokens = text_analyzer.analyze(data.get('query', ''))
 
-    q_idf_sparse = process_query_to_tfidf(query)
+    cache_key = result_cache_key('linear', query_tokens, limit=limit, offset=offset)
+    version = data_version('linear')
+    cached_results = result_cache.get(cache_key, version)
+    if cached_results is not None:
+        return jsonify(cached_results)
+
+    q_idf_sparse = process_query_to_tfidf(query_tokens)
     if q_idf_sparse is None:
         print("Query processing failed or yielded no dictionary terms.")
         return jsonify([])
 
     q_idf_norm = np.linalg.norm(q_idf_sparse.data)
-    if q_idf_norm > 1e-9:
-        q_normalized = q_idf_sparse / q_idf_norm
-    else:
+    if q_idf_norm <= 1e-9:
         print("Normalized query vector has zero norm.")
         return jsonify([])
 
-    scores = q_normalized @ A_normalized
-    scores_arr = scores.A.flatten()
-
-    sorted_indices = np.argsort(scores_arr)[::-1]
-
-    potential_results_basic_info = []
-    for doc_idx in sorted_indices:
-        score = scores_arr[doc_idx]
-        if score > 1e-9:
-             doc_info = documents_info[doc_idx]
-             potential_results_basic_info.append({
-                 "doc_idx": doc_idx,
-                 "id": doc_info["id"],
-                 "title": doc_info.get("title", "No Title"),
-                 "link": doc_info.get("link", "#"),
-             })
+    if query_batcher is not None:
+        final_results = query_batcher.submit(('linear',), (query_tokens, limit, offset))
+    else:
+        q_weights = q_idf_sparse.data / q_idf_norm
+        rankings = sharded_linear_rankings([(q_idf_sparse.indices, q_weights)], main_ranks_needed(limit, offset))
+        if rankings is not None:
+            search_main = ranking_prefix(rankings[0])
         else:
-             break
-
-
-    top_5_results_basic_info = potential_results_basic_info[:10]
-    final_results = fetch_content_snippets(top_5_results_basic_info, snippet_length=100)
+            search_main = lambda k, start: inverted_index.search(postings, q_idf_sparse.indices, q_weights, k, offset=start, threshold=1e-9)
+        top_indices, top_scores = live_ranking(
+            search_main, lambda: live.delta.linear_scores(q_idf_sparse / q_idf_norm)[0], limit, offset, threshold=1e-9
+        )
+        final_results = build_results(top_indices, top_scores, snippet_length=100)
+    result_cache.put(cache_key, version, final_results)
 
     print(f"Returning {len(final_results)} top results with snippets for linear search.")
     return jsonify(final_results)
 
 @app.route('/svd_search', methods=['POST'])
+@reads_index
 def svd_search():
 
     data = request.get_json()
-    raw_query = data.get('query', '')
-    query = clean_text(raw_query)
+    limit, offset, error = get_pagination_params(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    query_tokens = text_analyzer.analyze(data.get('query', ''))
 
-    if not query:
-         print("Cleaned query is empty.")
+    if not query_tokens:
          return jsonify([])
 
-    q_idf_sparse = process_query_to_tfidf(query)
+    requested_k = data.get('k', DEFAULT_SVD_RANK)
+    error = check_svd_rank(requested_k)
+    if error:
+        return jsonify({"error": error}), 400
+
+    nprobe = data.get('nprobe')
+    if nprobe is not None and (not isinstance(nprobe, int) or isinstance(nprobe, bool) or nprobe <= 0):
+        return jsonify({"error": "Invalid 'nprobe' parameter. Must be a positive integer."}), 400
+
+    quantization_method = data.get('quantization')
+    if quantization_method not in (None, 'int8', 'pq'):
+        return jsonify({"error": "Invalid 'quantization' parameter. Must be 'int8' or 'pq'."}), 400
+    if quantization_method is not None and nprobe is not None:
+        return jsonify({"error": "Parameters 'quantization' and 'nprobe' can not be combined."}), 400
+    if (quantization_method is not None or nprobe is not None) and not approximate_indexes_valid:
+        return jsonify({"error": "IVF lists and quantized codes describe the documents before the last live merge. "
+                                 "Rebuild them after 'python svd_fold_in.py'."}), 400
+
+    cache_key = result_cache_key('svd', query_tokens, k=requested_k, nprobe=nprobe, quantization=quantization_method,
+                                 limit=limit, offset=offset)
+    version = data_version('svd')
+    cached_results = result_cache.get(cache_key, version)
+    if cached_results is not None:
+        return jsonify(cached_results)
+
+    q_idf_sparse = process_query_to_tfidf(query_tokens)
     if q_idf_sparse is None or q_idf_sparse.nnz == 0: # Dodano sprawdzenie nnz > 0
         print("Query processing failed or yielded no dictionary terms.")
         return jsonify([])
 
+    with svd_cache.use(requested_k) as svd_components:
+        if svd_components is None:
+            return jsonify({"error": f"SVD components for k={requested_k} could not be loaded."}), 500
+
+        delta_key = (svd_store_version, requested_k)
+        delta_scores = lambda: live.delta.svd_scores(delta_key, svd_components, svd_query_vectors(q_idf_sparse, svd_components))[0]
+        final_results = None
+        if nprobe is None and quantization_method is None and query_batcher is not None:
+            final_results = query_batcher.submit(('svd', requested_k), (query_tokens, limit, offset))
+        elif nprobe is None and quantization_method is None:
+            rankings = sharded_svd_rankings(svd_query_vectors(q_idf_sparse, svd_components), requested_k,
+                                            main_ranks_needed(limit, offset))
+            if rankings is not None:
+                search_main = ranking_prefix(rankings[0])
+            else:
+                scores_arr = svd_scores(q_idf_sparse, svd_components)[0]
+                search_main = lambda k, start: topk.top_k(scores_arr, k, offset=start, threshold=1e-6)
+            top_indices, top_scores = live_ranking(search_main, delta_scores, limit, offset, threshold=1e-6)
+        elif quantization_method is not None:
+            # Compressed scan, then exact re-ranking of the shortlist
+            quantized_key = (quantization_method, requested_k if quantization_method == 'pq' else None)
+            with quantized_cache.use(quantized_key) as quantized:
+                if quantized is None:
+                    return jsonify({"error": f"No {quantization_method} codes for k={requested_k}. Build them with 'python quantization.py {requested_k}'."}), 400
+                q_unit = svd_query_vectors(q_idf_sparse, svd_components)[0]
+                top_indices, top_scores = live_ranking(
+                    lambda k, start: quantization.search(quantized, svd_components, q_unit, k, offset=start, threshold=1e-6),
+                    delta_scores, limit, offset, threshold=1e-6
+                )
+        else:
+            # Approximate search: only the nprobe closest IVF lists are scanned
+            with ivf_cache.use(requested_k) as ivf:
+                if ivf is None:
+                    return jsonify({"error": f"No IVF index for k={requested_k}. Build it with 'python ivf_index.py {requested_k}'."}), 400
+                q_unit = svd_query_vectors(q_idf_sparse, svd_components)[0]
+                top_indices, top_scores = live_ranking(
+                    lambda k, start: ivf_index.search(ivf, q_unit, k, offset=start, nprobe=nprobe, threshold=1e-6)[:2],
+                    delta_scores, limit, offset, threshold=1e-6
+                )
+
+    if final_results is None:
+        final_results = build_results(top_indices, top_scores, snippet_length=200)
+    result_cache.put(cache_key, version, final_results)
+
+    print(f"Returning {len(final_results)} top results with snippets for SVD search (k={requested_k}).")
+    return jsonify(final_results)
+
+def batch_linear_rankings(Q_idf, limit, offset):
+    ranked_lists = []
+    for start in range(0, Q_idf.shape[0], BATCH_SCORING_CHUNK):
+        Q_chunk = Q_idf[start:start + BATCH_SCORING_CHUNK]
+        q_norms = np.sqrt(np.asarray(Q_chunk.multiply(Q_chunk).sum(axis=1)).ravel())
+        q_inv_norms = np.zeros_like(q_norms)
+        q_inv_norms[q_norms > 1e-9] = 1.0 / q_norms[q_norms > 1e-9]
+        Q_unit = csr_matrix(diags(q_inv_norms) @ Q_chunk)
+        delta_scores = live.delta.linear_scores(Q_unit) if live is not None and live.has_changes() else None
+        rankings = sharded_linear_rankings(
+            [(Q_unit.indices[Q_unit.indptr[row]:Q_unit.indptr[row + 1]], Q_unit.data[Q_unit.indptr[row]:Q_unit.indptr[row + 1]])
+             for row in range(Q_unit.shape[0])], main_ranks_needed(limit, offset))
+        if rankings is not None:
+            ranked_lists.extend(live_ranking(ranking_prefix(ranking), lambda row=row: delta_scores[row], limit, offset, threshold=1e-9)
+                                for row, ranking in enumerate(rankings))
+            continue
+
+        scores = csr_matrix(Q_unit @ A_normalized)
+        for row in range(scores.shape[0]):
+            row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+            row_indices, row_scores = scores.indices[row_start:row_end], scores.data[row_start:row_end]
+
+            def search_row(k, start, row_indices=row_indices, row_scores=row_scores):
+                row_positions, top_scores = topk.top_k(row_scores, k, offset=start, threshold=1e-9)
+                return row_indices[row_positions], top_scores
+            ranked_lists.append(live_ranking(search_row, lambda row=row: delta_scores[row], limit, offset, threshold=1e-9))
+    return ranked_lists
+
+def batch_svd_rankings(Q_idf, svd_components, delta_key, limit, offset):
+    ranked_lists = []
+    for start in range(0, Q_idf.shape[0], BATCH_SCORING_CHUNK):
+        Q_chunk = Q_idf[start:start + BATCH_SCORING_CHUNK]
+        delta_scores = None
+        if live is not None and live.has_changes():
+            delta_scores = live.delta.svd_scores(delta_key, svd_components, svd_query_vectors(Q_chunk, svd_components))
+        rankings = sharded_svd_rankings(svd_query_vectors(Q_chunk, svd_components), delta_key[1], main_ranks_needed(limit, offset))
+        if rankings is not None:
+            ranked_lists.extend(live_ranking(ranking_prefix(ranking), lambda row=row: delta_scores[row], limit, offset, threshold=1e-6)
+                                for row, ranking in enumerate(rankings))
+            continue
+
+        scores = svd_scores(Q_chunk, svd_components)
+        for row in range(scores.shape[0]):
+            ranked_lists.append(live_ranking(
+                lambda k, start, row_scores=scores[row]: topk.top_k(row_scores, k, offset=start, threshold=1e-6),
+                lambda row=row: delta_scores[row], limit, offset, threshold=1e-6
+            ))
+    return ranked_lists
+
+def score_query_batch(group, queries):
+    # Runs in a thread of the query batcher; the requests that submitted the queries hold the index read lock
+    Q_idf = process_queries_to_tfidf([query_tokens for query_tokens, _, _ in queries])
+    needed = max(offset + limit for _, limit, offset in queries)
+    if group[0] == 'linear':
+        ranked_lists = batch_linear_rankings(Q_idf, needed, 0)
+    else:
+        requested_k = group[1]
+        with svd_cache.use(requested_k) as svd_components:
+            if svd_components is None:
+                raise RuntimeError(f"SVD components for k={requested_k} could not be loaded.")
+            ranked_lists = batch_svd_rankings(Q_idf, svd_components, (svd_store_version, requested_k), needed, 0)
+
+    # Rankings are deterministic, so a page is a slice of the first `needed` ranks
+    ranked_lists = [(doc_indices[offset:offset + limit], doc_scores[offset:offset + limit])
+                    for (doc_indices, doc_scores), (_, limit, offset) in zip(ranked_lists, queries)]
+    return build_results_batch(ranked_lists, 100 if group[0] == 'linear' else 200)
+
+query_batcher = None
+if QUERY_BATCH_WINDOW_MS > 0:
+    query_batcher = QueryBatcher(score_query_batch, window=QUERY_BATCH_WINDOW_MS / 1000, max_batch_size=QUERY_BATCH_MAX_SIZE)
+
+@app.route('/batch_search', methods=['POST'])
+@reads_index
+def batch_search():
+    if A_normalized is None and not load_data():
+        return jsonify({"error": "Search data not available. Failed to load from database."}), 500
+
+    data = request.get_json()
+    limit, offset, error = get_pagination_params(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({"error": "Invalid 'queries' parameter. Must be a list of strings."}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"Too many queries. At most {MAX_BATCH_QUERIES} per request."}), 400
+
+    mode = data.get('mode', 'linear')
+    if mode not in ('linear', 'svd'):
+        return jsonify({"error": "Invalid 'mode' parameter. Must be 'linear' or 'svd'."}), 400
+
+    if mode == 'svd':
+        requested_k = data.get('k', DEFAULT_SVD_RANK)
+        error = check_svd_rank(requested_k)
+        if error:
+            return jsonify({"error": error}), 400
+
+    if not queries:
+        return jsonify([])
+
+    Q_idf = process_queries_to_tfidf([text_analyzer.analyze(query) for query in queries])
+    if Q_idf is None:
+        return jsonify({"error": "Search data not available."}), 500
+
+    if mode == 'linear':
+        ranked_lists = batch_linear_rankings(Q_idf, limit, offset)
+    else:
+        with svd_cache.use(requested_k) as svd_components:
+            if svd_components is None:
+                return jsonify({"error": f"SVD components for k={requested_k} could not be loaded."}), 500
+            ranked_lists = batch_svd_rankings(Q_idf, svd_components, (svd_store_version, requested_k), limit, offset)
+
+    snippet_length = 100 if mode == 'linear' else 200
+    batch_results = build_results_batch(ranked_lists, snippet_length)
+
+    print(f"Returning results for {len(batch_results)} queries for batch {mode} search.")
+    return jsonify(batch_results)
+
+@app.route('/nearest_terms', methods=['POST'])
+@reads_index
+def nearest_terms():
+    # Diagnostics: dictionary terms closest to the query terms in the LSI space
+    data = request.get_json()
+    limit, _, error = get_pagination_params(data)
+    if error:
+        return jsonify({"error": error}), 400
+
     requested_k = data.get('k', DEFAULT_SVD_RANK)
+    error = check_svd_rank(requested_k)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if not isinstance(requested_k, int) or requested_k <= 0:
-        print(f"Invalid k value received: {requested_k}")
-        return jsonify({"error": "Invalid 'k' parameter. Must be a positive integer."}), 400
-
-    success_svd_load = load_svd_components(requested_k)
-    if not success_svd_load:
-        return jsonify({"error": f"SVD components for k={requested_k} could not be loaded."}), 500
-
-    print(f"Received SVD search query: '{query}' (SVD Rank: {current_svd_k})")
-
-    q_svd_proj_unscaled = q_idf_sparse @ U_k
-    q_svd = q_svd_proj_unscaled * s_k_inv
-    dot_products = q_svd @ V_k_T
-    q_svd_norm = np.linalg.norm(q_svd)
-
-    scores_arr = np.zeros(N_docs)
-    denominator = q_svd_norm * doc_svd_norms
-    non_zero_denominator_mask = denominator > 1e-9
-    scores_arr[non_zero_denominator_mask] = dot_products.flatten()[non_zero_denominator_mask] / denominator[non_zero_denominator_mask]
-
-    sorted_indices = np.argsort(scores_arr)[::-1]
-
-    potential_results_basic_info = []
-    for doc_idx in sorted_indices:
-        score = scores_arr[doc_idx]
-        if score > 1e-6:
-             doc_info = documents_info[doc_idx]
-             potential_results_basic_info.append({
-                 "doc_idx": doc_idx,
-                 "id": doc_info["id"],
-                 "title": doc_info.get("title", "No Title"),
-                 "link": doc_info.get("link", "#"),
-             })
-        else:
-            break
+    term_ids, weights = query_term_weights(text_analyzer.analyze(data.get('query', '')))
+    if term_ids.size == 0:
+        return jsonify([])
 
-    top_results_basic_info = potential_results_basic_info[:10] # Używamy top_n
-    final_results = fetch_content_snippets(top_results_basic_info, snippet_length=200)
+    with svd_cache.use(requested_k) as svd_components:
+        if svd_components is None:
+            return jsonify({"error": f"SVD components for k={requested_k} could not be loaded."}), 500
+        top_term_ids, top_scores = svd_store.nearest_terms(svd_components, term_ids, weights, limit)
 
-    print(f"Returning {len(final_results)} top results with snippets for SVD search (k={current_svd_k}).") # Zmieniono komunikat
-    return jsonify(final_results)
+    return jsonify([{"term": dictionary[term_id], "score": score}
+                    for term_id, score in zip(top_term_ids.tolist(), top_scores.tolist())])
+
+@app.route('/documents', methods=['POST'])
+def add_document():
+    if live is None and not load_data():
+        return jsonify({"error": "Search data not available. Failed to load from database."}), 500
+
+    data = request.get_json()
+    fields = {name: data.get(name) for name in ('title', 'link', 'content')}
+    if not all(isinstance(value, str) for value in fields.values()):
+        return jsonify({"error": "Parameters 'title', 'link' and 'content' must be strings."}), 400
+    doc_id = data.get('id')
+    if doc_id is not None and (not isinstance(doc_id, int) or isinstance(doc_id, bool) or doc_id <= 0):
+        return jsonify({"error": "Invalid 'id' parameter. Must be a positive integer."}), 400
+
+    try:
+        doc_id = live.add_document(fields['title'], fields['link'], fields['content'], doc_id=doc_id)
+    except live_index.LiveUpdateError as e:
+        return jsonify({"error": str(e)}), 409
+    except sqlite3.Error as e:
+        print(f"Database error while adding an article: {e}")
+        return jsonify({"error": "The article could not be stored."}), 500
+    return jsonify({"id": doc_id}), 201
+
+@app.route('/documents/<int:doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    if live is None and not load_data():
+        return jsonify({"error": "Search data not available. Failed to load from database."}), 500
+    try:
+        deleted = live.delete_document(doc_id)
+    except live_index.LiveUpdateError as e:
+        return jsonify({"error": str(e)}), 409
+    except sqlite3.Error as e:
+        print(f"Database error while deleting an article: {e}")
+        return jsonify({"error": "The article could not be deleted."}), 500
+    if not deleted:
+        return jsonify({"error": f"No article with id {doc_id}."}), 404
+    return jsonify({"id": doc_id})
+
+@app.route('/merge', methods=['POST'])
+def merge():
+    # Merges are started automatically once the delta is large enough; this starts one now
+    if live is None:
+        return jsonify({"error": "Search data not available."}), 500
+    reason = live_updates_refused()
+    if reason is not None:
+        return jsonify({"error": reason}), 409
+    live.request_merge()
+    return jsonify(live.stats()), 202
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "result_cache": result_cache.stats(),
+        "svd_cache": svd_cache.stats(),
+        "live_index": live.stats() if live is not None else None,
+        "shards": shards.stats() if shards is not None else None,
+        "query_batcher": query_batcher.stats() if query_batcher is not None else None,
+    })
 
 load_data()
 
 if __name__ == '__main__':
-    if A_idf is None and (os.path.exists(DATABASE) and (M_terms > 0 or N_docs > 0)):
+    if A_normalized is None and (os.path.exists(DATABASE) and (M_terms > 0 or N_docs > 0)):
          print("Application starting, but data loading had issues. Search may not function.")
-    elif A_idf is None and not os.path.exists(DATABASE):
+    elif A_normalized is None and not os.path.exists(DATABASE):
          print(f"Application starting, but database file '{DATABASE}' not found. Search will not function.")
-    elif A_idf is None:
+    elif A_normalized is None:
          print("Application starting, but no data is available for search. Check database.")
     else:
          print("Application starting. Data and SVD components loaded successfully.")
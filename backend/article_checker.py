@@ -1,5 +1,6 @@
 import sqlite3
 import sys
+import term_vectors
 
 def decode_article(article_id):
     conn = sqlite3.connect('database.db')
@@ -23,18 +24,21 @@ def decode_article(article_id):
         print(f"Artykuł o ID {article_id} nie ma wektora lub nie istnieje!")
         return
     
-    vector_str = vector_row[0]
-    counts = vector_str.split()
+    # Wspólny odczyt wektora (format binarny lub starszy tekstowy "indeks=liczba")
+    try:
+        term_ids, counts = term_vectors.decode(vector_row[0])
+    except ValueError as e:
+        print(f"Nieprawidłowy wektor artykułu o ID {article_id}: {e}")
+        return
     
     print(f"\nAnaliza artykułu ID: {article_id}")
     print("=" * 30)
     
     # Wyświetlanie statystyk
     found_words = False
-    for word, count in zip(dictionary_words, counts):
-        count = int(count)
-        if count > 0:
-            print(f"{word}: {count}")
+    for term_idx, count in zip(term_ids.tolist(), counts.tolist()):
+        if count > 0 and term_idx < len(dictionary_words):
+            print(f"{dictionary_words[term_idx]}: {count}")
             found_words = True
     
     if not found_words:
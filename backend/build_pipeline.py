@@ -0,0 +1,483 @@
+import argparse
+import csv
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+import numpy as np
+from scipy.sparse import csc_matrix, load_npz, save_npz
+import document_store
+import generate_svd_files
+import index_store
+import snippet_store
+import svd_store
+import term_vectors
+from text_analyzer import clean_text
+
+# One build command for the whole search data set, replacing the chain
+# import.py -> parse_content.py -> create_bag_of_words.py -> filter_bag_of_words.py
+# -> calculate_articles_vectors.py -> index_store.py -> snippet_store.py -> generate_svd_files.py.
+# The dump is read once: every WikiExtractor file is analyzed into a compressed
+# segment (titles, links, content and term counts over a per-file vocabulary),
+# the dictionary and the TF matrix are assembled from the segments, and SQLite
+# is written once at the end instead of being rewritten by every step.
+# Each stage records a key of its inputs in the build manifest and is skipped
+# when the key is unchanged; dump files that did not change are not re-analyzed.
+
+# --- Configuration ---
+dump_import = importlib.import_module('import') # import.py (the module name is a keyword)
+
+INPUT_DIR = dump_import.INPUT_DIR
+DATABASE = 'database.db'
+TABLE = 'articles_180k'
+BUILD_DIR = 'build' # Intermediates: segments, dictionary, TF matrix, manifest
+INDEX_DIR = index_store.INDEX_DIR
+SVD_OUTPUT_DIR = generate_svd_files.SVD_OUTPUT_DIR
+COMMON_WORDS_FILE = 'unigram_freq.csv' # Dictionary filter (see filter_bag_of_words.py)
+COMMON_WORDS_TOP = 300000
+MIN_WORDS = 0 # Articles with fewer analyzed words are left out (see delete_wrong_articles.py)
+WORKERS = os.cpu_count() or 1
+INSERT_BATCH_SIZE = dump_import.INSERT_BATCH_SIZE
+
+# Bump whenever the segment layout changes; older segments are re-analyzed.
+SEGMENT_FORMAT_VERSION = 1
+
+STAGES = ['analyze', 'dictionary', 'matrix', 'database', 'index', 'snippets', 'svd']
+MANIFEST_FILE = 'build_manifest.json'
+SEGMENTS_DIR = 'segments'
+DICTIONARY_FILE = 'dictionary.txt'
+MATRIX_FILE = 'tf_matrix.npz'
+KEPT_DOCS_FILE = 'kept_docs.npy'
+
+# --- Keys and manifest ---
+def stage_key(*inputs):
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+def file_fingerprint(path):
+    if path is None or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def analyzer_fingerprint():
+    """
+    Segments depend on the text analysis, so a change of text_analyzer.py re-analyzes the dump.
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_analyzer.py'), 'rb') as f:
+        return {'text_analyzer': hashlib.sha1(f.read()).hexdigest(), 'segment_format': SEGMENT_FORMAT_VERSION}
+
+def read_build_manifest(build_dir):
+    path = os.path.join(build_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read build manifest, building from scratch: {e}")
+    return {'segments': {}, 'stages': {}}
+
+def write_build_manifest(build_dir, manifest):
+    manifest_bytes = json.dumps(manifest, indent=2).encode('utf-8')
+    index_store._replace_file(os.path.join(build_dir, MANIFEST_FILE), lambda f: f.write(manifest_bytes))
+
+def record_stage(build_dir, manifest, stage, key, **details):
+    manifest['stages'][stage] = dict(details, key=key, built_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    write_build_manifest(build_dir, manifest)
+
+# --- Segments ---
+def analyze_file(task):
+    """
+    Worker: decodes one dump file and writes its segment.
+    Returns (dump path, number of articles, digest of the segment contents).
+    """
+    dump_path, segment_path = task
+    _, rows = dump_import.process_file(dump_path)
+
+    vocabulary = {}
+    doc_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    n_tokens = np.zeros(len(rows), dtype=np.int64)
+    term_parts = []
+    count_parts = []
+    for doc_idx, (_, _, _, content, _) in enumerate(rows):
+        word_counts = Counter(clean_text(content).split())
+        term_parts.append(np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in word_counts),
+                                      dtype=np.uint32, count=len(word_counts)))
+        count_parts.append(np.fromiter(word_counts.values(), dtype=np.uint32, count=len(word_counts)))
+        doc_indptr[doc_idx + 1] = doc_indptr[doc_idx] + len(word_counts)
+        n_tokens[doc_idx] = sum(word_counts.values())
+
+    arrays = {
+        'doc_indptr': doc_indptr,
+        'terms': np.concatenate(term_parts) if term_parts else np.empty(0, dtype=np.uint32),
+        'counts': np.concatenate(count_parts) if count_parts else np.empty(0, dtype=np.uint32),
+        'n_tokens': n_tokens,
+    }
+    for name, strings in (('vocabulary', list(vocabulary)), ('links', [row[1] for row in rows]),
+                          ('titles', [row[2] for row in rows]), ('contents', [row[3] for row in rows])):
+        arrays[f'{name}_bytes'], arrays[f'{name}_offsets'] = document_store.pack_strings(strings)
+    index_store._replace_file(segment_path, lambda f: np.savez_compressed(f, **arrays))
+
+    # Later stages depend on the digest, so a dump file that was touched but not changed rebuilds nothing else
+    digest = hashlib.sha1()
+    for name in sorted(arrays):
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return dump_path, len(rows), digest.hexdigest()
+
+def read_strings(segment, name):
+    return document_store.unpack_strings(segment[f'{name}_bytes'], segment[f'{name}_offsets'])
+
+def kept_segment_rows(segments, kept_docs, names):
+    """
+    Yields, segment by segment, the kept documents' (position in the build, values of names...).
+    Only one segment is held in memory at a time.
+    """
+    doc_offset = 0
+    for segment_path in segments:
+        with np.load(segment_path) as segment:
+            n_docs = segment['n_tokens'].size
+            lo, hi = np.searchsorted(kept_docs, [doc_offset, doc_offset + n_docs])
+            columns = [read_strings(segment, name) for name in names]
+            for position in range(lo, hi):
+                local_idx = kept_docs[position] - doc_offset
+                yield (position,) + tuple(column[local_idx] for column in columns)
+        doc_offset += n_docs
+
+# --- Stages ---
+def analyze_dump(input_dir, build_dir, manifest, workers, force=False):
+    """
+    Stage 'analyze': one segment per dump file. Returns the ordered segment paths and their digests.
+    """
+    segments_dir = os.path.join(build_dir, SEGMENTS_DIR)
+    os.makedirs(segments_dir, exist_ok=True)
+    analyzer = analyzer_fingerprint()
+
+    previous = manifest['segments']
+    current = {}
+    tasks = []
+    for dump_path in dump_import.find_files(input_dir):
+        relpath = os.path.relpath(dump_path, input_dir)
+        segment_path = os.path.join(segments_dir, relpath.replace(os.sep, '_') + '.npz')
+        key = stage_key(analyzer, relpath, file_fingerprint(dump_path))
+        current[relpath] = dict(previous.get(relpath, {}), key=key, segment=segment_path)
+        if force or previous.get(relpath, {}).get('key') != key or not os.path.exists(segment_path):
+            tasks.append((relpath, dump_path, segment_path))
+
+    for relpath, entry in previous.items():
+        if relpath not in current and os.path.exists(entry['segment']):
+            os.remove(entry['segment'])
+    manifest['segments'] = {relpath: entry for relpath, entry in previous.items() if relpath in current}
+    write_build_manifest(build_dir, manifest)
+
+    print(f"Analyzing {len(tasks)} of {len(current)} dump files ({len(current) - len(tasks)} unchanged).")
+    relpath_of = {dump_path: relpath for relpath, dump_path, _ in tasks}
+    analyzed = 0
+    started = time.perf_counter()
+    with Pool(workers) as pool:
+        # Each finished file is recorded at once, so an interrupted build resumes with the remaining files
+        for dump_path, n_docs, digest in pool.imap_unordered(analyze_file, [(dump_path, segment_path) for _, dump_path, segment_path in tasks]):
+            relpath = relpath_of[dump_path]
+            current[relpath]['digest'] = digest
+            manifest['segments'][relpath] = current[relpath]
+            write_build_manifest(build_dir, manifest)
+            analyzed += n_docs
+            print(f"Analyzed {dump_path} ({analyzed} articles, {analyzed / (time.perf_counter() - started):.0f} articles/s)")
+
+    manifest['segments'] = current
+    write_build_manifest(build_dir, manifest)
+    return [current[relpath]['segment'] for relpath in sorted(current)], [current[relpath]['digest'] for relpath in sorted(current)]
+
+def load_common_words(common_words_file, top_words):
+    # Same reading as filter_bag_of_words.py: header row, then one word per row by decreasing frequency
+    common_words = set()
+    with open(common_words_file, 'r', encoding='utf-8') as f:
+        csv_reader = csv.reader(f)
+        next(csv_reader, None)
+        for i, row in enumerate(csv_reader):
+            if i >= top_words:
+                break
+            word = row[0].strip().lower() if row else ''
+            if word:
+                common_words.add(word)
+    return common_words
+
+def build_dictionary(segments, common_words_file, top_words):
+    """
+    Stage 'dictionary': union of the segment vocabularies, intersected with
+    the top_words most common words when common_words_file is given.
+    """
+    words = set()
+    for segment_path in segments:
+        with np.load(segment_path) as segment:
+            words.update(read_strings(segment, 'vocabulary'))
+    print(f"Vocabulary of the dump: {len(words)} words.")
+    if common_words_file:
+        words &= load_common_words(common_words_file, top_words)
+        print(f"Dictionary after the filter with {common_words_file}: {len(words)} words.")
+    return sorted(words)
+
+def assemble_matrix(segments, dictionary, min_words):
+    """
+    Stage 'matrix': TF matrix (terms x kept documents) and the build positions of the kept documents.
+    """
+    word_to_index = {word: idx for idx, word in enumerate(dictionary)}
+    row_parts, col_parts, data_parts, kept_parts = [], [], [], []
+    doc_offset = 0
+    n_kept = 0
+    for segment_path in segments:
+        with np.load(segment_path) as segment:
+            vocabulary = read_strings(segment, 'vocabulary')
+            local_to_global = np.fromiter((word_to_index.get(word, -1) for word in vocabulary), dtype=np.int64, count=len(vocabulary))
+            n_tokens = segment['n_tokens']
+            doc_indptr = segment['doc_indptr']
+
+            kept_mask = n_tokens >= min_words
+            kept_local = np.flatnonzero(kept_mask)
+            new_column = np.full(n_tokens.size, -1, dtype=np.int64)
+            new_column[kept_local] = n_kept + np.arange(kept_local.size)
+
+            columns = np.repeat(new_column, np.diff(doc_indptr))
+            rows = local_to_global[segment['terms']] if local_to_global.size else np.empty(0, dtype=np.int64)
+            valid = (rows >= 0) & (columns >= 0)
+            row_parts.append(rows[valid])
+            col_parts.append(columns[valid])
+            data_parts.append(segment['counts'][valid].astype(np.float64))
+            kept_parts.append(doc_offset + kept_local)
+
+            doc_offset += n_tokens.size
+            n_kept += kept_local.size
+
+    if n_kept < doc_offset:
+        print(f"Left out {doc_offset - n_kept} articles with fewer than {min_words} words.")
+    concat = lambda parts, dtype: np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    A_tf = csc_matrix((concat(data_parts, np.float64), (concat(row_parts, np.int64), concat(col_parts, np.int64))),
+                      shape=(len(dictionary), n_kept))
+    A_tf.sort_indices()
+    print(f"Built TF matrix: shape {A_tf.shape}, {A_tf.nnz} non-zero elements.")
+    return A_tf, concat(kept_parts, np.int64)
+
+def write_database(db_path, table_name, segments, kept_docs, dictionary, A_tf):
+    """
+    Stage 'database': writes the article table (ids 1..N in build order, binary
+    vectors) and the dictionary in a single transaction.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{dump_import.CACHE_SIZE_KIB}")
+    try:
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"""
+                CREATE TABLE {table_name} (
+                    id INTEGER PRIMARY KEY, vector BLOB, link TEXT, title TEXT, content TEXT, parsed_content TEXT
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS dictionary (content TEXT)")
+            conn.execute("DELETE FROM dictionary")
+            conn.execute("INSERT INTO dictionary (content) VALUES (?)", (" ".join(dictionary),))
+
+            indptr, indices, data = A_tf.indptr, A_tf.indices, A_tf.data
+            batch = []
+            for position, link, title, content in kept_segment_rows(segments, kept_docs, ['links', 'titles', 'contents']):
+                start, end = indptr[position], indptr[position + 1]
+                vector = term_vectors.encode(indices[start:end], data[start:end].astype(np.uint32))
+                # parsed_content is not stored: the vectors are built from the segments
+                batch.append((position + 1, vector, link, title, content, ''))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    conn.executemany(f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?)", batch)
+                    batch = []
+            conn.executemany(f"INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?, ?)", batch)
+    finally:
+        # Reported, not raised: an error here must not replace the one of the write
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA journal_mode = DELETE")
+        except sqlite3.Error as e:
+            print(f"Warning: Could not switch {db_path} back to journal_mode DELETE: {e}")
+        conn.close()
+    print(f"Wrote {A_tf.shape[1]} articles to {db_path}:{table_name}.")
+
+def build_snippet_arrays(segments, kept_docs, max_length=snippet_store.SNIPPET_MAX_LENGTH):
+    """
+    Stage 'snippets' input: (text_bytes, offsets, content_lengths) as snippet_store.build_snippets returns them.
+    """
+    snippets = []
+    content_lengths = np.zeros(kept_docs.size, dtype=np.int64)
+    for position, content in kept_segment_rows(segments, kept_docs, ['contents']):
+        snippets.append(content[:max_length])
+        content_lengths[position] = len(content)
+    buffer, offsets = document_store.pack_strings(snippets)
+    return buffer.tobytes(), offsets, content_lengths
+
+# --- Driver ---
+def run_build(input_dir=INPUT_DIR, db_path=DATABASE, table_name=TABLE, build_dir=BUILD_DIR, index_dir=INDEX_DIR,
+              svd_dir=SVD_OUTPUT_DIR, common_words_file=COMMON_WORDS_FILE, top_words=COMMON_WORDS_TOP, min_words=MIN_WORDS,
+              workers=WORKERS, until='svd', force=(), svd_options=None):
+    """
+    Runs the stages up to and including until. Stages named in force (or
+    'all') run even when their inputs did not change. Returns True on success.
+    """
+    svd_options = dict(svd_options or {})
+    svd_options.setdefault('engine', 'svds')
+    svd_options.setdefault('rank', generate_svd_files.SVD_MAX_RANK)
+    forced = set(STAGES) if 'all' in force else set(force)
+    stages = STAGES[:STAGES.index(until) + 1]
+
+    if not os.path.isdir(input_dir):
+        print(f"Dump directory not found at {input_dir}")
+        return False
+    if common_words_file and not os.path.exists(common_words_file):
+        print(f"Common words file {common_words_file} not found, the dictionary is not filtered.")
+        common_words_file = None
+
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = read_build_manifest(build_dir)
+    started = time.perf_counter()
+
+    def fresh(stage, key):
+        return stage not in forced and manifest['stages'].get(stage, {}).get('key') == key
+
+    def report(stage, skipped):
+        print(f"--- {stage}: {'unchanged, skipped' if skipped else 'done'} ({time.perf_counter() - started:.1f} s) ---")
+
+    # analyze
+    segments, segment_digests = analyze_dump(input_dir, build_dir, manifest, workers, force='analyze' in forced)
+    if not segments:
+        print(f"No dump files found in {input_dir}.")
+        return False
+    report('analyze', False)
+
+    # dictionary
+    dictionary_path = os.path.join(build_dir, DICTIONARY_FILE)
+    dictionary_key = stage_key(segment_digests, file_fingerprint(common_words_file), top_words)
+    if 'dictionary' not in stages:
+        return True
+    skipped = fresh('dictionary', dictionary_key) and os.path.exists(dictionary_path)
+    if skipped:
+        with open(dictionary_path, 'r', encoding='utf-8') as f:
+            dictionary = f.read().split()
+    else:
+        dictionary = build_dictionary(segments, common_words_file, top_words)
+        dictionary_bytes = '\n'.join(dictionary).encode('utf-8')
+        index_store._replace_file(dictionary_path, lambda f: f.write(dictionary_bytes))
+        record_stage(build_dir, manifest, 'dictionary', dictionary_key, terms=len(dictionary))
+    report('dictionary', skipped)
+
+    # matrix
+    matrix_path = os.path.join(build_dir, MATRIX_FILE)
+    kept_path = os.path.join(build_dir, KEPT_DOCS_FILE)
+    matrix_key = stage_key(dictionary_key, min_words)
+    if 'matrix' not in stages:
+        return True
+    skipped = fresh('matrix', matrix_key) and os.path.exists(matrix_path) and os.path.exists(kept_path)
+    if skipped:
+        A_tf = load_npz(matrix_path).tocsc()
+        kept_docs = np.load(kept_path)
+    else:
+        A_tf, kept_docs = assemble_matrix(segments, dictionary, min_words)
+        index_store._replace_file(matrix_path, lambda f: save_npz(f, A_tf))
+        index_store._replace_file(kept_path, lambda f: np.save(f, kept_docs))
+        record_stage(build_dir, manifest, 'matrix', matrix_key, shape=list(A_tf.shape), nnz=int(A_tf.nnz))
+    report('matrix', skipped)
+
+    # database
+    database_key = stage_key(matrix_key, table_name)
+    if 'database' not in stages:
+        return True
+    skipped = (fresh('database', database_key) and os.path.exists(db_path)
+               and manifest['stages']['database'].get('source') == index_store.database_fingerprint(db_path, table_name))
+    if not skipped:
+        write_database(db_path, table_name, segments, kept_docs, dictionary, A_tf)
+        record_stage(build_dir, manifest, 'database', database_key, source=index_store.database_fingerprint(db_path, table_name))
+    source = index_store.database_fingerprint(db_path, table_name)
+    report('database', skipped)
+
+    # index
+    index_key = stage_key(database_key, index_store.INDEX_FORMAT_VERSION)
+    if 'index' not in stages:
+        return True
+    index_manifest = index_store.read_manifest(index_dir)
+    skipped = (fresh('index', index_key) and index_manifest is not None and index_manifest.get('source') == source
+               and index_manifest.get('format_version') == index_store.INDEX_FORMAT_VERSION)
+    doc_ids = np.arange(1, A_tf.shape[1] + 1, dtype=np.int64)
+    index = None
+    if not skipped:
+        links, titles = [], []
+        for _, link, title in kept_segment_rows(segments, kept_docs, ['links', 'titles']):
+            links.append(link)
+            titles.append(title)
+        index = index_store.build_index_from_tf(dictionary, doc_ids, links, titles, A_tf)
+        index_store.save_index(index, index_dir, source=source)
+        record_stage(build_dir, manifest, 'index', index_key)
+    report('index', skipped)
+
+    # snippets
+    snippets_key = stage_key(index_key, snippet_store.SNIPPET_MAX_LENGTH, snippet_store.SNIPPET_FORMAT_VERSION)
+    if 'snippets' not in stages:
+        return True
+    skipped = (fresh('snippets', snippets_key)
+               and snippet_store.load_snippets(index_dir, doc_ids, db_path, table_name) is not None)
+    if not skipped:
+        snippet_store.save_snippets(index_dir, doc_ids, *build_snippet_arrays(segments, kept_docs), source=source)
+        record_stage(build_dir, manifest, 'snippets', snippets_key)
+    report('snippets', skipped)
+
+    # svd
+    svd_key = stage_key(index_key, svd_options)
+    if 'svd' not in stages:
+        return True
+    store_path = os.path.join(svd_dir, svd_store.STORE_FILENAME)
+    skipped = (fresh('svd', svd_key) and os.path.exists(store_path)
+               and manifest['stages']['svd'].get('store') == svd_store.store_fingerprint(svd_dir))
+    if not skipped:
+        if index is None:
+            index = index_store.load_index(index_dir, db_path, table_name, mmap=True)
+            if index is None:
+                print("Failed to load the index artifact. Cannot compute SVD.")
+                return False
+        engine_options = {key: value for key, value in svd_options.items() if key not in ('engine', 'rank')}
+        if not generate_svd_files.compute_and_save_svd(index_store.idf_matrix(index), svd_options['rank'], svd_dir,
+                                                       doc_ids=doc_ids.tolist(), engine=svd_options['engine'], **engine_options):
+            return False
+        record_stage(build_dir, manifest, 'svd', svd_key, store=svd_store.store_fingerprint(svd_dir))
+    report('svd', skipped)
+    return True
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the database, index artifact, snippets and SVD store from the WikiExtractor dump.")
+    parser.add_argument('--input-dir', default=INPUT_DIR, help="WikiExtractor output directory")
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--table', default=TABLE)
+    parser.add_argument('--build-dir', default=BUILD_DIR, help="intermediates and the build manifest")
+    parser.add_argument('--common-words', default=COMMON_WORDS_FILE, help="word frequency CSV; empty string disables the filter")
+    parser.add_argument('--top-words', type=int, default=COMMON_WORDS_TOP)
+    parser.add_argument('--min-words', type=int, default=MIN_WORDS, help="leave out articles with fewer analyzed words")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--until', choices=STAGES, default='svd', help="last stage to run")
+    parser.add_argument('--force', nargs='+', choices=STAGES + ['all'], default=[], help="rerun these stages even if unchanged")
+    parser.add_argument('--engine', choices=['svds', 'randomized'], default='svds')
+    parser.add_argument('--rank', type=int, default=generate_svd_files.SVD_MAX_RANK)
+    parser.add_argument('--oversampling', type=int, default=generate_svd_files.RANDOMIZED_OVERSAMPLING)
+    parser.add_argument('--power-iterations', type=int, default=generate_svd_files.RANDOMIZED_POWER_ITERATIONS)
+    parser.add_argument('--threads', type=int, default=generate_svd_files.RANDOMIZED_THREADS)
+    args = parser.parse_args()
+
+    svd_options = {'engine': args.engine, 'rank': args.rank}
+    if args.engine == 'randomized':
+        svd_options.update(oversampling=args.oversampling, power_iterations=args.power_iterations, n_threads=args.threads)
+
+    import nltk
+    for resource in ('wordnet', 'stopwords', 'omw-1.4'):
+        nltk.download(resource, quiet=True)
+
+    ok = run_build(args.input_dir, args.database, args.table, args.build_dir, common_words_file=args.common_words or None,
+                   top_words=args.top_words, min_words=args.min_words, workers=args.workers, until=args.until,
+                   force=args.force, svd_options=svd_options)
+    sys.exit(0 if ok else 1)
@@ -1,8 +1,36 @@
 import sqlite3
-from collections import defaultdict
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+import term_vectors
 
-def process_all_articles_optimized(batch_size=1000):
-    conn = sqlite3.connect('database.db')
+TABLE = 'articles_180k'
+WORKERS = os.cpu_count() or 1
+
+# --- Procesy robocze ---
+_word_to_index = None
+
+def _init_worker(dictionary_words):
+    # Słownik indeksów budowany raz na proces roboczy
+    global _word_to_index
+    _word_to_index = {word: idx for idx, word in enumerate(dictionary_words)}
+
+def vectorize(parsed_content, word_to_index):
+    word_counts = {}
+    for word in (parsed_content or "").split():
+        if word in word_to_index:
+            word_counts[word] = word_counts.get(word, 0) + 1
+
+    # Format binarny (term_vectors.py); pusty content daje wektor bez termów
+    return term_vectors.encode_counts(word_counts, word_to_index)
+
+def vectorize_rows(rows):
+    """Zwraca [(vector, id), ...] gotowe dla executemany"""
+    return [(vectorize(parsed_content, _word_to_index), article_id) for article_id, parsed_content in rows]
+
+def process_all_articles_optimized(batch_size=1000, workers=WORKERS, db_path='database.db'):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Pobranie słownika
@@ -14,78 +42,58 @@ def process_all_articles_optimized(batch_size=1000):
         return
 
     dictionary_words = dictionary_row[0].split()
-    word_to_index = {word: idx for idx, word in enumerate(dictionary_words)}
+    remaining = get_remaining_count(cursor)
+    print(f"Articles to process: {remaining}")
 
     total_processed = 0
-    batch_number = 1
-
-    while True:
-        print(f"\nStarting batch #{batch_number} (size: {batch_size})")
-        
-        # Znajdź nieprzetworzone artykuły (gdzie vector jest pusty lub NULL)
-        cursor.execute("""
-            SELECT id, parsed_content 
-            FROM articles_180k
-            WHERE vector IS NULL OR vector = ''
+    last_rowid = 0
+    started = time.perf_counter()
+
+    def next_batch():
+        # Stronicowanie po rowid: każda strona zaczyna się tam, gdzie skończyła poprzednia,
+        # więc cała tabela jest czytana jeden raz
+        nonlocal last_rowid
+        cursor.execute(f"""
+            SELECT rowid, id, parsed_content
+            FROM {TABLE}
+            WHERE rowid > ? AND (vector IS NULL OR vector = '')
+            ORDER BY rowid
             LIMIT ?
-        """, (batch_size,))
-        
-        articles = cursor.fetchall()
-        if not articles:
-            print("\nAll articles processed successfully!")
-            break
-
-        processed_in_batch = 0
-        for article_id, parsed_content in articles:
-            try:
-                if not parsed_content:
-                    # Dla pustego contentu - zapisz pusty string
-                    vector_str = ""
-                else:
-                    word_counts = defaultdict(int)
-                    for word in parsed_content.split():
-                        if word in word_to_index:
-                            word_counts[word] += 1
-                    
-                    # Format optymalny: "indeks=liczba indeks=liczba"
-                    vector_str = " ".join(
-                        f"{word_to_index[word]}={count}"
-                        for word, count in word_counts.items()
-                        if count > 0
-                    )
-
-                cursor.execute("""
-                    UPDATE articles_180k
-                    SET vector = ? 
-                    WHERE id = ?
-                """, (vector_str, article_id))
-                
-                processed_in_batch += 1
-                if processed_in_batch % 100 == 0:
-                    print(f"  Processed {processed_in_batch} in current batch")
-
-            except Exception as e:
-                print(f"Error processing article {article_id}: {str(e)}")
-                conn.rollback()
-                continue
-
-        conn.commit()
-        total_processed += processed_in_batch
-        remaining = get_remaining_count(cursor)
-        
-        print(f"Completed batch #{batch_number}")
-        print(f"  Processed in this batch: {processed_in_batch}")
-        print(f"  Total processed: {total_processed}")
-        print(f"  Remaining articles: {remaining}")
-        
-        batch_number += 1
+        """, (last_rowid, batch_size))
+        rows = cursor.fetchall()
+        if rows:
+            last_rowid = rows[-1][0]
+        return [(article_id, parsed_content) for _, article_id, parsed_content in rows]
+
+    with Pool(workers, initializer=_init_worker, initargs=(dictionary_words,)) as pool:
+        pending = deque()
+
+        def submit_next():
+            articles = next_batch()
+            if not articles:
+                return False
+            pending.append(pool.apply_async(vectorize_rows, (articles,)))
+            return True
+
+        while len(pending) < 2 * workers and submit_next():
+            pass
+
+        while pending:
+            updates = pending.popleft().get()
+            cursor.executemany(f"UPDATE {TABLE} SET vector = ? WHERE id = ?", updates)
+            conn.commit()
+            submit_next()
+
+            total_processed += len(updates)
+            rate = total_processed / (time.perf_counter() - started)
+            print(f"  Processed {total_processed}/{remaining} articles ({rate:.0f} articles/s)")
 
     conn.close()
     print(f"\nFinal summary: Processed {total_processed} articles in total")
 
 def get_remaining_count(cursor):
-    cursor.execute("SELECT COUNT(*) FROM articles_180k WHERE vector IS NULL OR vector = ''")
+    cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE vector IS NULL OR vector = ''")
     return cursor.fetchone()[0]
 
 if __name__ == "__main__":
-    process_all_articles_optimized(batch_size=1000)
\ No newline at end of file
+    process_all_articles_optimized(batch_size=1000)
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Columnar document metadata. A string column (titles or links of all
+# documents) is one UTF-8 buffer with the strings packed one after another and
+# their offsets: {'data': uint8 (total bytes,), 'offsets': int64 (N + 1,)},
+# where data[offsets[i]:offsets[i + 1]] is the string of document i.
+# Both arrays are memory-mapped from the index artifact; only the strings of
+# the documents being returned are gathered and decoded.
+
+def pack_strings(strings):
+    """
+    UTF-8 buffer and offsets of a list of strings (offsets[i]:offsets[i + 1] is string i).
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def unpack_strings(buffer, offsets):
+    data = np.asarray(buffer).tobytes()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+def string_column(strings):
+    """
+    Column of a list of strings; an existing column is returned as it is.
+    """
+    if isinstance(strings, dict):
+        return strings
+    data, offsets = pack_strings(strings)
+    return {'data': data, 'offsets': offsets}
+
+def _byte_positions(offsets, doc_indices):
+    # Positions in the buffer of the strings of doc_indices, one after another
+    starts = np.asarray(offsets[doc_indices], dtype=np.int64)
+    lengths = np.asarray(offsets[doc_indices + 1], dtype=np.int64) - starts
+    bounds = np.zeros(len(doc_indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=bounds[1:])
+    positions = np.arange(bounds[-1], dtype=np.int64) + np.repeat(starts - bounds[:-1], lengths)
+    return positions, bounds
+
+def gather(column, doc_indices):
+    """
+    Strings of the documents doc_indices, read with one gather from the buffer.
+    """
+    doc_indices = np.asarray(doc_indices, dtype=np.int64)
+    positions, bounds = _byte_positions(column['offsets'], doc_indices)
+    data = np.asarray(column['data'][positions]).tobytes()
+    return [data[start:end].decode('utf-8') for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+def take(column, doc_indices):
+    """
+    New column with the strings of doc_indices, without decoding them.
+    """
+    doc_indices = np.asarray(doc_indices, dtype=np.int64)
+    positions, bounds = _byte_positions(column['offsets'], doc_indices)
+    return {'data': np.asarray(column['data'][positions], dtype=np.uint8), 'offsets': bounds}
+
+def concat(columns):
+    data = []
+    offsets = [np.zeros(1, dtype=np.int64)]
+    total = 0
+    for column in columns:
+        column_offsets = np.asarray(column['offsets'], dtype=np.int64)
+        data.append(np.asarray(column['data'][column_offsets[0]:column_offsets[-1]], dtype=np.uint8))
+        offsets.append(column_offsets[1:] - column_offsets[0] + total)
+        total += int(column_offsets[-1] - column_offsets[0])
+    return {'data': np.concatenate(data), 'offsets': np.concatenate(offsets)}
+
+def column_length(column):
+    return len(column['offsets']) - 1
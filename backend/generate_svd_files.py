@@ -1,109 +1,122 @@
-import sqlite3
 import numpy as np
-from scipy.sparse import csc_matrix, csr_matrix, diags
 from scipy.sparse.linalg import svds
-import re
-import math
 import os
-import joblib # Import joblib for saving/loading objects
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import index_store
+import svd_store
 
 # --- Configuration ---
 DATABASE = 'database.db'
 TABLE = 'articles_180k' # Adjust table name if needed
 SVD_OUTPUT_DIR = 'svd_components' # Directory to save SVD files
+INDEX_DIR = 'index' # Precompiled index artifact (see index_store.py)
 
-# List of SVD ranks (k) to compute and save
-SVD_RANKS_TO_COMPUTE = [900, 1000]
+# Largest SVD rank served; all ranks k <= SVD_MAX_RANK are prefixes of this decomposition
+SVD_MAX_RANK = 1000
+
+# Randomized engine (--engine randomized)
+RANDOMIZED_OVERSAMPLING = 20 # Extra random directions beyond k
+RANDOMIZED_POWER_ITERATIONS = 4 # Subspace iterations, sharpen the spectrum of slowly decaying matrices
+RANDOMIZED_THREADS = os.cpu_count() or 1 # Sparse products are split into this many row blocks
 
 # --- Data Loading (partial, only what's needed for SVD) ---
 def load_base_data_for_svd(db_path, table_name):
     """
     Loads dictionary and articles to build the A_idf matrix.
-    Returns A_idf, dictionary, documents_info, idf_vector.
+    Uses the precompiled index artifact when it is up to date,
+    otherwise parses the database.
+    Returns A_idf, dictionary, doc_ids, idf_vector.
     """
-    print(f"Loading base data from {db_path}...")
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # 1. Load dictionary
-        cursor.execute("SELECT content FROM dictionary")
-        dict_row = cursor.fetchone()
-        if dict_row:
-            dictionary = dict_row[0].split() # Assuming space-separated terms
-            M_terms = len(dictionary)
-            print(f"Loaded dictionary with {M_terms} terms.")
-        else:
-            print("Dictionary not found or empty.")
+        index = index_store.load_index(INDEX_DIR, db_path, table_name)
+        if index is None:
+            print(f"Loading base data from {db_path}...")
+            index = index_store.build_index_from_db(db_path, table_name)
+        if index is None:
             return None, [], [], None
 
-        # 2. Load articles info and parse vectors
-        cursor.execute(f"SELECT id, vector, link, title FROM {table_name}")
-        articles_rows = cursor.fetchall()
-        N_docs = len(articles_rows)
-        print(f"Loaded {N_docs} articles info.")
-
-        if N_docs == 0:
-            print("No articles found.")
-            return None, dictionary, [], None
-
-        documents_info = []
-        data = []
-        row_ind = []
-        col_ind = []
-
-        for doc_idx, row in enumerate(articles_rows):
-            doc_id, vector_str, link, title = row
-            documents_info.append({"doc_idx": doc_idx, "id": doc_id, "link": link, "title": title})
-
-            if vector_str:
-                pairs = vector_str.split()
-                for pair in pairs:
-                    if '=' in pair:
-                        try:
-                            term_idx_str, count_str = pair.split('=')
-                            term_idx = int(term_idx_str)
-                            count = int(count_str)
-                            if 0 <= term_idx < M_terms and count > 0:
-                                data.append(count)
-                                row_ind.append(term_idx)
-                                col_ind.append(doc_idx)
-                        except ValueError:
-                            print(f"Warning: Could not parse vector pair '{pair}' for doc_id {doc_id}")
-
-        # 3. Build Term-by-Document Matrix (TF)
-        A_tf = csc_matrix((data, (row_ind, col_ind)), shape=(M_terms, N_docs))
-        print(f"Built TF matrix: shape {A_tf.shape}, {A_tf.nnz} non-zero elements.")
-
-        # 4. Calculate IDF Vector
-        term_doc_counts = (A_tf > 0).sum(axis=1).A.flatten()
-        idf_values = np.zeros(M_terms)
-        non_zero_term_counts_mask = term_doc_counts > 0
-        idf_values[non_zero_term_counts_mask] = np.log(N_docs / term_doc_counts[non_zero_term_counts_mask])
-        idf_vector = idf_values
-        print("Calculated IDF vector.")
-
-        # 5. Apply IDF weighting --> This is A_idf
-        A_idf = A_tf.multiply(idf_vector[:, None])
-        print("Applied IDF weighting (A_idf).")
-
-        return A_idf, dictionary, documents_info, idf_vector
-
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return None, [], [], None
+        # A_idf = A_normalized scaled back by the stored document norms
+        A_idf = index_store.idf_matrix(index)
+        print("Rebuilt IDF-weighted matrix (A_idf).")
+
+        return A_idf, index['dictionary'], index['doc_ids'], index['idf_vector']
+
     except Exception as e:
         print(f"An unexpected error occurred during data loading: {e}")
         return None, [], [], None
+
+# --- SVD Engines ---
+class BlockedMatrix:
+    """
+    Sparse matrix split into row blocks of A and of A^T, so that products
+    with dense blocks run in parallel threads (scipy releases the GIL in
+    sparse-dense products).
+    """
+    def __init__(self, A, n_blocks):
+        A_rows = A.tocsr()
+        A_T_rows = A.T.tocsr()
+        self.shape = A.shape
+        self._blocks = self._split(A_rows, n_blocks)
+        self._T_blocks = self._split(A_T_rows, n_blocks)
+        self._executor = ThreadPoolExecutor(max_workers=n_blocks)
+
+    @staticmethod
+    def _split(A_rows, n_blocks):
+        bounds = np.linspace(0, A_rows.shape[0], n_blocks + 1).astype(int)
+        return [A_rows[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def _product(self, blocks, X):
+        return np.vstack(list(self._executor.map(lambda block: block @ X, blocks)))
+
+    def matmul(self, X):
+        return self._product(self._blocks, X)
+
+    def rmatmul(self, X):
+        # A^T @ X
+        return self._product(self._T_blocks, X)
+
+    def close(self):
+        self._executor.shutdown()
+
+def randomized_svd(A, k, oversampling=RANDOMIZED_OVERSAMPLING, power_iterations=RANDOMIZED_POWER_ITERATIONS,
+                   n_threads=RANDOMIZED_THREADS, seed=0):
+    """
+    Randomized range finder (Halko, Martinsson, Tropp): an orthonormal basis Q
+    of A @ Omega, refined by power iterations, and the exact SVD of the small
+    matrix Q^T A. Returns U, s, Vh sorted by descending singular values.
+    """
+    M, N = A.shape
+    n_components = min(k + oversampling, M, N)
+    rng = np.random.default_rng(seed)
+    blocked = BlockedMatrix(A, max(1, n_threads))
+    try:
+        Q, _ = np.linalg.qr(blocked.matmul(rng.standard_normal((N, n_components))))
+        for iteration in range(power_iterations):
+            # Re-orthonormalized after every product, otherwise small singular directions are lost in rounding
+            Q, _ = np.linalg.qr(blocked.rmatmul(Q))
+            Q, _ = np.linalg.qr(blocked.matmul(Q))
+            print(f"  power iteration {iteration + 1}/{power_iterations} done")
+        B = blocked.rmatmul(Q).T # Q^T A, n_components x N
     finally:
-        if conn:
-            conn.close()
+        blocked.close()
+
+    U_B, s, Vh = np.linalg.svd(B, full_matrices=False)
+    return (Q @ U_B[:, :k]), s[:k], Vh[:k]
+
+def singular_value_error(s, s_reference):
+    """
+    Largest relative error of the singular values against a reference (both descending).
+    """
+    return float(np.max(np.abs(s - s_reference) / np.maximum(s_reference, 1e-12)))
 
 # --- SVD Computation and Saving ---
-def compute_and_save_svd(A_idf, k, output_dir):
+def compute_and_save_svd(A_idf, k, output_dir, doc_ids=None, engine='svds', compare=False, **engine_options):
     """
-    Computes SVD for a given rank k and saves the components.
+    Computes SVD for the maximum rank k and saves it as a single store.
+    Every smaller rank is served from it by slicing (see svd_store.py).
+    engine_options are passed to randomized_svd.
     """
     M, N = A_idf.shape
     k_svd = min(k, min(M, N) - 1) # Ensure k is valid for svds
@@ -112,47 +125,36 @@ def compute_and_save_svd(A_idf, k, output_dir):
          print(f"Skipping SVD for k={k}: Rank {k_svd} is invalid for matrix size {M}x{N}.")
          return False
 
-    print(f"Computing SVD for k={k_svd}...")
+    print(f"Computing SVD for k={k_svd} ({engine})...")
     try:
-        # svds returns singular values in ascending order
-        U, s, Vh = svds(A_idf, k=k_svd)
-
-        # Sort components by descending singular values
-        sort_indices = s.argsort()[::-1]
-        s_k = s[sort_indices]          # Sorted singular values (k,)
-        U_k = U[:, sort_indices]       # U columns sorted accordingly (m x k)
-        V_k_T = Vh[sort_indices, :]    # Vh rows sorted accordingly (k x n)
-
-        # Calculate inverse singular values (needed for query projection)
-        s_k_inv = np.zeros_like(s_k)
-        non_zero_s_mask = s_k > 1e-9
-        s_k_inv[non_zero_s_mask] = 1.0 / s_k[non_zero_s_mask]
-
-        # Calculate norms of document vectors in the SVD space (rows of V_k)
-        # V_k_T is k x n, so V_k is n x k. Norms are along axis=1 of V_k.
-        # More efficiently: norms of columns of V_k_T
-        doc_svd_norms = np.linalg.norm(V_k_T, axis=0)
-
-        # Package components into a dictionary
-        svd_components = {
-            'U_k': U_k,
-            's_k': s_k,
-            'V_k_T': V_k_T,
-            's_k_inv': s_k_inv, # Store the 1D inverse array
-            'doc_svd_norms': doc_svd_norms
-        }
-
-        # Ensure output directory exists
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # Define filename
-        filename = os.path.join(output_dir, f'svd_k_{k_svd}.joblib')
-
-        # Save components using joblib
-        print(f"Saving SVD components for k={k_svd} to {filename}...")
-        joblib.dump(svd_components, filename)
-        print(f"Successfully saved SVD components for k={k_svd}.")
+        started = time.perf_counter()
+        if engine == 'randomized':
+            U_k, s_k, V_k_T = randomized_svd(A_idf, k_svd, **engine_options)
+        else:
+            # svds returns singular values in ascending order
+            U, s, Vh = svds(A_idf, k=k_svd)
+            U_k, s_k, V_k_T = svd_store.sort_svd(U, s, Vh)
+        elapsed = time.perf_counter() - started
+        print(f"SVD ({engine}) took {elapsed:.1f} s.")
+
+        if compare and engine == 'randomized':
+            started = time.perf_counter()
+            s_reference = np.sort(svds(A_idf, k=k_svd, return_singular_vectors=False))[::-1]
+            reference_elapsed = time.perf_counter() - started
+            print(f"svds took {reference_elapsed:.1f} s ({reference_elapsed / elapsed:.1f}x the randomized engine).")
+            print(f"Largest relative singular value error: {singular_value_error(s_k, s_reference):.2e} "
+                  f"(s_1: {singular_value_error(s_k[:1], s_reference[:1]):.2e}, s_{k_svd}: {singular_value_error(s_k[-1:], s_reference[-1:]):.2e})")
+
+        # Inverse singular values, float32 document embeddings and per-rank norms are precomputed in the store
+        store = svd_store.build_store(U_k, s_k, V_k_T, doc_ids=doc_ids)
+
+        # Reference error for documents added later by svd_fold_in.py
+        column_norms = np.sqrt(np.asarray(A_idf.multiply(A_idf).sum(axis=0)).ravel())
+        residuals = svd_store.projection_residuals(store['doc_embeddings'], s_k, column_norms)
+        store['fold_in']['baseline_residual'] = float(residuals[column_norms > 1e-9].mean()) if np.any(column_norms > 1e-9) else 0.0
+        print(f"Mean share of document energy outside the rank-{k_svd} space: {store['fold_in']['baseline_residual']:.4f}")
+
+        svd_store.save_store(store, output_dir)
         return True
 
     except Exception as e:
@@ -161,13 +163,24 @@ def compute_and_save_svd(A_idf, k, output_dir):
 
 # --- Main Execution ---
 if __name__ == '__main__':
-    A_idf, dictionary, documents_info, idf_vector = load_base_data_for_svd(DATABASE, TABLE)
-
-    if A_idf is None or len(dictionary) == 0 or len(documents_info) == 0 or idf_vector is None:
+    parser = argparse.ArgumentParser(description="Computes the SVD store used by /svd_search.")
+    parser.add_argument('--engine', choices=['svds', 'randomized'], default='svds',
+                        help="svds (ARPACK, exact) or randomized (range finder, faster)")
+    parser.add_argument('--rank', type=int, default=SVD_MAX_RANK)
+    parser.add_argument('--oversampling', type=int, default=RANDOMIZED_OVERSAMPLING)
+    parser.add_argument('--power-iterations', type=int, default=RANDOMIZED_POWER_ITERATIONS)
+    parser.add_argument('--threads', type=int, default=RANDOMIZED_THREADS)
+    parser.add_argument('--compare', action='store_true',
+                        help="with --engine randomized, also run svds and report the singular value error")
+    args = parser.parse_args()
+
+    A_idf, dictionary, doc_ids, idf_vector = load_base_data_for_svd(DATABASE, TABLE)
+
+    if A_idf is None or len(dictionary) == 0 or len(doc_ids) == 0 or idf_vector is None:
         print("Failed to load base data. Cannot compute SVD.")
     else:
         print("\n--- Starting SVD Computation and Saving ---")
-        for k in SVD_RANKS_TO_COMPUTE:
-            compute_and_save_svd(A_idf, k, SVD_OUTPUT_DIR)
+        compute_and_save_svd(A_idf, args.rank, SVD_OUTPUT_DIR, doc_ids=doc_ids, engine=args.engine, compare=args.compare,
+                             oversampling=args.oversampling, power_iterations=args.power_iterations, n_threads=args.threads)
 
-        print("\n--- SVD Computation and Saving Complete ---")
\ No newline at end of file
+        print("\n--- SVD Computation and Saving Complete ---")
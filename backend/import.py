@@ -1,17 +1,21 @@
 import os
 import json
 import sqlite3
+import time
+from multiprocessing import Pool
 
 # Ścieżka do folderu z plikami WikiExtractora
 INPUT_DIR = "output"
 DB_FILE = "database.db"
+WORKERS = os.cpu_count() or 1
+INSERT_BATCH_SIZE = 5000 # Wiersze na jedno executemany
+CACHE_SIZE_KIB = 256 * 1024
+CHECKPOINT_TABLE = "import_checkpoint"
 
-# Połączenie z bazą danych
-conn = sqlite3.connect(DB_FILE)
-cursor = conn.cursor()
-
-# Funkcja do przetwarzania pojedynczego pliku
+# Funkcja do przetwarzania pojedynczego pliku (w procesie roboczym)
 def process_file(filepath):
+    rows = []
+    errors = 0
     with open(filepath, 'r', encoding='utf-8') as f:
         for line in f:
             try:
@@ -19,27 +23,71 @@ def process_file(filepath):
                 link = data.get("url", "")
                 title = data.get("title", "")
                 content = data.get("text", "")
-
-                cursor.execute("""
-                    INSERT INTO articles (vector, link, title, content, parsed_content)
-                    VALUES (?, ?, ?, ?, ?)
-                """, ("", link, title, content, ""))
+                rows.append(("", link, title, content, ""))
             except json.JSONDecodeError:
-                print(f"Błąd dekodowania JSON w pliku {filepath}")
+                errors += 1
             except Exception as e:
                 print(f"Nieoczekiwany błąd przy pliku {filepath}: {e}")
-    
-    print(f"Przetworzono plik: {filepath}")
+    if errors:
+        print(f"Błąd dekodowania JSON w pliku {filepath} ({errors} wierszy)")
+    return filepath, rows
+
+def find_files(input_dir):
+    # Posortowane, aby kolejność (i identyfikatory artykułów) nie zależała od systemu plików
+    filepaths = []
+    for root, dirs, files in os.walk(input_dir):
+        for filename in files:
+            if filename.startswith("wiki_"):
+                filepaths.append(os.path.join(root, filename))
+    return sorted(filepaths)
+
+def import_dump(input_dir=INPUT_DIR, db_file=DB_FILE, workers=WORKERS):
+    conn = sqlite3.connect(db_file)
+    # Na czas importu: WAL i mniej synchronizacji z dyskiem, duży cache stron
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (path TEXT PRIMARY KEY, rows INTEGER)")
+    conn.commit()
+
+    # Pliki zaimportowane w poprzednich uruchomieniach są pomijane
+    done = {path for (path,) in conn.execute(f"SELECT path FROM {CHECKPOINT_TABLE}")}
+    filepaths = [path for path in find_files(input_dir) if path not in done]
+    if done:
+        print(f"Pomijanie {len(done)} zaimportowanych wcześniej plików.")
+
+    imported = 0
+    started = time.perf_counter()
+    try:
+        with Pool(workers) as pool:
+            # imap zachowuje kolejność plików; dekodowanie kolejnych plików trwa w tle
+            for filepath, rows in pool.imap(process_file, filepaths):
+                for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                    conn.executemany("""
+                        INSERT INTO articles (vector, link, title, content, parsed_content)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, rows[start:start + INSERT_BATCH_SIZE])
+                # Wiersze pliku i jego punkt kontrolny są zatwierdzane razem
+                conn.execute(f"INSERT INTO {CHECKPOINT_TABLE} (path, rows) VALUES (?, ?)", (filepath, len(rows)))
+                conn.commit()
 
-# Przejście przez wszystkie foldery i pliki
-for root, dirs, files in os.walk(INPUT_DIR):
-    for filename in files:
-        if filename.startswith("wiki_"):
-            filepath = os.path.join(root, filename)
-            process_file(filepath)
+                imported += len(rows)
+                rate = imported / (time.perf_counter() - started)
+                print(f"Przetworzono plik: {filepath} ({imported} wierszy, {rate:.0f} wierszy/s)")
+    finally:
+        # Powrót do zwykłego trybu dziennika, aby pozostałe skrypty widziały jeden plik bazy.
+        # Błąd sprzątania tylko wypisujemy, aby nie zastąpił błędu importu.
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA journal_mode = DELETE")
+        except sqlite3.Error as e:
+            print(f"Nie udało się przywrócić trybu dziennika DELETE: {e}")
+        conn.close()
 
-# Zapis i zamknięcie
-conn.commit()
-conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"Zaimportowano {imported} artykułów w {elapsed:.1f} s ({imported / max(elapsed, 1e-9):.0f} wierszy/s).")
 
-print("Import zakończony!")
+if __name__ == '__main__':
+    import_dump()
+    print("Import zakończony!")
@@ -0,0 +1,406 @@
+import sqlite3
+import numpy as np
+from scipy.sparse import csc_matrix, diags
+import json
+import os
+import time
+from contextlib import contextmanager
+import document_store
+import inverted_index
+import term_vectors
+
+try:
+    import fcntl
+except ImportError: # Windows: workers are not synchronized
+    fcntl = None
+
+# --- Configuration ---
+DATABASE = 'database.db'
+TABLE = 'articles_180k'
+INDEX_DIR = 'index' # Directory holding the precompiled index artifact
+
+# Bump whenever the layout of the files below changes; older artifacts are rebuilt.
+INDEX_FORMAT_VERSION = 4
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.build.lock'
+SERVERS_DIR = '.servers' # One locked file per server process (see register_server)
+DICTIONARY_FILE = 'dictionary.txt'
+ARRAY_FILES = {
+    'data': 'tfidf_data.npy',        # A_normalized.data (float64)
+    'indices': 'tfidf_indices.npy',  # A_normalized.indices (term ids)
+    'indptr': 'tfidf_indptr.npy',    # A_normalized.indptr (one entry per document + 1)
+    'idf_vector': 'idf.npy',         # IDF weight per term (M,)
+    'doc_norms': 'doc_norms.npy',    # L2 norm of each A_idf column (N,)
+    'doc_ids': 'doc_ids.npy',        # Database id of each document (N,)
+    # Raw term counts (A_tf), from which live merges recompute IDF and normalization
+    'tf_data': 'tf_data.npy',        # A_tf.data (uint32)
+    'tf_indices': 'tf_indices.npy',  # A_tf.indices (term ids)
+    'tf_indptr': 'tf_indptr.npy',    # A_tf.indptr (one entry per document + 1)
+    # Titles and links as UTF-8 buffers with offsets (see document_store.py)
+    'title_data': 'title_data.npy',
+    'title_offsets': 'title_offsets.npy',
+    'link_data': 'link_data.npy',
+    'link_offsets': 'link_offsets.npy',
+    # Term-major postings for pruned scoring (see inverted_index.py)
+    'postings_indptr': 'postings_indptr.npy',
+    'postings_docs': 'postings_docs.npy',
+    'postings_impacts': 'postings_impacts.npy',
+    'max_impact': 'max_impact.npy',
+}
+POSTINGS_KEYS = {
+    'postings_indptr': 'indptr',
+    'postings_docs': 'docs',
+    'postings_impacts': 'impacts',
+    'max_impact': 'max_impact',
+}
+
+# --- Building from SQLite ---
+def database_fingerprint(db_path, table_name):
+    """
+    Cheap identity of the source database, used to detect stale artifacts.
+    """
+    stat = os.stat(db_path)
+    return {
+        'database': os.path.basename(db_path),
+        'table': table_name,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def load_tf_from_db(db_path, table_name):
+    """
+    Loads the dictionary and decodes the `vector` column into a TF matrix.
+    Returns (dictionary, doc_ids, links, titles, A_tf) or None on failure.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT content FROM dictionary")
+        dict_row = cursor.fetchone()
+        if not dict_row:
+            print("Dictionary not found in database or is empty.")
+            return None
+        dictionary = dict_row[0].split()
+        M_terms = len(dictionary)
+        print(f"Loaded dictionary with {M_terms} terms.")
+
+        cursor.execute(f"SELECT id, vector, link, title FROM {table_name}")
+        articles_rows = cursor.fetchall()
+        N_docs = len(articles_rows)
+        print(f"Loaded {N_docs} articles info.")
+
+        if N_docs == 0:
+            print("No articles found in database.")
+            return None
+
+        doc_ids = [row[0] for row in articles_rows]
+        links = [row[2] or '' for row in articles_rows]
+        titles = [row[3] or '' for row in articles_rows]
+        row_ind, col_ind, data = term_vectors.decode_many([row[1] for row in articles_rows], M_terms, doc_labels=doc_ids)
+
+        if data.size == 0:
+            print("No valid vector data found in articles.")
+        A_tf = csc_matrix((data, (row_ind, col_ind)), shape=(M_terms, N_docs), dtype=np.float64)
+        print(f"Built TF matrix: shape {A_tf.shape}, {A_tf.nnz} non-zero elements.")
+
+        return dictionary, doc_ids, links, titles, A_tf
+
+    except sqlite3.Error as e:
+        print(f"Database error during base data loading: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def compute_tfidf(A_tf):
+    """
+    Computes the IDF vector, the L2-normalized TF-IDF matrix and the
+    per-document norms of the unnormalized TF-IDF matrix.
+    """
+    M_terms, N_docs = A_tf.shape
+
+    term_doc_counts = np.diff(A_tf.tocsr().indptr)
+    idf_vector = np.zeros(M_terms)
+    non_zero_term_counts_mask = term_doc_counts > 0
+    idf_vector[non_zero_term_counts_mask] = np.log(N_docs / term_doc_counts[non_zero_term_counts_mask])
+    print("Calculated IDF vector.")
+
+    A_idf = csc_matrix(A_tf.multiply(idf_vector[:, None]))
+    print("Applied IDF weighting (A_idf).")
+
+    doc_norms = np.sqrt(np.asarray(A_idf.power(2).sum(axis=0)).ravel())
+    inv_norms_data = np.zeros_like(doc_norms)
+    non_zero_norms_mask = doc_norms > 1e-9
+    inv_norms_data[non_zero_norms_mask] = 1.0 / doc_norms[non_zero_norms_mask]
+    A_normalized = csc_matrix(A_idf @ diags(inv_norms_data, offsets=0, shape=(N_docs, N_docs), format='csc'))
+    A_normalized.sort_indices()
+    print("Normalized document vectors (A_normalized).")
+
+    return idf_vector, A_normalized, doc_norms
+
+def build_index_from_db(db_path, table_name):
+    """
+    Runs the full SQLite load and TF-IDF computation.
+    Returns an index dictionary (see load_index) or None on failure.
+    """
+    loaded = load_tf_from_db(db_path, table_name)
+    if loaded is None:
+        return None
+    return build_index_from_tf(*loaded)
+
+def build_index_from_tf(dictionary, doc_ids, links, titles, A_tf):
+    """
+    Index dictionary (see load_index) of a TF matrix (terms x documents).
+    links and titles are lists of strings or string columns.
+    """
+    idf_vector, A_normalized, doc_norms = compute_tfidf(A_tf)
+
+    return {
+        'dictionary': dictionary,
+        'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+        'A_tf': A_tf,
+        'links': document_store.string_column(links),
+        'titles': document_store.string_column(titles),
+        'A_normalized': A_normalized,
+        'idf_vector': idf_vector,
+        'doc_norms': doc_norms,
+        'postings': inverted_index.build_postings(A_normalized),
+    }
+
+def idf_matrix(index):
+    """
+    Rebuilds A_idf (unnormalized TF-IDF) from the stored normalized matrix and norms.
+    """
+    A_normalized = index['A_normalized']
+    N_docs = A_normalized.shape[1]
+    return A_normalized @ diags(index['doc_norms'], offsets=0, shape=(N_docs, N_docs), format='csc')
+
+# --- Artifact I/O ---
+def _replace_file(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def save_index(index, index_dir, source=None):
+    """
+    Writes the index to index_dir. The manifest is written last, so a
+    partially written directory is never picked up by load_index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    A_normalized = index['A_normalized']
+    arrays = {
+        'data': np.ascontiguousarray(A_normalized.data, dtype=np.float64),
+        'indices': np.ascontiguousarray(A_normalized.indices),
+        'indptr': np.ascontiguousarray(A_normalized.indptr),
+        'idf_vector': np.ascontiguousarray(index['idf_vector'], dtype=np.float64),
+        'doc_norms': np.ascontiguousarray(index['doc_norms'], dtype=np.float64),
+        'doc_ids': np.ascontiguousarray(index['doc_ids'], dtype=np.int64),
+        'tf_data': np.ascontiguousarray(index['A_tf'].data, dtype=np.uint32),
+        'tf_indices': np.ascontiguousarray(index['A_tf'].indices),
+        'tf_indptr': np.ascontiguousarray(index['A_tf'].indptr),
+    }
+    for name, column in (('title', index['titles']), ('link', index['links'])):
+        arrays[f'{name}_data'] = np.ascontiguousarray(column['data'], dtype=np.uint8)
+        arrays[f'{name}_offsets'] = np.ascontiguousarray(column['offsets'], dtype=np.int64)
+    for key, postings_key in POSTINGS_KEYS.items():
+        arrays[key] = np.ascontiguousarray(index['postings'][postings_key])
+    for key, filename in ARRAY_FILES.items():
+        _replace_file(os.path.join(index_dir, filename), lambda f, a=arrays[key]: np.save(f, a))
+
+    # Titles and links were kept in documents.json up to format v2
+    if os.path.exists(os.path.join(index_dir, 'documents.json')):
+        os.remove(os.path.join(index_dir, 'documents.json'))
+
+    dictionary_bytes = '\n'.join(index['dictionary']).encode('utf-8')
+    _replace_file(os.path.join(index_dir, DICTIONARY_FILE), lambda f: f.write(dictionary_bytes))
+
+    manifest = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'shape': list(A_normalized.shape),
+        'nnz': int(A_normalized.nnz),
+        'source': source,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    manifest_bytes = json.dumps(manifest, indent=2).encode('utf-8')
+    _replace_file(manifest_path, lambda f: f.write(manifest_bytes))
+    print(f"Saved index artifact (format v{INDEX_FORMAT_VERSION}) to {index_dir}.")
+
+def read_manifest(index_dir):
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_index(index_dir, db_path=None, table_name=None, mmap=True):
+    """
+    Loads the index artifact, memory-mapping the arrays when mmap is True.
+    Returns None when the artifact is missing, has another format version,
+    or was built from a different state of the database.
+    """
+    try:
+        manifest = read_manifest(index_dir)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read index manifest in {index_dir}: {e}")
+        return None
+    if manifest is None:
+        print(f"Index artifact not found in {index_dir}.")
+        return None
+
+    if manifest.get('format_version') != INDEX_FORMAT_VERSION:
+        print(f"Index artifact in {index_dir} has format v{manifest.get('format_version')}, expected v{INDEX_FORMAT_VERSION}.")
+        return None
+
+    if db_path is not None and os.path.exists(db_path):
+        if manifest.get('source') != database_fingerprint(db_path, table_name):
+            print(f"Index artifact in {index_dir} is stale (database changed since it was built).")
+            return None
+
+    mmap_mode = 'r' if mmap else None
+    try:
+        arrays = {key: np.load(os.path.join(index_dir, filename), mmap_mode=mmap_mode)
+                  for key, filename in ARRAY_FILES.items()}
+
+        with open(os.path.join(index_dir, DICTIONARY_FILE), 'r', encoding='utf-8') as f:
+            dictionary = f.read().split('\n')
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read index artifact in {index_dir}: {e}")
+        return None
+
+    shape = tuple(manifest['shape'])
+    A_normalized = csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+    A_tf = csc_matrix((arrays['tf_data'], arrays['tf_indices'], arrays['tf_indptr']), shape=shape, copy=False)
+
+    print(f"Loaded index artifact from {index_dir}: shape {shape}, {manifest['nnz']} non-zero elements.")
+    return {
+        'dictionary': dictionary,
+        'doc_ids': arrays['doc_ids'],
+        'A_tf': A_tf,
+        'links': {'data': arrays['link_data'], 'offsets': arrays['link_offsets']},
+        'titles': {'data': arrays['title_data'], 'offsets': arrays['title_offsets']},
+        'A_normalized': A_normalized,
+        'idf_vector': arrays['idf_vector'],
+        'doc_norms': arrays['doc_norms'],
+        'postings': {postings_key: arrays[key] for key, postings_key in POSTINGS_KEYS.items()},
+        'source': manifest.get('source'),
+    }
+
+# --- Shared loading ---
+@contextmanager
+def build_lock(index_dir):
+    """
+    Exclusive lock on index_dir across processes, held while an artifact is built.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(index_dir, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def register_server(index_dir):
+    """
+    Registers the calling process as a server of index_dir for as long as it
+    runs (the returned file must be kept open). Taken under build_lock, so a
+    process checking count_servers under that lock sees it before it loads.
+    """
+    servers_dir = os.path.join(index_dir, SERVERS_DIR)
+    with build_lock(index_dir):
+        os.makedirs(servers_dir, exist_ok=True)
+        registration = open(os.path.join(servers_dir, str(os.getpid())), 'a')
+        if fcntl is not None:
+            fcntl.flock(registration, fcntl.LOCK_EX)
+    return registration
+
+def count_servers(index_dir):
+    """
+    Number of running processes registered with register_server (files of
+    processes that exited are removed). 1 where processes can not be locked.
+    """
+    servers_dir = os.path.join(index_dir, SERVERS_DIR)
+    if fcntl is None or not os.path.isdir(servers_dir):
+        return 1
+    count = 0
+    for name in os.listdir(servers_dir):
+        if name == str(os.getpid()):
+            count += 1
+            continue
+        path = os.path.join(servers_dir, name)
+        try:
+            with open(path, 'a') as registration:
+                try:
+                    fcntl.flock(registration, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    count += 1
+                    continue
+                # Not locked: the process is gone
+                os.remove(path)
+        except OSError:
+            pass
+    return count
+
+def load_or_build_index(db_path=DATABASE, table_name=TABLE, index_dir=INDEX_DIR):
+    """
+    Memory-maps the index artifact, building it first if it is missing or
+    stale. Worker processes starting together build it once (the others wait
+    for the lock) and then all map the same read-only files, so the index is
+    held once in the page cache instead of once per worker.
+    Returns None on failure.
+    """
+    index = load_index(index_dir, db_path, table_name)
+    if index is not None:
+        return index
+    if not os.path.exists(db_path):
+        print(f"Database file not found at {db_path}")
+        return None
+
+    with build_lock(index_dir):
+        # Another worker may have built it while this one waited
+        index = load_index(index_dir, db_path, table_name)
+        if index is not None:
+            return index
+        print("Building the index artifact from the database (run 'python index_store.py' to do it before startup)...")
+        source = database_fingerprint(db_path, table_name)
+        index = build_index_from_db(db_path, table_name)
+        if index is None:
+            return None
+        try:
+            save_index(index, index_dir, source=source)
+        except OSError as e:
+            print(f"Warning: Could not save the index artifact, keeping a private copy in memory: {e}")
+            index['source'] = source
+            return index
+        return load_index(index_dir) or index
+
+def build_index(db_path=DATABASE, table_name=TABLE, index_dir=INDEX_DIR):
+    """
+    Build step: reads the database once and writes the index artifact.
+    """
+    if not os.path.exists(db_path):
+        print(f"Database file not found at {db_path}")
+        return False
+
+    source = database_fingerprint(db_path, table_name)
+    index = build_index_from_db(db_path, table_name)
+    if index is None:
+        print("Failed to build index from database.")
+        return False
+
+    save_index(index, index_dir, source=source)
+    return True
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    build_index(DATABASE, TABLE, INDEX_DIR)
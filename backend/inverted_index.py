@@ -0,0 +1,90 @@
+import numpy as np
+import topk
+
+# Term-at-a-time scoring over term-major postings of A_normalized with MaxScore pruning.
+# Scores are exact: the result equals the dense q_normalized @ A_normalized top-k.
+
+def build_postings(A_normalized):
+    """
+    Builds term-major postings from the (terms x documents) normalized matrix.
+    Each posting list is sorted by document index; max_impact holds the
+    largest weight of every term, used as its score upper bound.
+    """
+    A_terms = A_normalized.tocsr()
+    A_terms.sort_indices()
+    indptr = A_terms.indptr
+    impacts = A_terms.data
+
+    max_impact = np.zeros(A_terms.shape[0])
+    non_empty_mask = np.diff(indptr) > 0
+    max_impact[non_empty_mask] = np.maximum.reduceat(impacts, indptr[:-1][non_empty_mask])
+
+    return {
+        'indptr': indptr,
+        'docs': A_terms.indices,
+        'impacts': impacts,
+        'max_impact': max_impact,
+    }
+
+def _kth_score(scores, k):
+    if scores.size < k:
+        return 0.0
+    return np.partition(scores, scores.size - k)[scores.size - k]
+
+def search(postings, term_ids, weights, k, offset=0, threshold=0.0):
+    """
+    Returns (doc_indices, doc_scores) for ranks [offset, offset + k) of the
+    query given as term ids with their (normalized) weights.
+
+    Terms are processed by descending upper bound. While a document that has
+    not been seen yet could still enter the top results, posting lists are
+    merged in full (OR phase). Once the remaining terms together cannot beat
+    the current k-th score, only existing candidates are updated through
+    binary search into the remaining posting lists (AND phase), and
+    candidates that can no longer reach the k-th score are dropped.
+    """
+    indptr = postings['indptr']
+    docs = postings['docs']
+    impacts = postings['impacts']
+
+    term_ids = np.asarray(term_ids)
+    weights = np.asarray(weights, dtype=np.float64)
+    needed = offset + k
+
+    upper_bounds = weights * postings['max_impact'][term_ids]
+    order = np.argsort(-upper_bounds, kind='stable')
+    term_ids, weights, upper_bounds = term_ids[order], weights[order], upper_bounds[order]
+    # remaining[i] = best score still obtainable from terms i, i+1, ...
+    remaining = np.append(np.cumsum(upper_bounds[::-1])[::-1], 0.0)
+
+    acc_docs = np.empty(0, dtype=docs.dtype)
+    acc_scores = np.empty(0)
+    theta = 0.0
+
+    i = 0
+    while i < len(term_ids):
+        if remaining[i] < theta:
+            break
+        start, end = indptr[term_ids[i]], indptr[term_ids[i] + 1]
+        all_docs = np.concatenate((acc_docs, docs[start:end]))
+        all_scores = np.concatenate((acc_scores, weights[i] * impacts[start:end]))
+        acc_docs, inverse = np.unique(all_docs, return_inverse=True)
+        acc_scores = np.bincount(inverse, weights=all_scores, minlength=acc_docs.size)
+        theta = _kth_score(acc_scores, needed)
+        i += 1
+
+    while i < len(term_ids) and acc_docs.size:
+        keep_mask = acc_scores + remaining[i] >= theta
+        acc_docs, acc_scores = acc_docs[keep_mask], acc_scores[keep_mask]
+
+        start, end = indptr[term_ids[i]], indptr[term_ids[i] + 1]
+        term_docs = docs[start:end]
+        positions = np.searchsorted(term_docs, acc_docs)
+        positions[positions == term_docs.size] = 0
+        hit_mask = term_docs[positions] == acc_docs if term_docs.size else np.zeros(acc_docs.size, dtype=bool)
+        acc_scores[hit_mask] += weights[i] * impacts[start + positions[hit_mask]]
+        theta = _kth_score(acc_scores, needed)
+        i += 1
+
+    top_positions, top_scores = topk.top_k(acc_scores, k, offset=offset, threshold=threshold)
+    return acc_docs[top_positions], top_scores
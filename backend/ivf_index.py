@@ -0,0 +1,198 @@
+import numpy as np
+import joblib
+import os
+import sys
+import time
+import svd_store
+import topk
+
+# Approximate nearest-neighbour search in the LSI space with an inverted file (IVF):
+# documents are clustered by spherical k-means, each cluster's unit vectors are stored
+# contiguously, and a query only scans the nprobe clusters closest to it.
+
+# --- Configuration ---
+SVD_OUTPUT_DIR = 'svd_components'
+IVF_FORMAT_VERSION = 1
+IVF_RANKS = [300] # Ranks to build an IVF index for when run as a script
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_SIZE = 100000 # Documents used to train the centroids
+ASSIGN_CHUNK = 65536 # Rows per block when assigning documents to lists
+
+def ivf_filename(output_dir, k):
+    return os.path.join(output_dir, f'ivf_k_{k}.joblib')
+
+def default_n_lists(n_docs):
+    return max(1, int(4 * np.sqrt(n_docs)))
+
+def assign_lists(X, centroids):
+    """
+    Index of the most similar centroid (by dot product) for every row of X.
+    """
+    assignments = np.empty(X.shape[0], dtype=np.int64)
+    for start in range(0, X.shape[0], ASSIGN_CHUNK):
+        assignments[start:start + ASSIGN_CHUNK] = np.argmax(X[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return assignments
+
+def train_kmeans(X, n_lists, n_iter=KMEANS_ITERATIONS, seed=0):
+    """
+    Spherical k-means: centroids are kept at unit length, similarity is the dot product.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(X.shape[0], n_lists, replace=False)].copy()
+
+    for iteration in range(n_iter):
+        assignments = assign_lists(X, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        order = np.argsort(assignments, kind='stable')
+        non_empty = np.flatnonzero(counts)
+        sums[non_empty] = np.add.reduceat(X[order], np.cumsum(counts)[non_empty] - counts[non_empty], axis=0)
+
+        # Empty lists are restarted from random documents
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = X[rng.choice(X.shape[0], empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1)
+        norms[norms < 1e-12] = 1.0
+        centroids = (sums / norms[:, None]).astype(np.float32)
+        print(f"  k-means iteration {iteration + 1}/{n_iter}: {empty.size} empty lists")
+
+    return centroids
+
+def build_ivf(store, k, n_lists=None, seed=0, source=None):
+    """
+    Trains the coarse quantizer on a sample of the rank-k document vectors
+    and lays out all vectors grouped by list.
+    """
+    n_docs = store['doc_embeddings'].shape[0]
+    n_lists = n_lists or default_n_lists(n_docs)
+    rng = np.random.default_rng(seed)
+
+    sample_size = min(n_docs, max(KMEANS_SAMPLE_SIZE, n_lists * 40))
+    sample_ids = np.sort(rng.choice(n_docs, sample_size, replace=False))
+    view = svd_store.rank_view(store, k)
+    sample = view['doc_embeddings'][sample_ids] * view['doc_inv_norms'][sample_ids, None]
+    print(f"Training {n_lists} IVF lists for k={k} on {sample_size} documents...")
+    centroids = train_kmeans(sample, n_lists, seed=seed)
+
+    assignments = np.empty(n_docs, dtype=np.int64)
+    for start in range(0, n_docs, ASSIGN_CHUNK):
+        end = start + ASSIGN_CHUNK
+        unit_vectors = view['doc_embeddings'][start:end] * view['doc_inv_norms'][start:end, None]
+        assignments[start:end] = assign_lists(unit_vectors, centroids)
+
+    doc_indices = np.argsort(assignments, kind='stable')
+    list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+    vectors = np.ascontiguousarray(view['doc_embeddings'][doc_indices] * view['doc_inv_norms'][doc_indices, None], dtype=np.float32)
+
+    return {
+        'format_version': IVF_FORMAT_VERSION,
+        'k': k,
+        'source': source,
+        'centroids': centroids,
+        'list_offsets': list_offsets,
+        'doc_indices': doc_indices,
+        'vectors': vectors,
+    }
+
+def save_ivf(ivf, output_dir=SVD_OUTPUT_DIR):
+    filename = ivf_filename(output_dir, ivf['k'])
+    joblib.dump(ivf, filename + '.tmp')
+    os.replace(filename + '.tmp', filename)
+    print(f"Saved IVF index for k={ivf['k']} to {filename}.")
+
+def load_ivf(output_dir, k, mmap=True):
+    """
+    Loads the IVF index for rank k, or returns None if it is missing or
+    was built from another SVD store.
+    """
+    filename = ivf_filename(output_dir, k)
+    if not os.path.exists(filename):
+        return None
+
+    ivf = joblib.load(filename, mmap_mode='r' if mmap else None)
+    if ivf.get('format_version') != IVF_FORMAT_VERSION:
+        print(f"IVF index {filename} has format v{ivf.get('format_version')}, expected v{IVF_FORMAT_VERSION}.")
+        return None
+    if ivf.get('source') != svd_store.store_fingerprint(output_dir):
+        print(f"IVF index {filename} is stale (SVD store changed since it was built).")
+        return None
+    return ivf
+
+def search(ivf, q_unit, limit, offset=0, nprobe=DEFAULT_NPROBE, threshold=0.0):
+    """
+    Scores only the documents of the nprobe lists closest to the unit query vector.
+    Returns (doc_indices, doc_scores, scanned_documents).
+    """
+    centroid_scores = ivf['centroids'] @ q_unit
+    nprobe = min(nprobe, centroid_scores.shape[0])
+    probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+    list_offsets = ivf['list_offsets']
+    candidate_ids = []
+    candidate_scores = []
+    for list_id in probes:
+        start, end = list_offsets[list_id], list_offsets[list_id + 1]
+        if end > start:
+            candidate_ids.append(ivf['doc_indices'][start:end])
+            candidate_scores.append(ivf['vectors'][start:end] @ q_unit)
+
+    if not candidate_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), 0
+
+    candidate_ids = np.concatenate(candidate_ids)
+    candidate_scores = np.concatenate(candidate_scores)
+    positions, scores = topk.top_k(candidate_scores, limit, offset=offset, threshold=threshold)
+    return candidate_ids[positions], scores, candidate_ids.size
+
+def measure_recall(ivf, store, nprobe_values, n_queries=200, at=10, seed=0):
+    """
+    recall@at of the IVF search against the exact scan, using random
+    documents as queries. Returns {nprobe: (recall, scanned_fraction, ms_per_query)}.
+    """
+    k = ivf['k']
+    view = svd_store.rank_view(store, k)
+    n_docs = view['doc_embeddings'].shape[0]
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(np.flatnonzero(view['doc_inv_norms'] > 0), n_queries, replace=False)
+    queries = view['doc_embeddings'][query_ids] * view['doc_inv_norms'][query_ids, None]
+
+    exact = []
+    for q_unit in queries:
+        scores = (view['doc_embeddings'] @ q_unit) * view['doc_inv_norms']
+        exact.append(set(topk.top_k(scores, at, threshold=-np.inf)[0].tolist()))
+
+    results = {}
+    for nprobe in nprobe_values:
+        hits = 0
+        scanned = 0
+        started = time.perf_counter()
+        for q_unit, exact_ids in zip(queries, exact):
+            doc_ids, _, scanned_documents = search(ivf, q_unit, at, nprobe=nprobe, threshold=-np.inf)
+            hits += len(exact_ids & set(doc_ids.tolist()))
+            scanned += scanned_documents
+        elapsed_ms = (time.perf_counter() - started) * 1000 / n_queries
+        results[nprobe] = (hits / (at * n_queries), scanned / (n_queries * n_docs), elapsed_ms)
+    return results
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    ranks = [int(arg) for arg in sys.argv[1:]] or IVF_RANKS
+    store = svd_store.load_store(SVD_OUTPUT_DIR)
+    if store is None:
+        print("SVD store not found. Run generate_svd_files.py first.")
+        sys.exit(1)
+
+    for k in ranks:
+        if k > store['k_max']:
+            print(f"Skipping k={k}: the SVD store only has rank {store['k_max']}.")
+            continue
+        ivf = build_ivf(store, k, source=svd_store.store_fingerprint(SVD_OUTPUT_DIR))
+        save_ivf(ivf, SVD_OUTPUT_DIR)
+
+        print(f"recall@10 against the exact scan for k={k}:")
+        for nprobe, (recall, scanned_fraction, ms) in measure_recall(ivf, store, [1, 4, 16, 64]).items():
+            print(f"  nprobe={nprobe:3d}: recall {recall:.3f}, scanned {scanned_fraction:.2%} of documents, {ms:.2f} ms/query")
@@ -0,0 +1,456 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+import numpy as np
+from scipy.sparse import csc_matrix, diags, hstack
+import document_store
+import index_store
+import snippet_store
+import term_vectors
+import text_analyzer
+import topk
+
+# Articles added and deleted while the server runs.
+# - new articles go to a delta segment: TF columns over the (fixed) dictionary,
+#   weighted with the IDF of the main index and searched next to it
+# - deleted articles of the main index are marked in a tombstone bitmap and
+#   filtered out of the results
+# - a background thread merges both into a new main index (IDF, normalization
+#   and postings recomputed) and swaps it in between requests
+# Changes are written to SQLite at once, so a restart sees the same documents.
+# Terms that are not in the dictionary are ignored until the next full build.
+
+# --- Configuration ---
+MERGE_DELTA_DOCS = 1000 # Delta size that starts a background merge
+MERGE_TOMBSTONES = 1000 # Number of deleted main documents that starts a background merge
+
+class LiveUpdateError(Exception):
+    pass
+
+LiveDocument = namedtuple('LiveDocument', ['seq', 'doc_id', 'link', 'title', 'snippet', 'content_length', 'term_ids', 'counts'])
+
+class ReadWriteLock:
+    """
+    Any number of readers or one writer. A waiting writer keeps new readers
+    out, so a merge is swapped in as soon as the running requests finish.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+class DeltaSegment:
+    """
+    Immutable set of documents added since the last merge. Result positions
+    of delta documents follow the main documents (n_main + position in the delta).
+    """
+    def __init__(self, documents, idf_vector):
+        n_terms = idf_vector.shape[0]
+        self.documents = tuple(documents)
+        self.doc_ids = np.fromiter((doc.doc_id for doc in self.documents), dtype=np.int64, count=len(self.documents))
+        self.position = {doc.doc_id: doc_idx for doc_idx, doc in enumerate(self.documents)}
+
+        lengths = [doc.term_ids.size for doc in self.documents]
+        indptr = np.zeros(len(self.documents) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths)
+        term_ids = np.concatenate([doc.term_ids for doc in self.documents]) if self.documents else np.empty(0, dtype=np.int64)
+        counts = np.concatenate([doc.counts for doc in self.documents]) if self.documents else np.empty(0)
+        self.A_tf = csc_matrix((counts.astype(np.float64), term_ids, indptr), shape=(n_terms, len(self.documents)))
+
+        A_idf = csc_matrix(self.A_tf.multiply(idf_vector[:, None]))
+        self.doc_norms = np.sqrt(np.asarray(A_idf.power(2).sum(axis=0)).ravel())
+        inv_norms = np.zeros_like(self.doc_norms)
+        inv_norms[self.doc_norms > 1e-9] = 1.0 / self.doc_norms[self.doc_norms > 1e-9]
+        self.A_idf = A_idf
+        self.A_normalized = csc_matrix(A_idf @ diags(inv_norms))
+        self._svd_rows = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def linear_scores(self, Q_normalized):
+        """
+        Cosine scores (queries x delta documents) of L2-normalized query rows.
+        """
+        return np.asarray((Q_normalized @ self.A_normalized).todense()).reshape(Q_normalized.shape[0], len(self))
+
+    def svd_scores(self, key, svd_components, q_units):
+        """
+        Scores (queries x delta documents) in the LSI space of svd_components.
+        Delta documents are folded in once per key (store version and rank).
+        """
+        cached = self._svd_rows.get(key)
+        if cached is None:
+            term_embeddings = svd_components['term_embeddings']
+            rows = np.asarray(self.A_idf.T @ term_embeddings, dtype=np.float32)
+            inv_norms = np.zeros(rows.shape[0], dtype=np.float32)
+            norms = np.linalg.norm(rows, axis=1)
+            inv_norms[norms > 1e-9] = 1.0 / norms[norms > 1e-9]
+            cached = self._svd_rows[key] = (rows, inv_norms)
+        rows, inv_norms = cached
+        return (rows @ q_units.T).T * inv_norms
+
+def rank_live(main_indices, main_scores, tombstones, delta_scores, n_main, limit, offset=0, threshold=0.0):
+    """
+    Ranks [offset, offset + limit) of main candidates (without tombstoned
+    documents) together with the scored delta documents.
+    """
+    if tombstones is not None:
+        keep = ~tombstones[main_indices]
+        main_indices, main_scores = main_indices[keep], main_scores[keep]
+    indices = np.concatenate([np.asarray(main_indices, dtype=np.int64), n_main + np.arange(delta_scores.size)])
+    scores = np.concatenate([np.asarray(main_scores, dtype=np.float64), delta_scores])
+    # topk breaks ties by candidate position, which must follow the document order
+    order = np.argsort(indices, kind='stable')
+    positions, top_scores = topk.top_k(scores[order], limit, offset=offset, threshold=threshold)
+    return indices[order][positions], top_scores
+
+class LiveIndex:
+    """
+    Live changes on top of a main index (see index_store.load_index).
+
+    prepare_merge(new_index, changed_doc_ids) runs in the merge thread before
+    the swap, with the ids of the merged delta documents (added, replaced or
+    re-added articles), and may return anything (e.g. a folded SVD store);
+    install_merge(new_index, snippets, prepared) is called while no request is
+    running and installs the result.
+    check_writable() returns None, or the reason why changes are refused (e.g.
+    other server processes that would not see them); it runs under the lock of
+    the index directory together with the database write.
+    """
+    def __init__(self, index, snippets, term_to_index, db_path, table_name, index_dir, rw_lock,
+                 prepare_merge=None, install_merge=None, check_writable=None,
+                 merge_delta_docs=MERGE_DELTA_DOCS, merge_tombstones=MERGE_TOMBSTONES):
+        self.term_to_index = term_to_index
+        self.db_path = db_path
+        self.table_name = table_name
+        self.index_dir = index_dir
+        self.rw_lock = rw_lock
+        self.prepare_merge = prepare_merge
+        self.install_merge = install_merge
+        self.check_writable = check_writable
+        self.merge_delta_docs = merge_delta_docs
+        self.merge_tombstones = merge_tombstones
+
+        self._lock = threading.Lock() # Serializes changes (and their database writes)
+        # Database fingerprint of the state the main index and the delta describe,
+        # None once another process changed the database (see _write_database)
+        self._source = index.get('source')
+        self._seq = 0
+        self._deleted_during_merge = None
+        self._set_main(index, snippets)
+        self.delta = DeltaSegment((), self.main['idf_vector'])
+        self.generation = 0 # Incremented by every change, part of the result cache version
+        self.merges = 0
+        self.last_merge_seconds = None
+
+        self._merge_requested = threading.Event()
+        self._merging = False
+        self._start_merge_thread()
+
+    def _start_merge_thread(self):
+        # Threads do not survive a fork; a forked worker starts its own on the first merge request
+        self._pid = os.getpid()
+        threading.Thread(target=self._merge_loop, name='live-index-merge', daemon=True).start()
+
+    def _set_main(self, index, snippets):
+        self.main = index
+        self.snippets = snippets
+        # Database ids are found by binary search in the (memory-mapped) ids of the index;
+        # a sorted copy is made only when they are not in ascending order
+        doc_ids = index['doc_ids']
+        if np.all(doc_ids[1:] > doc_ids[:-1]):
+            self._main_order, self._main_sorted_ids = None, doc_ids
+        else:
+            self._main_order = np.argsort(doc_ids, kind='stable')
+            self._main_sorted_ids = np.asarray(doc_ids)[self._main_order]
+        self.tombstones = np.zeros(len(doc_ids), dtype=bool)
+        self.n_tombstones = 0
+
+    def main_position(self, doc_id):
+        """
+        Position of a database id in the main index, or None.
+        """
+        position = int(np.searchsorted(self._main_sorted_ids, doc_id))
+        if position == len(self._main_sorted_ids) or self._main_sorted_ids[position] != doc_id:
+            return None
+        return position if self._main_order is None else int(self._main_order[position])
+
+    # --- Changes ---
+    def _write_database(self, write):
+        """
+        Runs write(conn) in a transaction. The database is fingerprinted before
+        and after under the lock of the index directory, which other servers
+        and builds also take, so the fingerprints see this change only.
+        Raises LiveUpdateError if check_writable refuses the change.
+        """
+        with index_store.build_lock(self.index_dir):
+            reason = self.check_writable() if self.check_writable else None
+            if reason is not None:
+                raise LiveUpdateError(reason)
+            if self._source is not None and index_store.database_fingerprint(self.db_path, self.table_name) != self._source:
+                print("Warning: The database was changed by another process. Merged index artifacts will not be marked fresh.")
+                self._source = None
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                with conn:
+                    result = write(conn)
+            finally:
+                conn.close()
+            if self._source is not None:
+                self._source = index_store.database_fingerprint(self.db_path, self.table_name)
+        return result
+
+    def _vectorize(self, tokens):
+        word_counts = {}
+        for token in tokens:
+            term_idx = self.term_to_index.get(token)
+            if term_idx is not None:
+                word_counts[term_idx] = word_counts.get(term_idx, 0) + 1
+        term_ids = np.fromiter(sorted(word_counts), dtype=np.int64, count=len(word_counts))
+        counts = np.fromiter((word_counts[term_idx] for term_idx in term_ids.tolist()), dtype=np.int64, count=len(word_counts))
+        return term_ids, counts
+
+    def _contains(self, doc_id):
+        if doc_id in self.delta.position:
+            return True
+        doc_idx = self.main_position(doc_id)
+        return doc_idx is not None and not self.tombstones[doc_idx]
+
+    def _without(self, doc_id):
+        """
+        (delta documents, tombstones, number of tombstones) once doc_id is gone.
+        """
+        documents = [doc for doc in self.delta.documents if doc.doc_id != doc_id]
+        tombstones, n_tombstones = self.tombstones, self.n_tombstones
+        doc_idx = self.main_position(doc_id)
+        if doc_idx is not None and not tombstones[doc_idx]:
+            tombstones = tombstones.copy()
+            tombstones[doc_idx] = True
+            n_tombstones += 1
+        if self._deleted_during_merge is not None:
+            self._deleted_during_merge.append(doc_id)
+        return documents, tombstones, n_tombstones
+
+    def _swap(self, documents, tombstones, n_tombstones):
+        delta = DeltaSegment(documents, self.main['idf_vector'])
+        with self.rw_lock.writing():
+            self.delta = delta
+            self.tombstones = tombstones
+            self.n_tombstones = n_tombstones
+            self.generation += 1
+        if len(delta) >= self.merge_delta_docs or n_tombstones >= self.merge_tombstones:
+            self.request_merge()
+
+    def add_document(self, title, link, content, doc_id=None):
+        """
+        Stores the article and makes it searchable. With doc_id, an existing
+        article is replaced. Returns the database id of the article.
+        """
+        tokens = text_analyzer.analyze(content)
+        term_ids, counts = self._vectorize(tokens)
+        parsed_content = ' '.join(tokens) # Same as text_analyzer.clean_text(content)
+        vector = term_vectors.encode(term_ids, counts)
+        def write(conn):
+            if doc_id is None:
+                cursor = conn.execute(f"""
+                    INSERT INTO {self.table_name} (vector, link, title, content, parsed_content) VALUES (?, ?, ?, ?, ?)
+                """, (vector, link, title, content, parsed_content))
+                return cursor.lastrowid
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {self.table_name} (id, vector, link, title, content, parsed_content) VALUES (?, ?, ?, ?, ?, ?)
+            """, (doc_id, vector, link, title, content, parsed_content))
+            return doc_id
+
+        with self._lock:
+            doc_id = self._write_database(write)
+            documents, tombstones, n_tombstones = self._without(doc_id)
+            self._seq += 1
+            documents.append(LiveDocument(self._seq, doc_id, link, title, content[:snippet_store.SNIPPET_MAX_LENGTH],
+                                          len(content), term_ids, counts))
+            self._swap(documents, tombstones, n_tombstones)
+        return doc_id
+
+    def delete_document(self, doc_id):
+        """
+        Removes the article. Returns False if there is no such article.
+        """
+        with self._lock:
+            if not self._contains(doc_id):
+                return False
+            self._write_database(lambda conn: conn.execute(f"DELETE FROM {self.table_name} WHERE id = ?", (doc_id,)))
+            self._swap(*self._without(doc_id))
+        return True
+
+    # --- Lookups (called by requests, under rw_lock.reading()) ---
+    def document(self, doc_idx):
+        """
+        (link, title) of a delta document given by its result position.
+        """
+        doc = self.delta.documents[doc_idx - self.tombstones.size]
+        return doc.link, doc.title
+
+    def summary(self, doc_idx, snippet_length):
+        doc = self.delta.documents[doc_idx - self.tombstones.size]
+        return snippet_store.summarize(doc.snippet, doc.content_length, snippet_length)
+
+    def has_changes(self):
+        return len(self.delta) > 0 or self.n_tombstones > 0
+
+    # --- Merging ---
+    def request_merge(self):
+        if self._pid != os.getpid():
+            self._start_merge_thread()
+        self._merge_requested.set()
+
+    def _merge_loop(self):
+        while True:
+            self._merge_requested.wait()
+            self._merge_requested.clear()
+            try:
+                self.merge()
+            except Exception as e:
+                print(f"An error occurred while merging live changes: {e}")
+
+    def merge(self):
+        """
+        Builds a new main index from the main documents that were not deleted
+        and the delta, saves it as the index artifact and swaps it in.
+        Changes made meanwhile are carried over to the new delta and tombstones.
+        """
+        with self._lock:
+            if not self.has_changes():
+                return False
+            main, snippets, delta, tombstones = self.main, self.snippets, self.delta, self.tombstones
+            merged_seq = self._seq
+            source = self._source
+            self._deleted_during_merge = []
+            self._merging = True
+
+        try:
+            started = time.perf_counter()
+            print(f"Merging {len(delta)} new and {int(tombstones.sum())} deleted documents into the index...")
+            kept = np.flatnonzero(~tombstones)
+            A_tf = csc_matrix(hstack([main_tf(main)[:, kept], delta.A_tf], format='csc'))
+            doc_ids = np.concatenate([np.asarray(main['doc_ids'], dtype=np.int64)[kept], delta.doc_ids])
+            links = document_store.concat([document_store.take(main['links'], kept),
+                                           document_store.string_column([doc.link for doc in delta.documents])])
+            titles = document_store.concat([document_store.take(main['titles'], kept),
+                                            document_store.string_column([doc.title for doc in delta.documents])])
+            new_index = index_store.build_index_from_tf(main['dictionary'], doc_ids, links, titles, A_tf)
+
+            # The artifact describes the database as of the start of the merge; later changes make it stale.
+            # Live writes fingerprint the database under the same lock, so _source does not change while it
+            # is held: if the database differs from it, another process wrote articles this one does not have,
+            # and the artifact is saved without a source (rebuilt from the database at the next start).
+            new_snippets = None
+            with index_store.build_lock(self.index_dir):
+                if self._source is None or index_store.database_fingerprint(self.db_path, self.table_name) != self._source:
+                    if self._source is not None:
+                        print("Warning: The database was changed by another process. The merged index artifact is not marked fresh.")
+                    self._source = source = None
+                try:
+                    index_store.save_index(new_index, self.index_dir, source=source)
+                    saved = index_store.load_index(self.index_dir)
+                    if saved is not None:
+                        new_index = saved
+                except OSError as e:
+                    print(f"Warning: Could not save the merged index artifact, keeping it in memory only: {e}")
+                if snippets is not None:
+                    new_snippets = merge_snippets(snippets, kept, delta, self.index_dir, doc_ids, source=source)
+            prepared = self.prepare_merge(new_index, delta.doc_ids) if self.prepare_merge else None
+
+            with self._lock:
+                documents = [doc for doc in self.delta.documents if doc.seq > merged_seq]
+                deleted = self._deleted_during_merge
+                delta = DeltaSegment(documents, new_index['idf_vector'])
+                with self.rw_lock.writing():
+                    self._set_main(new_index, new_snippets)
+                    for doc_id in deleted:
+                        doc_idx = self.main_position(doc_id)
+                        if doc_idx is not None and not self.tombstones[doc_idx]:
+                            self.tombstones[doc_idx] = True
+                            self.n_tombstones += 1
+                    self.delta = delta
+                    self.generation += 1
+                    if self.install_merge:
+                        self.install_merge(new_index, new_snippets, prepared)
+        finally:
+            with self._lock:
+                self._deleted_during_merge = None
+                self._merging = False
+
+        self.merges += 1
+        self.last_merge_seconds = time.perf_counter() - started
+        print(f"Merged live changes in {self.last_merge_seconds:.1f} s: {new_index['A_normalized'].shape[1]} documents.")
+        return True
+
+    def stats(self):
+        return {
+            'delta_docs': len(self.delta),
+            'tombstones': self.n_tombstones,
+            'merging': self._merging,
+            'merges': self.merges,
+            'last_merge_seconds': self.last_merge_seconds,
+        }
+
+def main_tf(index):
+    """
+    TF matrix of the main index, with float counts like the delta's.
+    """
+    A_tf = index['A_tf']
+    return csc_matrix((np.asarray(A_tf.data, dtype=np.float64), A_tf.indices, A_tf.indptr), shape=A_tf.shape)
+
+def merge_snippets(snippets, kept, delta, index_dir, doc_ids, source=None):
+    """
+    Writes the snippet file for the merged documents and maps it. source is
+    recorded as for the merged index artifact.
+    """
+    text, offsets = snippets['text'], snippets['offsets']
+    max_length = snippets['max_length']
+    encoded = [text[offsets[doc_idx]:offsets[doc_idx + 1]].tobytes() for doc_idx in kept.tolist()]
+    encoded += [doc.snippet[:max_length].encode('utf-8') for doc in delta.documents]
+    new_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    new_offsets[1:] = np.cumsum([len(data) for data in encoded])
+    content_lengths = np.concatenate([np.asarray(snippets['content_lengths'], dtype=np.int64)[kept],
+                                      np.array([doc.content_length for doc in delta.documents], dtype=np.int64)])
+    try:
+        snippet_store.save_snippets(index_dir, doc_ids, b''.join(encoded), new_offsets, content_lengths, max_length=max_length,
+                                    source=source)
+    except OSError as e:
+        print(f"Warning: Could not save the merged snippet file: {e}")
+        return None
+    return snippet_store.load_snippets(index_dir, doc_ids)
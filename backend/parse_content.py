@@ -1,89 +1,94 @@
 import sqlite3
-import re
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
 import nltk
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+from text_analyzer import clean_text  # Wspólny analizator tekstu (również dla zapytań w app.py)
 
-# Pobranie wymaganych zasobów NLTK (wykonaj raz)
-nltk.download('wordnet')
-nltk.download('stopwords')
-nltk.download('omw-1.4')
+# --- Konfiguracja ---
+DATABASE = 'database.db'
+TABLE = 'articles'
+RANGE_SIZE = 2000 # Liczba wierszy (zakres rowid) przetwarzana przez jedno zadanie
+COMMIT_EVERY = 10 # Zatwierdzenie zmian i punktu kontrolnego co tyle zakresów
+WORKERS = os.cpu_count() or 1
+CHECKPOINT_TABLE = 'preprocessing_checkpoint'
+CHECKPOINT_NAME = 'parse_content'
 
-def clean_text(text):
-    """Funkcja czyszcząca tekst z wszystkich niepożądanych elementów"""
-    if not text:
-        return ""
-    
-    # Usunięcie wszystkich tagów HTML i szablonów (w każdej formie)
-    text = re.sub(r'&lt;.*?&gt;', '', text)  # Usuwa tagi HTML zapisane jako encje
-    text = re.sub(r'<.*?>', '', text)       # Usuwa zwykłe tagi HTML
-    text = re.sub(r'\{\{.*?\}\}', '', text) # Usuwa szablony wiki
-    text = re.sub(r'\[\[.*?\]\]', '', text) # Usuwa linki wiki
-    
-    # Usunięcie wzorów matematycznych (formula_XX, formulaXX, (formula XX) itp.)
-    text = re.sub(r'formula[_ ]?\d+', '', text)
-    text = re.sub(r'\(formula[^)]*\)', '', text)
-    
-    # Usunięcie pozostałych artefaktów po wzorach
-    text = re.sub(r'oc\+sc', '', text)
-    text = re.sub(r'oc sc', '', text)
-    
-    # Usunięcie znaków specjalnych, cyfr i nadmiarowych spacji
-    text = re.sub(r'[^a-zA-Z\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Zmiana na małe litery
-    text = text.lower()
-    
-    # Tokenizacja
-    tokens = text.split()
-    
-    # Usunięcie stop words i bardzo krótkich słów
-    stop_words = set(stopwords.words('english'))
-    tokens = [token for token in tokens 
-              if token not in stop_words 
-              and len(token) > 2
-              and not token.isdigit()]
-    
-    # Lematyzacja
-    lemmatizer = WordNetLemmatizer()
-    tokens = [lemmatizer.lemmatize(token) for token in tokens]
-    
-    # Filtrowanie pozostałych niechcianych słów
-    unwanted_words = {'see', 'also', 'references', 'history', 'value', 'term'}
-    tokens = [token for token in tokens if token not in unwanted_words]
+# --- Procesy robocze ---
+def clean_rows(rows):
+    """Czyści treść artykułów; zwraca [(parsed_content, id), ...] gotowe dla executemany"""
+    return [(clean_text(content), id) for id, content in rows]
 
-    print(f"Przetworzono tekst: {text[:30]}...")  # Debugging output
-    
-    return ' '.join(tokens)
+# --- Punkt kontrolny ---
+def read_checkpoint(conn):
+    # Tworzy tabelę punktów kontrolnych przy pierwszym uruchomieniu
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (name TEXT PRIMARY KEY, last_rowid INTEGER)")
+    row = conn.execute(f"SELECT last_rowid FROM {CHECKPOINT_TABLE} WHERE name = ?", (CHECKPOINT_NAME,)).fetchone()
+    return row[0] if row else 0
 
-def process_database(db_path='database.db'):
-    """Funkcja przetwarzająca całą bazę danych"""
+def write_checkpoint(conn, last_rowid):
+    conn.execute(f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, last_rowid) VALUES (?, ?)", (CHECKPOINT_NAME, last_rowid))
+
+def process_database(db_path=DATABASE, workers=WORKERS, restart=False):
+    """
+    Funkcja przetwarzająca całą bazę danych: zakresy rowid są czyszczone równolegle,
+    wyniki zapisywane paczkami (executemany). Punkt kontrolny jest zatwierdzany razem
+    z danymi, więc po przerwaniu przetwarzanie wznawia się od ostatniego zakresu.
+    """
+    conn = None
     try:
-        # Połączenie z bazą danych
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Pobranie wszystkich artykułów
-        cursor.execute("SELECT id, content FROM articles")
-        articles = cursor.fetchall()
-        
-        # Przetworzenie każdego artykułu
-        for article in articles:
-            id, content = article
-            parsed_content = clean_text(content)
-            
-            # Aktualizacja rekordu
-            cursor.execute("""
-                UPDATE articles 
-                SET parsed_content = ? 
-                WHERE id = ?
-            """, (parsed_content, id))
-            
-        # Zatwierdzenie zmian i zamknięcie połączenia
-        conn.commit()
-        print(f"Przetworzono {len(articles)} artykułów.")
-        
+        conn = sqlite3.connect(db_path, timeout=60)
+        start_rowid = read_checkpoint(conn)
+        if restart:
+            start_rowid = 0
+        max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {TABLE}").fetchone()[0] or 0
+        if start_rowid >= max_rowid:
+            print("Wszystkie artykuły są już przetworzone.")
+            return
+        if start_rowid:
+            print(f"Wznawianie od rowid {start_rowid}.")
+
+        ranges = iter([(start, min(start + RANGE_SIZE, max_rowid)) for start in range(start_rowid, max_rowid, RANGE_SIZE)])
+        processed = 0
+        done = 0
+        started = time.perf_counter()
+
+        # Odczyt i zapis odbywają się w jednym połączeniu (bez blokad między procesami),
+        # procesy robocze dostają gotowe wiersze; w toku jest najwyżej 2 * workers zakresów
+        with Pool(workers) as pool:
+            pending = deque()
+
+            def submit_next():
+                rowid_range = next(ranges, None)
+                if rowid_range is None:
+                    return False
+                rows = conn.execute(
+                    f"SELECT id, content FROM {TABLE} WHERE rowid > ? AND rowid <= ?", rowid_range
+                ).fetchall()
+                pending.append((rowid_range[1], pool.apply_async(clean_rows, (rows,))))
+                return True
+
+            while len(pending) < 2 * workers and submit_next():
+                pass
+
+            # Zakresy są zapisywane w kolejności, więc punkt kontrolny rośnie monotonicznie
+            while pending:
+                end, result = pending.popleft()
+                updates = result.get()
+                conn.executemany(f"UPDATE {TABLE} SET parsed_content = ? WHERE id = ?", updates)
+                processed += len(updates)
+                done += 1
+                submit_next()
+                if done % COMMIT_EVERY == 0 or not pending:
+                    write_checkpoint(conn, end)
+                    conn.commit()
+                    rate = processed / (time.perf_counter() - started)
+                    print(f"Przetworzono {processed} artykułów (do rowid {end}/{max_rowid}, {rate:.0f} art./s).")
+
+        print(f"Przetworzono {processed} artykułów.")
+
     except sqlite3.Error as e:
         print(f"Błąd SQLite: {e}")
     except Exception as e:
@@ -93,4 +98,10 @@ def process_database(db_path='database.db'):
             conn.close()
 
 if __name__ == "__main__":
-    process_database()
\ No newline at end of file
+    # Pobranie wymaganych zasobów NLTK (wykonaj raz)
+    nltk.download('wordnet')
+    nltk.download('stopwords')
+    nltk.download('omw-1.4')
+
+    # --restart: przetworzenie wszystkich artykułów od nowa
+    process_database(restart='--restart' in sys.argv[1:])
@@ -0,0 +1,262 @@
+import numpy as np
+import joblib
+import os
+import sys
+import time
+import svd_store
+import topk
+
+# Compressed SVD document vectors with exact re-ranking:
+# - int8: per-dimension symmetric scalar quantization of the store's embeddings (4x smaller, serves every k)
+# - pq: product quantization of the unit rank-k vectors, 256 centroids per subvector (16x smaller at 4 dims/subvector)
+# Queries stay in float32 (asymmetric scoring); the approximate shortlist is re-scored
+# against the full-precision embeddings, of which only the shortlisted rows are read.
+
+# --- Configuration ---
+SVD_OUTPUT_DIR = 'svd_components'
+QUANTIZATION_FORMAT_VERSION = 2
+INT8_FILENAME = 'doc_embeddings_int8.joblib'
+PQ_RANKS = [300] # Ranks to build PQ codes for when run as a script
+PQ_SUBVECTOR_DIM = 4
+PQ_CENTROIDS = 256
+PQ_TRAIN_SAMPLE = 50000
+PQ_KMEANS_ITERATIONS = 15
+RERANK_FACTOR = 10 # Shortlist size relative to offset + limit
+SCORE_CHUNK = 16384 # Documents quantized at a time when building codes
+INT8_RANK_BLOCK = 64 # int8 codes widened to float32 at a time when scoring: ranks x documents (1 MB)
+INT8_DOC_BLOCK = 4096
+
+def pq_filename(output_dir, k):
+    return os.path.join(output_dir, f'pq_k_{k}.joblib')
+
+# --- Scalar (int8) quantization ---
+def build_int8(store, source=None):
+    embeddings = store['doc_embeddings']
+    max_abs = np.zeros(embeddings.shape[1], dtype=np.float32)
+    for start in range(0, embeddings.shape[0], SCORE_CHUNK):
+        np.maximum(max_abs, np.abs(embeddings[start:start + SCORE_CHUNK]).max(axis=0), out=max_abs)
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+
+    # Codes are stored rank-major (k_max x N), so the first k ranks of every document are one contiguous block
+    codes = np.empty(embeddings.shape[::-1], dtype=np.int8)
+    for start in range(0, embeddings.shape[0], SCORE_CHUNK):
+        codes[:, start:start + SCORE_CHUNK] = np.rint(embeddings[start:start + SCORE_CHUNK] / scales).T
+
+    return {
+        'format_version': QUANTIZATION_FORMAT_VERSION,
+        'method': 'int8',
+        'source': source,
+        'scales': scales,
+        'codes': codes,
+    }
+
+def int8_scores(quantized, q_unit, doc_inv_norms):
+    """
+    Scores of all documents from the int8 codes. Blocks of INT8_RANK_BLOCK x
+    INT8_DOC_BLOCK codes are widened into a small float32 buffer that stays in
+    cache, so the scan reads 1 byte per code from memory instead of the 4 of the
+    float32 embeddings, and no float copy of the whole N x k block is made.
+    """
+    k = q_unit.shape[0]
+    codes = quantized['codes']
+    n_docs = codes.shape[1]
+    q_scaled = (q_unit * quantized['scales'][:k]).astype(np.float32)
+    scores = np.zeros(n_docs, dtype=np.float32)
+    block = np.empty((min(k, INT8_RANK_BLOCK), INT8_DOC_BLOCK), dtype=np.float32)
+    partial = np.empty(INT8_DOC_BLOCK, dtype=np.float32)
+    for start in range(0, n_docs, INT8_DOC_BLOCK):
+        end = min(start + INT8_DOC_BLOCK, n_docs)
+        for rank in range(0, k, INT8_RANK_BLOCK):
+            rank_end = min(rank + INT8_RANK_BLOCK, k)
+            widened = block[:rank_end - rank, :end - start]
+            np.copyto(widened, codes[rank:rank_end, start:end], casting='unsafe')
+            np.dot(q_scaled[rank:rank_end], widened, out=partial[:end - start])
+            scores[start:end] += partial[:end - start]
+    scores *= doc_inv_norms
+    return scores
+
+# --- Product quantization ---
+def _pad(X, n_subvectors):
+    padding = n_subvectors * PQ_SUBVECTOR_DIM - X.shape[-1]
+    if padding == 0:
+        return X
+    pad_width = [(0, 0)] * (X.ndim - 1) + [(0, padding)]
+    return np.pad(X, pad_width)
+
+def _nearest_centroids(X, centroids):
+    # argmin ||x - c||^2 = argmin ||c||^2 - 2 x.c
+    return np.argmin((centroids * centroids).sum(axis=1) - 2 * (X @ centroids.T), axis=1)
+
+def _train_codebook(X, rng):
+    centroids = X[rng.choice(X.shape[0], min(PQ_CENTROIDS, X.shape[0]), replace=False)].copy()
+    for _ in range(PQ_KMEANS_ITERATIONS):
+        assignments = _nearest_centroids(X, centroids)
+        counts = np.bincount(assignments, minlength=centroids.shape[0])
+        sums = np.stack([np.bincount(assignments, weights=X[:, d], minlength=centroids.shape[0])
+                         for d in range(X.shape[1])], axis=1)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    if centroids.shape[0] < PQ_CENTROIDS:
+        centroids = np.vstack([centroids, np.zeros((PQ_CENTROIDS - centroids.shape[0], X.shape[1]), dtype=centroids.dtype)])
+    return centroids
+
+def build_pq(store, k, seed=0, source=None):
+    view = svd_store.rank_view(store, k)
+    embeddings, inv_norms = view['doc_embeddings'], view['doc_inv_norms']
+    n_docs = embeddings.shape[0]
+    n_subvectors = -(-k // PQ_SUBVECTOR_DIM)
+    rng = np.random.default_rng(seed)
+
+    sample_ids = np.sort(rng.choice(n_docs, min(n_docs, PQ_TRAIN_SAMPLE), replace=False))
+    sample = _pad(embeddings[sample_ids] * inv_norms[sample_ids, None], n_subvectors)
+    sample = sample.reshape(len(sample_ids), n_subvectors, PQ_SUBVECTOR_DIM)
+    print(f"Training PQ codebooks for k={k} ({n_subvectors} subvectors x {PQ_CENTROIDS} centroids)...")
+    codebooks = np.stack([_train_codebook(sample[:, j], rng) for j in range(n_subvectors)]).astype(np.float32)
+
+    # Codes are stored subvector-major, so scoring reads one contiguous row per subvector
+    codes = np.empty((n_subvectors, n_docs), dtype=np.uint8)
+    for start in range(0, n_docs, SCORE_CHUNK):
+        end = min(start + SCORE_CHUNK, n_docs)
+        unit_vectors = _pad(embeddings[start:end] * inv_norms[start:end, None], n_subvectors)
+        unit_vectors = unit_vectors.reshape(end - start, n_subvectors, PQ_SUBVECTOR_DIM)
+        for j in range(n_subvectors):
+            codes[j, start:end] = _nearest_centroids(unit_vectors[:, j], codebooks[j])
+
+    return {
+        'format_version': QUANTIZATION_FORMAT_VERSION,
+        'method': 'pq',
+        'k': k,
+        'source': source,
+        'codebooks': codebooks,
+        'codes': codes,
+    }
+
+def pq_scores(quantized, q_unit):
+    """
+    Asymmetric distance computation: one lookup table of query/centroid
+    dot products per subvector, summed over the document codes.
+    """
+    codebooks, codes = quantized['codebooks'], quantized['codes']
+    q_sub = _pad(q_unit, codebooks.shape[0]).reshape(codebooks.shape[0], PQ_SUBVECTOR_DIM)
+    lookup = np.einsum('jcd,jd->jc', codebooks, q_sub)
+    scores = np.zeros(codes.shape[1], dtype=np.float32)
+    for j in range(codes.shape[0]):
+        scores += lookup[j][codes[j]]
+    return scores
+
+# --- Search ---
+def search(quantized, svd_components, q_unit, limit, offset=0, threshold=0.0, rerank_factor=RERANK_FACTOR):
+    """
+    Approximate scores from the codes, then exact re-ranking of a shortlist
+    of rerank_factor * (offset + limit) documents.
+    """
+    if quantized['method'] == 'int8':
+        approx_scores = int8_scores(quantized, q_unit, svd_components['doc_inv_norms'])
+    else:
+        approx_scores = pq_scores(quantized, q_unit)
+
+    shortlist, _ = topk.top_k(approx_scores, rerank_factor * (offset + limit), threshold=-np.inf)
+    shortlist = np.sort(shortlist)
+    exact_scores = (svd_components['doc_embeddings'][shortlist] @ q_unit) * svd_components['doc_inv_norms'][shortlist]
+    positions, scores = topk.top_k(exact_scores, limit, offset=offset, threshold=threshold)
+    return shortlist[positions], scores
+
+def resident_bytes(quantized):
+    return quantized['codes'].nbytes
+
+# --- I/O ---
+def save_quantized(quantized, output_dir=SVD_OUTPUT_DIR):
+    filename = os.path.join(output_dir, INT8_FILENAME) if quantized['method'] == 'int8' else pq_filename(output_dir, quantized['k'])
+    joblib.dump(quantized, filename + '.tmp')
+    os.replace(filename + '.tmp', filename)
+    print(f"Saved {quantized['method']} codes to {filename} ({resident_bytes(quantized) / 2**20:.1f} MB).")
+
+def load_quantized(output_dir, method, k, mmap=True):
+    """
+    Loads int8 codes (any k) or PQ codes for rank k. Returns None when they
+    are missing or were built from another SVD store.
+    """
+    filename = os.path.join(output_dir, INT8_FILENAME) if method == 'int8' else pq_filename(output_dir, k)
+    if not os.path.exists(filename):
+        return None
+
+    quantized = joblib.load(filename, mmap_mode='r' if mmap else None)
+    if quantized.get('format_version') != QUANTIZATION_FORMAT_VERSION:
+        print(f"Quantized codes {filename} have format v{quantized.get('format_version')}, expected v{QUANTIZATION_FORMAT_VERSION}.")
+        return None
+    if quantized.get('source') != svd_store.store_fingerprint(output_dir):
+        print(f"Quantized codes {filename} are stale (SVD store changed since they were built).")
+        return None
+    return quantized
+
+def measure_overlap(quantized, store, k, n_queries=200, at=10, seed=0):
+    """
+    Mean top-at overlap with the exact float32 scan, without and with re-ranking,
+    using random documents as queries.
+    """
+    view = svd_store.rank_view(store, k)
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(np.flatnonzero(view['doc_inv_norms'] > 0), n_queries, replace=False)
+
+    approx_hits = 0
+    reranked_hits = 0
+    for query_id in query_ids:
+        q_unit = view['doc_embeddings'][query_id] * view['doc_inv_norms'][query_id]
+        exact_scores = (view['doc_embeddings'] @ q_unit) * view['doc_inv_norms']
+        exact_ids = set(topk.top_k(exact_scores, at, threshold=-np.inf)[0].tolist())
+
+        approx_scores = int8_scores(quantized, q_unit, view['doc_inv_norms']) if quantized['method'] == 'int8' else pq_scores(quantized, q_unit)
+        approx_hits += len(exact_ids & set(topk.top_k(approx_scores, at, threshold=-np.inf)[0].tolist()))
+        reranked_hits += len(exact_ids & set(search(quantized, view, q_unit, at, threshold=-np.inf)[0].tolist()))
+
+    return approx_hits / (at * n_queries), reranked_hits / (at * n_queries)
+
+def measure_scan_time(quantized, store, k, n_queries=20, seed=0):
+    """
+    Mean milliseconds per query of the approximate scan and of the exact
+    float32 scan it replaces (both without re-ranking).
+    """
+    view = svd_store.rank_view(store, k)
+    rng = np.random.default_rng(seed)
+    queries = rng.standard_normal((n_queries, k)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    for q_unit in queries:
+        (view['doc_embeddings'] @ q_unit) * view['doc_inv_norms']
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    start = time.perf_counter()
+    for q_unit in queries:
+        int8_scores(quantized, q_unit, view['doc_inv_norms']) if quantized['method'] == 'int8' else pq_scores(quantized, q_unit)
+    approx_ms = (time.perf_counter() - start) * 1000 / n_queries
+    return approx_ms, exact_ms
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    ranks = [int(arg) for arg in sys.argv[1:]] or PQ_RANKS
+    store = svd_store.load_store(SVD_OUTPUT_DIR)
+    if store is None:
+        print("SVD store not found. Run generate_svd_files.py first.")
+        sys.exit(1)
+    source = svd_store.store_fingerprint(SVD_OUTPUT_DIR)
+    float32_bytes = store['doc_embeddings'].nbytes
+
+    int8 = build_int8(store, source=source)
+    save_quantized(int8, SVD_OUTPUT_DIR)
+    print(f"int8: {float32_bytes / resident_bytes(int8):.1f}x smaller than float32 embeddings")
+
+    for k in ranks:
+        if k > store['k_max']:
+            print(f"Skipping k={k}: the SVD store only has rank {store['k_max']}.")
+            continue
+        pq = build_pq(store, k, source=source)
+        save_quantized(pq, SVD_OUTPUT_DIR)
+        rank_float32_bytes = store['doc_embeddings'].shape[0] * k * 4
+        print(f"pq k={k}: {rank_float32_bytes / resident_bytes(pq):.1f}x smaller than float32 rank-{k} vectors")
+
+        for name, quantized in (('int8', int8), ('pq', pq)):
+            approx_overlap, reranked_overlap = measure_overlap(quantized, store, k)
+            print(f"  {name} k={k}: top-10 overlap {approx_overlap:.3f} approximate, {reranked_overlap:.3f} re-ranked")
+            approx_ms, exact_ms = measure_scan_time(quantized, store, k)
+            print(f"  {name} k={k}: scan {approx_ms:.1f} ms, exact float32 scan {exact_ms:.1f} ms")
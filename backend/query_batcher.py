@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Micro-batching of concurrent queries. Request threads hand their query to an
+# asyncio event loop running in a background thread. The loop collects queries
+# of the same group (e.g. linear search, SVD search at one rank) for a short
+# window or until the batch is full, and scores them with one call of
+# score_batch: one matrix-matrix product streams the index once for the whole
+# batch instead of once per query.
+
+# --- Configuration ---
+BATCH_WINDOW = 0.002 # Seconds a query waits for others to join its batch
+MAX_BATCH_SIZE = 64
+SCORING_THREADS = os.cpu_count() or 1 # Batches scored at the same time
+
+class QueryBatcher:
+    """
+    score_batch(group, queries) returns one result per query, in order.
+    """
+    def __init__(self, score_batch, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE, scoring_threads=SCORING_THREADS):
+        self.score_batch = score_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.scoring_threads = scoring_threads
+        self.batches = 0
+        self.queries = 0
+        self._start_lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._pending = {}
+        self._timers = {}
+        self._executor = ThreadPoolExecutor(self.scoring_threads, thread_name_prefix='query-batch')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='query-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, group, query):
+        """
+        Scores query together with concurrent queries of the same group.
+        Blocks the calling thread until its result (or exception) is ready.
+        """
+        if self._pid != os.getpid():
+            # Threads do not survive a fork: a forked worker runs its own loop
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+        return asyncio.run_coroutine_threadsafe(self._enqueue(group, query), self._loop).result()
+
+    async def _enqueue(self, group, query):
+        future = self._loop.create_future()
+        batch = self._pending.setdefault(group, [])
+        batch.append((query, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(group)
+        elif len(batch) == 1:
+            self._timers[group] = self._loop.call_later(self.window, self._flush, group)
+        return await future
+
+    def _flush(self, group):
+        batch = self._pending.pop(group, None)
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        if not batch:
+            return
+        self.batches += 1
+        self.queries += len(batch)
+        # Scoring runs in the thread pool; the loop meanwhile collects the next batches
+        self._loop.create_task(self._score(group, batch))
+
+    async def _score(self, group, batch):
+        try:
+            results = await self._loop.run_in_executor(self._executor, self.score_batch, group, [query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+        }
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown()
@@ -0,0 +1,76 @@
+import threading
+import json
+from collections import OrderedDict
+
+# LRU cache of final search results (with snippets) for repeated queries.
+# - keys are built from the analyzed query, so queries that differ only in
+#   case, punctuation, word forms or word order share an entry
+# - every entry records the version of the data it was computed from; an
+#   entry looked up with another version is dropped, so results of a
+#   replaced index or SVD store are never served
+# - the size of an entry is estimated from its JSON encoding
+
+def query_key(mode, query_tokens, **params):
+    """
+    Cache key for a query given as analyzed tokens. Term order does not
+    change the score of a bag-of-words query, term counts do.
+    """
+    return (mode, tuple(sorted(query_tokens)), tuple(sorted(params.items())))
+
+def entry_bytes(key, results):
+    return len(repr(key)) + len(json.dumps(results))
+
+class ResultCache:
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key, version):
+        """
+        Returns the cached results for key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] != version:
+                del self._entries[key]
+                self._resident_bytes -= entry[2]
+                self._invalidations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, version, results):
+        nbytes = entry_bytes(key, results)
+        if nbytes > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._resident_bytes -= previous[2]
+            self._entries[key] = (results, version, nbytes)
+            self._resident_bytes += nbytes
+            while self._resident_bytes > self._max_bytes:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._resident_bytes -= evicted_bytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'resident_bytes': self._resident_bytes,
+                'max_bytes': self._max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'invalidations': self._invalidations,
+            }
@@ -0,0 +1,386 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from scipy.sparse import csc_matrix
+import index_store
+import inverted_index
+from live_index import ReadWriteLock
+import snippet_store
+import svd_store
+import topk
+
+# Document-sharded search: the documents of the index artifact are split into
+# contiguous ranges, one per worker process. Every worker holds only its slice
+# of A_normalized (with its own postings) and of the SVD document embeddings,
+# so scoring runs on all cores and no process needs the whole collection in
+# memory. The coordinator sends each query to all shards and merges their top-k
+# lists; since shards are contiguous ranges, the merge is exact.
+# Shards report their document counts and term document frequencies; the
+# coordinator sums them into the global statistics (N, df, IDF) used for queries.
+# Requests carry an id and replies are matched to it, so queries of concurrent
+# requests are in flight on the shards at the same time.
+
+# --- Configuration ---
+SHARD_START_TIMEOUT = 600 # Seconds a shard may take to load its slice
+SHARD_QUERY_THREADS = 2 # Queries a shard scores at the same time
+
+class ShardError(Exception):
+    pass
+
+def shard_bounds(n_docs, n_shards):
+    return np.linspace(0, n_docs, n_shards + 1).astype(np.int64)
+
+# --- Worker process ---
+class _ShardWorker:
+    def __init__(self, svd_dir, shard, n_shards):
+        self.svd_dir = svd_dir
+        self.shard = shard
+        self.n_shards = n_shards
+        self.state = None
+        self.pending = None
+        self._svd_lock = threading.Lock() # Query threads share the cached SVD slice
+
+    def load(self, index_dir):
+        """
+        Reads the shard's document range of the index artifact into memory.
+        The rest of the artifact is only memory-mapped, never read.
+        """
+        manifest = index_store.read_manifest(index_dir)
+        if manifest is None or manifest.get('format_version') != index_store.INDEX_FORMAT_VERSION:
+            raise ShardError(f"No index artifact (format v{index_store.INDEX_FORMAT_VERSION}) in {index_dir}.")
+        arrays = {key: np.load(os.path.join(index_dir, index_store.ARRAY_FILES[key]), mmap_mode='r')
+                  for key in ('data', 'indices', 'indptr', 'doc_ids')}
+        n_terms, n_docs = manifest['shape']
+        lo, hi = shard_bounds(n_docs, self.n_shards)[self.shard:self.shard + 2].tolist()
+
+        indptr = np.asarray(arrays['indptr'][lo:hi + 1], dtype=np.int64)
+        A_shard = csc_matrix((np.array(arrays['data'][indptr[0]:indptr[-1]]), np.array(arrays['indices'][indptr[0]:indptr[-1]]),
+                              indptr - indptr[0]), shape=(n_terms, hi - lo))
+        postings = inverted_index.build_postings(A_shard)
+        self.pending = {
+            'lo': lo,
+            'hi': hi,
+            'postings': postings,
+            'doc_ids': np.array(arrays['doc_ids'][lo:hi], dtype=np.int64),
+            'svd': None,
+        }
+        return {
+            'lo': lo,
+            'hi': hi,
+            'n_docs': n_docs,
+            'df': np.diff(postings['indptr']),
+            'doc_ids': snippet_store.doc_ids_checksum(arrays['doc_ids']),
+        }
+
+    def activate(self):
+        if self.pending is None:
+            raise ShardError("No loaded index to activate.")
+        self.state, self.pending = self.pending, None
+
+    def linear_search(self, queries, limit, threshold):
+        state = self.state
+        results = []
+        for term_ids, weights in queries:
+            doc_indices, doc_scores = inverted_index.search(state['postings'], term_ids, weights, limit, threshold=threshold)
+            results.append((doc_indices.astype(np.int64) + state['lo'], doc_scores))
+        return results
+
+    def _svd_slice(self, state, store_version):
+        """
+        The shard's rows of the SVD store on disk, or None if the store is not
+        the expected version or does not cover the shard's documents.
+        """
+        svd = state['svd']
+        if svd is not None and svd['version'] == store_version:
+            return svd if svd['doc_embeddings'] is not None else None
+        # Unusable versions are remembered too, so the store is read once per version
+        state['svd'] = {'version': store_version, 'doc_embeddings': None}
+        store = svd_store.load_store(self.svd_dir, mmap=True) if store_version is not None else None
+        if store is None or svd_store.store_fingerprint(self.svd_dir) != store_version:
+            return None
+        lo, hi = state['lo'], state['hi']
+        if store['doc_embeddings'].shape[0] < hi:
+            return None
+        if store.get('doc_ids') is not None and not np.array_equal(store['doc_ids'][lo:hi], state['doc_ids']):
+            return None
+        svd = {
+            'version': store_version,
+            'doc_embeddings': np.array(store['doc_embeddings'][lo:hi]),
+            'doc_inv_norms': {k: np.array(inv_norms[lo:hi]) for k, inv_norms in store['doc_inv_norms'].items()},
+        }
+        state['svd'] = svd
+        return svd
+
+    def svd_search(self, q_units, k, limit, threshold, store_version):
+        state = self.state
+        with self._svd_lock:
+            svd = self._svd_slice(state, store_version)
+        if svd is None:
+            return None
+        doc_embeddings = svd['doc_embeddings'][:, :k]
+        doc_inv_norms = svd['doc_inv_norms'].get(k)
+        if doc_inv_norms is None:
+            doc_inv_norms = svd['doc_inv_norms'][k] = svd_store.inverse_norms(
+                np.sqrt(np.einsum('ij,ij->i', doc_embeddings, doc_embeddings, dtype=np.float64)))
+        scores = (doc_embeddings @ q_units.T).T
+        scores *= doc_inv_norms
+        results = []
+        for row in range(scores.shape[0]):
+            doc_indices, doc_scores = topk.top_k(scores[row], limit, threshold=threshold)
+            results.append((doc_indices + state['lo'], doc_scores))
+        return results
+
+def _control_loop(worker, control_conn):
+    # Reloads run here, next to the searches served by the main thread of the worker
+    while True:
+        try:
+            command, *args = control_conn.recv()
+        except EOFError:
+            return
+        try:
+            result = worker.load(*args) if command == 'load' else worker.activate()
+            control_conn.send(('ok', result))
+        except Exception as e:
+            control_conn.send(('error', f"{type(e).__name__}: {e}"))
+
+def _shard_main(search_conn, control_conn, index_dir, svd_dir, shard, n_shards):
+    worker = _ShardWorker(svd_dir, shard, n_shards)
+    try:
+        info = worker.load(index_dir)
+        worker.activate()
+    except Exception as e:
+        search_conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    search_conn.send(('ok', info))
+    threading.Thread(target=_control_loop, args=(worker, control_conn), daemon=True).start()
+
+    send_lock = threading.Lock()
+
+    def answer(request_id, command, args):
+        try:
+            result = worker.linear_search(*args) if command == 'linear' else worker.svd_search(*args)
+            reply = (request_id, 'ok', result)
+        except Exception as e:
+            reply = (request_id, 'error', f"{type(e).__name__}: {e}")
+        with send_lock:
+            search_conn.send(reply)
+
+    # Replies carry the request id, so queries may finish in any order
+    with ThreadPoolExecutor(SHARD_QUERY_THREADS, thread_name_prefix='shard-query') as executor:
+        while True:
+            try:
+                request_id, command, *args = search_conn.recv()
+            except EOFError:
+                return
+            if command == 'stop':
+                return
+            executor.submit(answer, request_id, command, args)
+
+# --- Coordinator ---
+def _receive(conn, timeout=None):
+    if timeout is not None and not conn.poll(timeout):
+        raise ShardError("Shard did not answer in time.")
+    try:
+        status, result = conn.recv()
+    except (EOFError, OSError) as e:
+        raise ShardError(f"Shard process is gone: {e}")
+    if status != 'ok':
+        raise ShardError(result)
+    return result
+
+def merge_rankings(shard_results, limit, offset=0, threshold=0.0):
+    """
+    Ranks [offset, offset + limit) of the union of per-shard top lists.
+    """
+    indices = np.concatenate([doc_indices for doc_indices, _ in shard_results])
+    scores = np.concatenate([doc_scores for _, doc_scores in shard_results])
+    # Ties are broken by document index, as in a single-process search
+    order = np.argsort(indices, kind='stable')
+    positions, top_scores = topk.top_k(scores[order], limit, offset=offset, threshold=threshold)
+    return indices[order][positions], top_scores
+
+class ShardedIndex:
+    """
+    Worker processes serving the documents of the index artifact in index_dir.
+    Each query runs on all shards at once; queries from several threads are
+    in flight together and their replies are matched by request id.
+    """
+    def __init__(self, index_dir, svd_dir, n_shards, doc_ids=None):
+        # Forked, so that the workers do not re-run the importing module (app.py loads data at import)
+        context = multiprocessing.get_context('fork')
+        self._pid = os.getpid()
+        self._activation = ReadWriteLock() # Queries read, activate() swaps the shards' index
+        self._control_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._pending_lock = threading.Lock()
+        self._workers = []
+        for shard in range(n_shards):
+            search_parent, search_child = context.Pipe()
+            control_parent, control_child = context.Pipe()
+            process = context.Process(target=_shard_main, name=f'search-shard-{shard}', daemon=True,
+                                      args=(search_child, control_child, index_dir, svd_dir, shard, n_shards))
+            process.start()
+            search_child.close()
+            control_child.close()
+            self._workers.append((process, search_parent, control_parent))
+
+        try:
+            self._set_statistics([_receive(conn, SHARD_START_TIMEOUT) for _, conn, _ in self._workers], doc_ids)
+        except ShardError:
+            self.close()
+            raise
+
+        # Per shard: futures of the requests waiting for its reply, the error that stopped it, a send lock
+        self._pending = [{} for _ in self._workers]
+        self._errors = [None] * n_shards
+        self._send_locks = [threading.Lock() for _ in self._workers]
+        for shard, (_, conn, _) in enumerate(self._workers):
+            threading.Thread(target=self._receive_replies, args=(shard, conn), name=f'search-shard-{shard}-replies',
+                             daemon=True).start()
+        print(f"Started {n_shards} search shards over {self.n_docs} documents.")
+
+    def _set_statistics(self, infos, doc_ids):
+        if doc_ids is not None and any(info['doc_ids'] != snippet_store.doc_ids_checksum(doc_ids) for info in infos):
+            raise ShardError(f"Index artifact does not contain the loaded documents.")
+        self.bounds = [(info['lo'], info['hi']) for info in infos]
+        self.n_docs = sum(hi - lo for lo, hi in self.bounds)
+        # Global statistics from the shards' local ones
+        self.df = np.sum([info['df'] for info in infos], axis=0)
+        self.idf_vector = np.zeros(self.df.shape[0])
+        self.idf_vector[self.df > 0] = np.log(self.n_docs / self.df[self.df > 0])
+
+    def _receive_replies(self, shard, conn):
+        while True:
+            try:
+                request_id, status, result = conn.recv()
+            except (EOFError, OSError) as e:
+                self._fail(shard, f"Shard process is gone: {e or 'connection closed'}")
+                return
+            with self._pending_lock:
+                future = self._pending[shard].pop(request_id, None)
+            if future is None:
+                continue
+            if status == 'ok':
+                future.set_result(result)
+            else:
+                future.set_exception(ShardError(result))
+
+    def _fail(self, shard, message):
+        with self._pending_lock:
+            if self._errors[shard] is None:
+                self._errors[shard] = message
+            waiting, self._pending[shard] = self._pending[shard], {}
+        for future in waiting.values():
+            future.set_exception(ShardError(message))
+
+    def _scatter_gather(self, message):
+        if self._pid != os.getpid():
+            raise ShardError("The shards belong to the process that started them, not to this forked one.")
+        with self._activation.reading():
+            request_id = next(self._request_ids)
+            futures = []
+            for shard, (_, conn, _) in enumerate(self._workers):
+                future = Future()
+                with self._pending_lock:
+                    if self._errors[shard] is not None:
+                        raise ShardError(self._errors[shard])
+                    self._pending[shard][request_id] = future
+                try:
+                    with self._send_locks[shard]:
+                        conn.send((request_id,) + message)
+                except (OSError, ValueError) as e:
+                    self._fail(shard, f"Shard process is gone: {e}")
+                futures.append(future)
+
+            results, error = [], None
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except ShardError as e:
+                    error = e
+            if error is not None:
+                raise error
+            return results
+
+    def linear_search(self, queries, limit, offset=0, threshold=0.0):
+        """
+        queries is a list of (term_ids, normalized weights). Returns a
+        (doc_indices, doc_scores) ranking per query.
+        """
+        shard_results = self._scatter_gather(('linear', queries, offset + limit, threshold))
+        return [merge_rankings([results[query] for results in shard_results], limit, offset, threshold)
+                for query in range(len(queries))]
+
+    def svd_search(self, q_units, k, limit, offset=0, threshold=0.0, store_version=None):
+        """
+        Rankings of the unit query vectors (rows of q_units) at rank k, or
+        None if the shards can not use the SVD store of store_version.
+        """
+        shard_results = self._scatter_gather(('svd', np.ascontiguousarray(q_units, dtype=np.float32), k, offset + limit,
+                                              threshold, store_version))
+        if any(results is None for results in shard_results):
+            return None
+        return [merge_rankings([results[query] for results in shard_results], limit, offset, threshold)
+                for query in range(q_units.shape[0])]
+
+    def _control(self, message):
+        with self._control_lock:
+            for _, _, conn in self._workers:
+                conn.send(message)
+            replies = []
+            for _, _, conn in self._workers:
+                try:
+                    replies.append(_receive(conn, SHARD_START_TIMEOUT))
+                except ShardError as e:
+                    replies.append(e)
+            return replies
+
+    def load(self, index_dir, doc_ids=None):
+        """
+        Loads a new index artifact next to the served one (searches continue
+        meanwhile). activate() switches to it.
+        """
+        replies = self._control(('load', index_dir))
+        errors = [reply for reply in replies if isinstance(reply, ShardError)]
+        if errors:
+            raise errors[0]
+        self._pending_infos = replies
+        if doc_ids is not None and any(info['doc_ids'] != snippet_store.doc_ids_checksum(doc_ids) for info in replies):
+            raise ShardError("Index artifact does not contain the merged documents.")
+
+    def activate(self):
+        # Waits for the queries in flight, so none of them mixes shards of the old and the new index
+        with self._activation.writing():
+            errors = [reply for reply in self._control(('activate',)) if isinstance(reply, ShardError)]
+            if errors:
+                raise errors[0]
+            self._set_statistics(self._pending_infos, None)
+
+    def close(self):
+        if self._pid != os.getpid():
+            # Inherited by a forked process: the shards keep serving the one that started them
+            self._workers = []
+            return
+        for process, search_conn, control_conn in self._workers:
+            try:
+                search_conn.send((None, 'stop'))
+            except (OSError, ValueError):
+                pass
+        # Closed after the workers exit, which also ends the threads receiving their replies
+        for process, _, _ in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for process, search_conn, control_conn in self._workers:
+            search_conn.close()
+            control_conn.close()
+        self._workers = []
+
+    def stats(self):
+        return {
+            'shards': len(self._workers),
+            'documents': [hi - lo for lo, hi in self.bounds],
+        }
@@ -0,0 +1,215 @@
+import sqlite3
+import queue
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import index_store
+
+# Result snippets without touching article content at query time:
+# - a compact snippet file holds the first SNIPPET_MAX_LENGTH characters of every
+#   document (UTF-8, offset-indexed by document index) and is memory-mapped
+# - without it, snippets are read from SQLite through pooled read-only
+#   connections, all ids of a request in one IN (...) query
+
+# --- Configuration ---
+DATABASE = 'database.db'
+TABLE = 'articles_180k'
+INDEX_DIR = 'index'
+SNIPPET_FORMAT_VERSION = 1
+SNIPPET_MAX_LENGTH = 200 # Longest snippet served by app.py
+SNIPPET_FETCH_CHUNK = 500 # Ids per IN (...) query
+SQLITE_POOL_SIZE = 16 # Idle connections kept open
+SQLITE_MMAP_SIZE = 256 * 1024**2
+SQLITE_CACHE_KIB = 64 * 1024
+
+MANIFEST_FILE = 'snippets.json'
+TEXT_FILE = 'snippets.bin'
+OFFSETS_FILE = 'snippet_offsets.npy'
+LENGTHS_FILE = 'content_lengths.npy'
+
+def summarize(snippet, content_length, snippet_length):
+    summary = snippet[:snippet_length]
+    if content_length > snippet_length:
+        summary += "..."
+    return summary
+
+def doc_ids_checksum(doc_ids):
+    return hashlib.sha1(np.ascontiguousarray(doc_ids, dtype=np.int64).tobytes()).hexdigest()
+
+# --- SQLite connections ---
+class ConnectionPool:
+    """
+    Reusable read-only connections. The development server starts a thread
+    per request, so connections are pooled rather than kept per thread:
+    a request borrows an idle connection and returns it when done.
+    """
+    def __init__(self, db_path, max_idle=SQLITE_POOL_SIZE):
+        self._db_path = db_path
+        self._max_idle = max_idle
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._pid = os.getpid()
+
+    def _connect(self):
+        conn = sqlite3.connect(f'file:{self._db_path}?mode=ro', uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only = ON')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KIB}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            # SQLite connections must not be shared with a forked process
+            self._idle, self._pid = queue.LifoQueue(maxsize=self._max_idle), os.getpid()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except Exception:
+            # A connection that failed is not reused
+            conn.close()
+            raise
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def fetch_snippets_from_db(pool, table_name, doc_db_ids, snippet_length):
+    """
+    Returns {db id: summary}, reading only the first snippet_length
+    characters (and the length) of every content.
+    """
+    summaries = {}
+    doc_db_ids = list(doc_db_ids)
+    with pool.connection() as conn:
+        for start in range(0, len(doc_db_ids), SNIPPET_FETCH_CHUNK):
+            chunk = doc_db_ids[start:start + SNIPPET_FETCH_CHUNK]
+            placeholders = ','.join(['?'] * len(chunk))
+            rows = conn.execute(
+                f"SELECT id, substr(content, 1, ?), length(content) FROM {table_name} WHERE id IN ({placeholders})",
+                [snippet_length] + chunk,
+            ).fetchall()
+            for doc_db_id, snippet, content_length in rows:
+                summaries[doc_db_id] = summarize(snippet or "", content_length or 0, snippet_length)
+    return summaries
+
+# --- Snippet file ---
+def build_snippets(db_path, table_name, doc_ids, max_length=SNIPPET_MAX_LENGTH):
+    """
+    Reads the leading max_length characters of every document in doc_ids
+    order. Returns (text_bytes, offsets, content_lengths).
+    """
+    position = {doc_id: doc_idx for doc_idx, doc_id in enumerate(doc_ids.tolist())}
+    snippets = [''] * len(position)
+    content_lengths = np.zeros(len(position), dtype=np.int64)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(f"SELECT id, substr(content, 1, ?), length(content) FROM {table_name}", (max_length,))
+        for doc_id, snippet, content_length in cursor:
+            doc_idx = position.get(doc_id)
+            if doc_idx is not None:
+                snippets[doc_idx] = snippet or ''
+                content_lengths[doc_idx] = content_length or 0
+    finally:
+        conn.close()
+
+    encoded = [snippet.encode('utf-8') for snippet in snippets]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return b''.join(encoded), offsets, content_lengths
+
+def save_snippets(index_dir, doc_ids, text_bytes, offsets, content_lengths, max_length=SNIPPET_MAX_LENGTH, source=None):
+    """
+    source is the database fingerprint (see index_store.database_fingerprint)
+    of the content the snippets were read from.
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    index_store._replace_file(os.path.join(index_dir, TEXT_FILE), lambda f: f.write(text_bytes))
+    index_store._replace_file(os.path.join(index_dir, OFFSETS_FILE), lambda f: np.save(f, offsets))
+    index_store._replace_file(os.path.join(index_dir, LENGTHS_FILE), lambda f: np.save(f, content_lengths))
+
+    manifest = {
+        'format_version': SNIPPET_FORMAT_VERSION,
+        'max_length': max_length,
+        'doc_ids': doc_ids_checksum(doc_ids),
+        'source': source,
+    }
+    manifest_bytes = json.dumps(manifest, indent=2).encode('utf-8')
+    index_store._replace_file(manifest_path, lambda f: f.write(manifest_bytes))
+    print(f"Saved snippets of {len(content_lengths)} documents to {index_dir} ({len(text_bytes) / 2**20:.1f} MB).")
+
+def load_snippets(index_dir, doc_ids, db_path=None, table_name=None):
+    """
+    Memory-maps the snippet file. Returns None when it is missing, was
+    built for another set of documents or, with db_path, from a different
+    state of the database (e.g. articles whose content changed).
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != SNIPPET_FORMAT_VERSION:
+            print(f"Snippet file in {index_dir} has format v{manifest.get('format_version')}, expected v{SNIPPET_FORMAT_VERSION}.")
+            return None
+        if manifest.get('doc_ids') != doc_ids_checksum(doc_ids):
+            print(f"Snippet file in {index_dir} is stale (documents changed since it was built).")
+            return None
+        if db_path is not None and os.path.exists(db_path):
+            if manifest.get('source') != index_store.database_fingerprint(db_path, table_name):
+                print(f"Snippet file in {index_dir} is stale (database changed since it was built).")
+                return None
+
+        text_path = os.path.join(index_dir, TEXT_FILE)
+        text = np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else np.empty(0, dtype=np.uint8)
+        snippets = {
+            'max_length': manifest['max_length'],
+            'text': text,
+            'offsets': np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode='r'),
+            'content_lengths': np.load(os.path.join(index_dir, LENGTHS_FILE), mmap_mode='r'),
+        }
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read snippet file in {index_dir}: {e}")
+        return None
+
+    print(f"Loaded snippets of {len(snippets['content_lengths'])} documents from {index_dir}.")
+    return snippets
+
+def snippets_from_file(snippets, doc_indices, snippet_length):
+    """
+    Returns {document index: summary}.
+    """
+    text, offsets, content_lengths = snippets['text'], snippets['offsets'], snippets['content_lengths']
+    summaries = {}
+    for doc_idx in doc_indices:
+        snippet = text[offsets[doc_idx]:offsets[doc_idx + 1]].tobytes().decode('utf-8')
+        summaries[doc_idx] = summarize(snippet, int(content_lengths[doc_idx]), snippet_length)
+    return summaries
+
+def build_snippet_file(db_path=DATABASE, table_name=TABLE, index_dir=INDEX_DIR):
+    """
+    Build step: writes the snippet file for the documents of the index artifact.
+    """
+    index = index_store.load_index(index_dir, db_path, table_name)
+    if index is None:
+        print("Index artifact not available. Run index_store.py first.")
+        return False
+    source = index_store.database_fingerprint(db_path, table_name)
+    text_bytes, offsets, content_lengths = build_snippets(db_path, table_name, index['doc_ids'])
+    save_snippets(index_dir, index['doc_ids'], text_bytes, offsets, content_lengths, source=source)
+    return True
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    if not build_snippet_file():
+        sys.exit(1)
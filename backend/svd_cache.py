@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+# Thread-safe cache of SVD components per rank k.
+# - entries in use (refcount > 0) are never evicted, so a request never sees components of two ranks
+# - idle entries are evicted least recently used first once the byte budget is exceeded
+# - a rank is loaded by one thread only, concurrent requests for it wait for that load
+
+def resident_bytes(components):
+    """
+    Bytes of private memory held by the components. Views (e.g. prefix slices
+    of a memory-mapped store) are free and not counted.
+    """
+    return sum(value.nbytes for value in components.values()
+               if isinstance(value, np.ndarray) and value.flags.owndata)
+
+class _Entry:
+    def __init__(self):
+        self.components = None
+        self.nbytes = 0
+        self.refcount = 1
+        self.ready = threading.Event()
+
+class SVDCache:
+    def __init__(self, loader, max_bytes):
+        """
+        loader(k) returns a components dictionary, or None if rank k can not be loaded.
+        """
+        self._loader = loader
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._resident_bytes = 0
+
+    def acquire(self, k):
+        """
+        Returns the components for rank k (loading them if needed) and pins
+        them until release(k). Returns None if they could not be loaded.
+        """
+        with self._lock:
+            entry = self._entries.get(k)
+            is_loader = entry is None
+            if is_loader:
+                entry = _Entry()
+                self._entries[k] = entry
+            else:
+                entry.refcount += 1
+                self._entries.move_to_end(k)
+
+        if not is_loader:
+            entry.ready.wait()
+            return entry.components
+
+        try:
+            components = self._loader(k)
+        except Exception as e:
+            print(f"An error occurred loading SVD components for k={k}: {e}")
+            components = None
+
+        with self._lock:
+            entry.components = components
+            if components is None:
+                # Failures are not cached, the next request retries
+                del self._entries[k]
+            else:
+                entry.nbytes = resident_bytes(components)
+                self._resident_bytes += entry.nbytes
+                self._evict()
+        entry.ready.set()
+        return components
+
+    def release(self, k):
+        with self._lock:
+            self._entries[k].refcount -= 1
+            self._evict()
+
+    @contextmanager
+    def use(self, k):
+        components = self.acquire(k)
+        try:
+            yield components
+        finally:
+            if components is not None:
+                self.release(k)
+
+    def _evict(self):
+        # Called with the lock held
+        if self._resident_bytes <= self._max_bytes:
+            return
+        for k in list(self._entries):
+            entry = self._entries[k]
+            if entry.refcount == 0:
+                del self._entries[k]
+                self._resident_bytes -= entry.nbytes
+                print(f"Evicted SVD components for k={k} from cache ({entry.nbytes / 2**20:.1f} MB).")
+                if self._resident_bytes <= self._max_bytes:
+                    return
+
+    def clear(self):
+        """
+        Drops all idle entries, e.g. after the data they were loaded from changed.
+        Entries in use stay until they are released and evicted.
+        """
+        with self._lock:
+            for k in list(self._entries):
+                entry = self._entries[k]
+                if entry.refcount == 0:
+                    del self._entries[k]
+                    self._resident_bytes -= entry.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ranks': list(self._entries),
+                'resident_bytes': self._resident_bytes,
+                'max_bytes': self._max_bytes,
+            }
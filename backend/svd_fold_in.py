@@ -0,0 +1,145 @@
+import numpy as np
+import sys
+import index_store
+import svd_store
+
+# Incremental update of the SVD store after articles were added or removed:
+# new documents are folded into the existing LSI space (no new svds), removed
+# ones are dropped, and the rows are laid out in the order of the current index.
+# Folded documents are not represented by the decomposition as well as the
+# original ones; once the drift is too large a full generate_svd_files.py run
+# is recommended.
+
+# --- Configuration ---
+DATABASE = 'database.db'
+TABLE = 'articles_180k'
+SVD_OUTPUT_DIR = 'svd_components'
+INDEX_DIR = 'index'
+BASELINE_SAMPLE_SIZE = 5000 # Original documents used to estimate the baseline error of older stores
+DRIFT_THRESHOLD = 0.05 # Allowed increase of the mean energy share outside the LSI space for folded documents
+MAX_FOLDED_FRACTION = 0.2 # Share of folded documents above which a recompute is recommended anyway
+
+def load_current_index(db_path, table_name, index_dir):
+    """
+    The index artifact for the current database, rebuilt when it is stale
+    so that app.py picks up the same documents at its next start.
+    """
+    index = index_store.load_index(index_dir, db_path, table_name, mmap=False)
+    if index is None:
+        if not index_store.build_index(db_path, table_name, index_dir):
+            return None
+        index = index_store.load_index(index_dir, db_path, table_name, mmap=False)
+    return index
+
+def store_positions(store_doc_ids, doc_ids):
+    """
+    Row of every document of the index in the store, -1 for documents the store does not have.
+    """
+    sorter = np.argsort(store_doc_ids, kind='stable')
+    found = np.searchsorted(store_doc_ids, doc_ids, sorter=sorter)
+    found[found == store_doc_ids.size] = 0
+    positions = sorter[found] if store_doc_ids.size else np.zeros(doc_ids.size, dtype=np.int64)
+    missing_mask = store_doc_ids[positions] != doc_ids if store_doc_ids.size else np.ones(doc_ids.size, dtype=bool)
+    positions[missing_mask] = -1
+    return positions
+
+def fold_in_store(store, index, changed_doc_ids=None, seed=0):
+    """
+    Updates the store in place for the documents of index. Documents of
+    changed_doc_ids (replaced or re-added since the store was updated) are
+    folded in again from their new TF-IDF columns instead of keeping their rows.
+    Returns the number of (folded, removed) documents, or None if the store
+    can not be updated.
+    """
+    doc_ids = np.asarray(index['doc_ids'], dtype=np.int64)
+    n_terms = index['A_normalized'].shape[0]
+    if store['U'].shape[0] != n_terms:
+        print(f"Dictionary changed ({store['U'].shape[0]} -> {n_terms} terms). Fold-in is not possible, run generate_svd_files.py.")
+        return None
+
+    store_doc_ids = store.get('doc_ids')
+    if store_doc_ids is None:
+        # Stores built before document ids were recorded cover the first documents of the index
+        n_store_docs = store['doc_embeddings'].shape[0]
+        print(f"SVD store has no document ids, assuming it covers the first {n_store_docs} documents of the index.")
+        store_doc_ids = doc_ids[:n_store_docs]
+    store_doc_ids = np.asarray(store_doc_ids, dtype=np.int64)
+
+    positions = store_positions(store_doc_ids, doc_ids)
+    n_removed = store_doc_ids.size - int((positions >= 0).sum())
+    if changed_doc_ids is not None and len(changed_doc_ids):
+        # Their rows in the store describe the old content
+        positions[np.isin(doc_ids, np.asarray(changed_doc_ids, dtype=np.int64))] = -1
+    new_mask = positions < 0
+    n_new = int(new_mask.sum())
+    if n_new == 0 and n_removed == 0:
+        return 0, 0
+
+    A_idf = index_store.idf_matrix(index)
+    column_norms = np.asarray(index['doc_norms'], dtype=np.float64)
+    fold_in_stats = store.setdefault('fold_in', {'folded_docs': 0, 'residual_sum': 0.0, 'baseline_residual': None})
+    if fold_in_stats.get('baseline_residual') is None:
+        rng = np.random.default_rng(seed)
+        original = np.flatnonzero(~new_mask)
+        sample = np.sort(rng.choice(original, min(BASELINE_SAMPLE_SIZE, original.size), replace=False))
+        sample_rows = svd_store.fold_in(A_idf[:, sample], store['term_embeddings'])
+        sample_residuals = svd_store.projection_residuals(sample_rows, store['s'], column_norms[sample])
+        fold_in_stats['baseline_residual'] = float(sample_residuals.mean()) if sample.size else 0.0
+
+    print(f"Folding {n_new} new documents into the LSI space (k={store['k_max']}), dropping {n_removed} removed ones...")
+    new_indices = np.flatnonzero(new_mask)
+    new_rows = svd_store.fold_in(A_idf[:, new_indices], store['term_embeddings'])
+    residuals = svd_store.projection_residuals(new_rows, store['s'], column_norms[new_indices])
+
+    doc_embeddings = np.empty((doc_ids.size, store['k_max']), dtype=np.float32)
+    doc_embeddings[~new_mask] = store['doc_embeddings'][positions[~new_mask]]
+    doc_embeddings[new_mask] = new_rows
+
+    store['doc_embeddings'] = doc_embeddings
+    store['doc_inv_norms'] = {k: svd_store.inverse_norms(norms)
+                              for k, norms in svd_store.prefix_norms(doc_embeddings.T, list(store['doc_inv_norms'])).items()}
+    store['doc_ids'] = doc_ids
+
+    fold_in_stats['folded_docs'] += n_new
+    fold_in_stats['residual_sum'] += float(residuals.sum())
+    return n_new, n_removed
+
+def drift_report(store):
+    """
+    Returns (drift, folded_fraction, recompute_recommended).
+    """
+    fold_in_stats = store.get('fold_in') or {}
+    folded_docs = fold_in_stats.get('folded_docs', 0)
+    if folded_docs == 0:
+        return 0.0, 0.0, False
+    drift = fold_in_stats['residual_sum'] / folded_docs - fold_in_stats['baseline_residual']
+    folded_fraction = folded_docs / store['doc_embeddings'].shape[0]
+    return drift, folded_fraction, drift > DRIFT_THRESHOLD or folded_fraction > MAX_FOLDED_FRACTION
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    # Loaded into memory: the store files are replaced below
+    store = svd_store.load_store(SVD_OUTPUT_DIR, mmap=False)
+    if store is None:
+        print("SVD store not found. Run generate_svd_files.py first.")
+        sys.exit(1)
+
+    index = load_current_index(DATABASE, TABLE, INDEX_DIR)
+    if index is None:
+        print("Failed to load the index. Cannot fold in documents.")
+        sys.exit(1)
+
+    result = fold_in_store(store, index)
+    if result is None:
+        sys.exit(1)
+    n_new, n_removed = result
+    if n_new or n_removed:
+        svd_store.save_store(store, SVD_OUTPUT_DIR)
+        print(f"Folded in {n_new} documents, removed {n_removed}. IVF indexes and quantized codes must be rebuilt.")
+    else:
+        print("SVD store already covers all documents of the index.")
+
+    drift, folded_fraction, recompute = drift_report(store)
+    print(f"Folded documents: {folded_fraction:.1%} of the collection, drift of the fold-in error: {drift:+.4f}")
+    if recompute:
+        print("Recommendation: the fold-in error is above the threshold, recompute the decomposition with generate_svd_files.py.")
@@ -0,0 +1,215 @@
+import numpy as np
+import joblib
+import os
+import topk
+
+# One SVD decomposition at the largest rank serves every smaller rank:
+# singular triplets are sorted by descending singular value, so the rank-k
+# components are the first k columns of U / of the document embeddings.
+
+# --- Configuration ---
+SVD_OUTPUT_DIR = 'svd_components'
+STORE_FILENAME = 'svd_store.joblib'
+EMBEDDINGS_FILENAME = 'doc_embeddings.npy' # Documents in LSI space, row-major float32 (N x k_max)
+STORE_FORMAT_VERSION = 2
+
+# Ranks whose inverse document norms are stored with the decomposition (others are computed on first use)
+PRECOMPUTED_NORM_RANKS = list(range(100, 1001, 100))
+TERM_CHUNK = 65536 # Rows of the term table scaled at a time by nearest_terms
+FOLD_IN_CHUNK = 16384 # Documents projected per sparse-dense product by fold_in
+
+def prefix_norms(V_T, ranks):
+    """
+    Norms of document vectors (columns of V_T[:k]) for every k in ranks,
+    computed incrementally in a single pass over V_T.
+    """
+    norms = {}
+    squared_sums = np.zeros(V_T.shape[1])
+    previous_k = 0
+    for k in sorted(set(ranks)):
+        squared_sums += np.einsum('ij,ij->j', V_T[previous_k:k], V_T[previous_k:k])
+        norms[k] = np.sqrt(squared_sums)
+        previous_k = k
+    return norms
+
+def inverse_norms(norms):
+    """
+    1 / norm as float32, 0 for (numerically) zero vectors so they score 0.
+    """
+    inv_norms = np.zeros(norms.shape, dtype=np.float32)
+    non_zero_mask = norms > 1e-9
+    inv_norms[non_zero_mask] = 1.0 / norms[non_zero_mask]
+    return inv_norms
+
+def document_embeddings(V_T):
+    """
+    Row-major float32 copy of V (one row per document), so scoring a query
+    is a single GEMV over contiguous memory.
+    """
+    return np.ascontiguousarray(V_T.T, dtype=np.float32)
+
+def term_embeddings(U, s_inv):
+    """
+    Rows of U scaled by 1 / s as float32: folding a query into the LSI space
+    is then a weighted sum of the rows of its terms.
+    """
+    return np.ascontiguousarray(U * s_inv, dtype=np.float32)
+
+def sort_svd(U, s, Vh):
+    """
+    Orders SVD components by descending singular values (svds returns them ascending).
+    """
+    sort_indices = s.argsort()[::-1]
+    return U[:, sort_indices], s[sort_indices], Vh[sort_indices, :]
+
+def build_store(U, s, V_T, doc_ids=None, norm_ranks=PRECOMPUTED_NORM_RANKS):
+    """
+    Packages sorted components of the top-rank decomposition.
+    doc_ids are the database ids of the documents (columns of V_T).
+    """
+    k_max = s.shape[0]
+    s_inv = np.zeros_like(s)
+    non_zero_s_mask = s > 1e-9
+    s_inv[non_zero_s_mask] = 1.0 / s[non_zero_s_mask]
+
+    ranks = [k for k in norm_ranks if k <= k_max] + [k_max]
+    return {
+        'format_version': STORE_FORMAT_VERSION,
+        'k_max': k_max,
+        'U': np.ascontiguousarray(U),
+        's': s,
+        's_inv': s_inv,
+        'term_embeddings': term_embeddings(U, s_inv),
+        'doc_embeddings': document_embeddings(V_T),
+        'doc_inv_norms': {k: inverse_norms(norms) for k, norms in prefix_norms(V_T, ranks).items()},
+        'doc_ids': None if doc_ids is None else np.asarray(doc_ids, dtype=np.int64),
+        'fold_in': {'folded_docs': 0, 'residual_sum': 0.0, 'baseline_residual': None},
+    }
+
+def save_store(store, output_dir=SVD_OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    filename = os.path.join(output_dir, STORE_FILENAME)
+    embeddings_filename = os.path.join(output_dir, EMBEDDINGS_FILENAME)
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    with open(embeddings_filename + '.tmp', 'wb') as f:
+        np.save(f, store['doc_embeddings'])
+    os.replace(embeddings_filename + '.tmp', embeddings_filename)
+
+    # Uncompressed, so that load_store can memory-map the arrays. Written last, marks the store complete.
+    joblib.dump({key: value for key, value in store.items() if key != 'doc_embeddings'}, filename + '.tmp')
+    os.replace(filename + '.tmp', filename)
+    print(f"Saved SVD store (k_max={store['k_max']}) to {output_dir}.")
+    return filename
+
+def load_store(output_dir=SVD_OUTPUT_DIR, mmap=True):
+    """
+    Loads the multi-rank SVD store, or returns None if it does not exist
+    or has another format version.
+    """
+    filename = os.path.join(output_dir, STORE_FILENAME)
+    if not os.path.exists(filename):
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    store = joblib.load(filename, mmap_mode=mmap_mode)
+    if store.get('format_version') != STORE_FORMAT_VERSION:
+        print(f"SVD store {filename} has format v{store.get('format_version')}, expected v{STORE_FORMAT_VERSION}.")
+        return None
+    store['doc_embeddings'] = np.load(os.path.join(output_dir, EMBEDDINGS_FILENAME), mmap_mode=mmap_mode)
+    if 'term_embeddings' not in store:
+        # Stores saved before the term table existed
+        store['term_embeddings'] = term_embeddings(store['U'], store['s_inv'])
+
+    print(f"Loaded SVD store from {output_dir} (k_max={store['k_max']}).")
+    return store
+
+def store_fingerprint(output_dir=SVD_OUTPUT_DIR):
+    """
+    Identifies the store on disk; files derived from it (IVF, quantized codes) record it.
+    """
+    return os.stat(os.path.join(output_dir, STORE_FILENAME)).st_mtime_ns
+
+def rank_view(store, k):
+    """
+    Rank-k components as prefix views of the store (no copies of U or the embeddings).
+    Norms for ranks that were not precomputed are computed here.
+    """
+    if not 0 < k <= store['k_max']:
+        raise ValueError(f"Rank {k} is outside of 1..{store['k_max']}.")
+
+    doc_embeddings = store['doc_embeddings'][:, :k]
+    doc_inv_norms = store['doc_inv_norms'].get(k)
+    if doc_inv_norms is None:
+        doc_inv_norms = inverse_norms(np.sqrt(np.einsum('ij,ij->i', doc_embeddings, doc_embeddings, dtype=np.float64)))
+
+    return {
+        'U_k': store['U'][:, :k],
+        's_k': store['s'][:k],
+        's_k_inv': store['s_inv'][:k],
+        'term_embeddings': store['term_embeddings'][:, :k],
+        'doc_embeddings': doc_embeddings,
+        'doc_inv_norms': doc_inv_norms,
+    }
+
+def from_legacy_components(svd_components):
+    """
+    Converts components of a per-rank svd_k_{k}.joblib file to the layout of rank_view.
+    """
+    return {
+        'U_k': svd_components['U_k'],
+        's_k': svd_components['s_k'],
+        's_k_inv': svd_components['s_k_inv'],
+        'term_embeddings': term_embeddings(svd_components['U_k'], svd_components['s_k_inv']),
+        'doc_embeddings': document_embeddings(svd_components['V_k_T']),
+        'doc_inv_norms': inverse_norms(svd_components['doc_svd_norms']),
+        'doc_ids': svd_components.get('doc_ids'),
+    }
+
+def fold_in(A_idf_columns, term_embeddings):
+    """
+    Projects documents (columns of the IDF-weighted matrix) into the LSI
+    space of an existing decomposition: v = a^T U s^-1, the same folding
+    that is applied to queries. Returns float32 rows like doc_embeddings.
+    """
+    rows = np.empty((A_idf_columns.shape[1], term_embeddings.shape[1]), dtype=np.float32)
+    A_docs = A_idf_columns.T.tocsr()
+    for start in range(0, A_docs.shape[0], FOLD_IN_CHUNK):
+        rows[start:start + FOLD_IN_CHUNK] = A_docs[start:start + FOLD_IN_CHUNK] @ term_embeddings
+    return rows
+
+def projection_residuals(rows, s, column_norms):
+    """
+    Share of every document's energy outside the span of U: 1 - ||U^T a||^2 / ||a||^2,
+    where U^T a = v * s for a folded (or original) document row v.
+    """
+    captured = np.einsum('ij,ij->i', rows * s, rows * s, dtype=np.float64)
+    residuals = np.zeros(rows.shape[0])
+    non_zero_mask = column_norms > 1e-9
+    residuals[non_zero_mask] = 1.0 - captured[non_zero_mask] / column_norms[non_zero_mask] ** 2
+    return np.clip(residuals, 0.0, 1.0)
+
+def nearest_terms(svd_components, term_ids, weights, limit):
+    """
+    Terms closest to the weighted sum of the given terms, by cosine similarity
+    of term vectors U_k * s_k. Those are rows of the term table times s_k^2,
+    so no second term matrix is stored. Returns (term_ids, scores).
+    """
+    s_k = svd_components['s_k']
+    scale = (s_k * s_k).astype(np.float32)
+    table = svd_components['term_embeddings']
+
+    center = (np.asarray(weights, dtype=np.float32) @ table[term_ids]) * scale
+    center_norm = np.linalg.norm(center)
+    if center_norm <= 1e-12:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    center /= center_norm
+    scores = np.empty(table.shape[0], dtype=np.float32)
+    for start in range(0, table.shape[0], TERM_CHUNK):
+        block = table[start:start + TERM_CHUNK] * scale
+        block_norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+        np.divide(block @ center, block_norms, out=scores[start:start + TERM_CHUNK], where=block_norms > 1e-12)
+        scores[start:start + TERM_CHUNK][block_norms <= 1e-12] = 0.0
+    return topk.top_k(scores, limit, threshold=-np.inf)
@@ -0,0 +1,149 @@
+import sqlite3
+import struct
+import sys
+import time
+import numpy as np
+
+# Storage format of the `vector` column (term counts of one article).
+# Binary, version 1:
+#   header  '<2sBBI': magic b'TV', format version, count width in bytes (1, 2 or 4), number of terms n
+#   body    n term ids (uint32, little-endian), then n counts (uint8, uint16 or uint32)
+# Text vectors of older databases ("term_id=count term_id=count ...") are still
+# read, and can be converted in place by running this module.
+
+# --- Configuration ---
+DATABASE = 'database.db'
+TABLE = 'articles_180k'
+VECTOR_FORMAT_VERSION = 1
+MAGIC = b'TV'
+HEADER = struct.Struct('<2sBBI')
+COUNT_DTYPES = {1: '<u1', 2: '<u2', 4: '<u4'} # Narrowest width that holds the largest count is used
+MIGRATION_BATCH_SIZE = 5000
+
+def encode(term_ids, counts):
+    """
+    Packs term ids and their counts into the binary vector format.
+    """
+    term_ids = np.asarray(term_ids, dtype='<u4')
+    counts = np.asarray(counts)
+    max_count = int(counts.max()) if counts.size else 0
+    count_width = next(width for width, dtype in COUNT_DTYPES.items() if max_count <= np.iinfo(dtype).max)
+    count_dtype = COUNT_DTYPES[count_width]
+    header = HEADER.pack(MAGIC, VECTOR_FORMAT_VERSION, count_width, term_ids.size)
+    return header + term_ids.tobytes() + counts.astype(count_dtype).tobytes()
+
+def encode_counts(word_counts, word_to_index):
+    """
+    Binary vector of a {word: count} mapping.
+    """
+    term_ids = np.fromiter((word_to_index[word] for word in word_counts), dtype=np.uint32, count=len(word_counts))
+    counts = np.fromiter(word_counts.values(), dtype=np.uint32, count=len(word_counts))
+    return encode(term_ids, counts)
+
+def _decode_text(vector_str):
+    term_ids = []
+    counts = []
+    for pair in vector_str.split():
+        term_idx_str, separator, count_str = pair.partition('=')
+        if not separator:
+            raise ValueError(f"Not a 'term_id=count' pair: '{pair}'")
+        term_ids.append(int(term_idx_str))
+        counts.append(int(count_str))
+    return np.array(term_ids, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+def decode(value):
+    """
+    Returns (term_ids, counts) of a stored vector: a binary blob, a text
+    vector, or None / empty for articles without terms. Raises ValueError
+    for malformed values.
+    """
+    if not value:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    if isinstance(value, str):
+        return _decode_text(value)
+
+    value = bytes(value)
+    if len(value) < HEADER.size:
+        raise ValueError("Vector blob is shorter than its header.")
+    magic, version, count_width, n_terms = HEADER.unpack_from(value)
+    if magic != MAGIC or version != VECTOR_FORMAT_VERSION or count_width not in COUNT_DTYPES:
+        raise ValueError(f"Unsupported vector blob (magic {magic!r}, version {version}, count width {count_width}).")
+    if len(value) != HEADER.size + n_terms * (4 + count_width):
+        raise ValueError("Vector blob length does not match its header.")
+
+    term_ids = np.frombuffer(value, dtype='<u4', count=n_terms, offset=HEADER.size)
+    counts = np.frombuffer(value, dtype=COUNT_DTYPES[count_width], count=n_terms, offset=HEADER.size + 4 * n_terms)
+    return term_ids, counts
+
+def decode_many(values, n_terms, doc_labels=None):
+    """
+    Decodes the vectors of many documents into COO arrays (term_ids, doc_indices, counts),
+    keeping only entries with a valid term id and a positive count.
+    doc_labels (e.g. database ids) are used in warnings about malformed vectors.
+    """
+    term_id_parts = []
+    count_parts = []
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for doc_idx, value in enumerate(values):
+        try:
+            term_ids, counts = decode(value)
+        except ValueError as e:
+            label = doc_labels[doc_idx] if doc_labels is not None else doc_idx
+            print(f"Warning: Could not decode vector of doc_id {label}: {e}")
+            continue
+        term_id_parts.append(term_ids.astype(np.int64, copy=False))
+        count_parts.append(counts.astype(np.int64, copy=False))
+        lengths[doc_idx] = term_ids.size
+
+    if not term_id_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    term_ids = np.concatenate(term_id_parts)
+    counts = np.concatenate(count_parts)
+    doc_indices = np.repeat(np.arange(len(values), dtype=np.int64), lengths)
+
+    valid_mask = (term_ids >= 0) & (term_ids < n_terms) & (counts > 0)
+    return term_ids[valid_mask], doc_indices[valid_mask], counts[valid_mask]
+
+# --- Migration ---
+def migrate(db_path=DATABASE, table_name=TABLE, batch_size=MIGRATION_BATCH_SIZE, vacuum=True):
+    """
+    Rewrites text vectors of table_name in the binary format, in rowid
+    order and in batches. Already converted rows are skipped, so the
+    migration can be interrupted and restarted.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        last_rowid = 0
+        converted = 0
+        started = time.perf_counter()
+        while True:
+            rows = conn.execute(f"""
+                SELECT rowid, id, vector FROM {table_name}
+                WHERE rowid > ? AND typeof(vector) = 'text' AND vector != ''
+                ORDER BY rowid LIMIT ?
+            """, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+
+            updates = []
+            for _, doc_id, vector_str in rows:
+                try:
+                    updates.append((encode(*decode(vector_str)), doc_id))
+                except ValueError as e:
+                    print(f"Warning: Skipping vector of doc_id {doc_id}: {e}")
+            conn.executemany(f"UPDATE {table_name} SET vector = ? WHERE id = ?", updates)
+            conn.commit()
+            converted += len(updates)
+            print(f"Converted {converted} vectors ({converted / (time.perf_counter() - started):.0f} rows/s).")
+
+        print(f"Migration finished: {converted} vectors converted to binary format v{VECTOR_FORMAT_VERSION}.")
+        if vacuum and converted:
+            print("Reclaiming free space (VACUUM)...")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    migrate(table_name=sys.argv[1] if len(sys.argv) > 1 else TABLE)
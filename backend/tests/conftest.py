@@ -0,0 +1,65 @@
+import importlib
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WORDS = ['apple', 'river', 'mountain', 'music', 'guitar', 'ocean', 'planet', 'rocket',
+         'garden', 'flower', 'castle', 'dragon', 'forest', 'island', 'winter', 'summer']
+N_DOCS = 60
+SVD_RANK = 8
+
+def create_database(path):
+    # Small collection in the layout of the articles database (text vectors)
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE dictionary (content TEXT)")
+    cursor.execute("CREATE TABLE articles_180k (id INTEGER PRIMARY KEY, vector TEXT, link TEXT, title TEXT, content TEXT, parsed_content TEXT)")
+    cursor.execute("INSERT INTO dictionary VALUES (?)", (' '.join(WORDS),))
+    for doc_id in range(1, N_DOCS + 1):
+        tokens = [rng.choice(WORDS) for _ in range(rng.randint(5, 20))]
+        counts = {}
+        for token in tokens:
+            counts[WORDS.index(token)] = counts.get(WORDS.index(token), 0) + 1
+        vector = ' '.join(f'{term_id}={count}' for term_id, count in counts.items())
+        content = ' '.join(tokens)
+        cursor.execute("INSERT INTO articles_180k VALUES (?, ?, ?, ?, ?, ?)",
+                       (doc_id, vector, f'https://example.org/{doc_id}', f'Article {doc_id}', content, content))
+    conn.commit()
+    conn.close()
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    app.py serving a small collection with an SVD store and int8 codes.
+    """
+    data_dir = tmp_path_factory.mktemp('data')
+    previous_dir = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        create_database('database.db')
+
+        import generate_svd_files
+        import quantization
+        import svd_store
+        A_idf, _, doc_ids, _ = generate_svd_files.load_base_data_for_svd('database.db', 'articles_180k')
+        generate_svd_files.compute_and_save_svd(A_idf, SVD_RANK, 'svd_components', doc_ids=doc_ids)
+        store = svd_store.load_store('svd_components')
+        quantization.save_quantized(quantization.build_int8(store, source=svd_store.store_fingerprint('svd_components')),
+                                    'svd_components')
+
+        # app.py loads the data of the working directory at import
+        app = importlib.import_module('app')
+        yield app
+    finally:
+        os.chdir(previous_dir)
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,14 @@
+def test_empty_batch_returns_empty_list(client):
+    response = client.post('/batch_search', json={'queries': []})
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+def test_empty_batch_svd_mode(client):
+    response = client.post('/batch_search', json={'queries': [], 'mode': 'svd', 'k': 4})
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+def test_batch_returns_one_list_per_query(client):
+    response = client.post('/batch_search', json={'queries': ['apple river', 'guitar']})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import index_store
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_server_process(index_dir):
+    # Registers like app.py does and waits until its stdin is closed
+    code = ("import sys, index_store; registration = index_store.register_server(sys.argv[1]); "
+            "print('ready', flush=True); sys.stdin.read()")
+    process = subprocess.Popen([sys.executable, '-c', code, index_dir], cwd=BACKEND_DIR,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline().strip() == 'ready'
+    return process
+
+def test_count_servers(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    registration = index_store.register_server(index_dir)
+    try:
+        assert index_store.count_servers(index_dir) == 1
+        process = start_server_process(index_dir)
+        assert index_store.count_servers(index_dir) == 2
+        process.stdin.close()
+        process.wait()
+        # The registration of the exited process is removed
+        assert index_store.count_servers(index_dir) == 1
+        assert os.listdir(os.path.join(index_dir, index_store.SERVERS_DIR)) == [str(os.getpid())]
+    finally:
+        registration.close()
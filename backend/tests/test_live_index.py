@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+import pytest
+
+import index_store
+import live_index
+import text_analyzer
+from conftest import create_database
+
+TABLE = 'articles_180k'
+
+@pytest.fixture
+def live(tmp_path):
+    db_path, index_dir = str(tmp_path / 'database.db'), str(tmp_path / 'index')
+    create_database(db_path)
+    index = index_store.load_or_build_index(db_path, TABLE, index_dir)
+    live = live_index.LiveIndex(index, None, text_analyzer.build_term_index(index['dictionary']), db_path, TABLE,
+                                index_dir, live_index.ReadWriteLock())
+    return live
+
+def write_from_other_process(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"INSERT INTO {TABLE} (vector, link, title, content, parsed_content) VALUES ('0=1', 'l', 't', 'apple', 'apple')")
+    conn.commit()
+    conn.close()
+
+def test_merged_artifact_is_fresh(live):
+    live.add_document('New', 'https://example.org/new', 'apple river garden')
+    assert live.merge()
+    assert index_store.load_index(live.index_dir, live.db_path, TABLE) is not None
+
+def test_merged_artifact_is_stale_after_other_writers(live):
+    write_from_other_process(live.db_path)
+    live.add_document('New', 'https://example.org/new', 'apple river garden')
+    assert live.merge()
+    assert index_store.read_manifest(live.index_dir)['source'] is None
+    assert index_store.load_index(live.index_dir, live.db_path, TABLE) is None
+    # The next start rebuilds the artifact from the database, with the other writer's article
+    rebuilt = index_store.load_or_build_index(live.db_path, TABLE, live.index_dir)
+    assert len(rebuilt['doc_ids']) == len(live.main['doc_ids']) + 1
+
+def test_other_writer_during_merge(live, monkeypatch):
+    live.add_document('New', 'https://example.org/new', 'apple river garden')
+    build_index_from_tf = index_store.build_index_from_tf
+
+    def build_with_concurrent_write(*args):
+        write_from_other_process(live.db_path)
+        return build_index_from_tf(*args)
+
+    monkeypatch.setattr(index_store, 'build_index_from_tf', build_with_concurrent_write)
+    assert live.merge()
+    assert index_store.read_manifest(live.index_dir)['source'] is None
+    assert os.path.exists(os.path.join(live.index_dir, index_store.MANIFEST_FILE))
+
+def test_merge_keeps_counts_of_terms_in_every_document(tmp_path):
+    # 'apple' (term 0) occurs in every article: IDF 0, no weight in A_normalized
+    db_path, index_dir = str(tmp_path / 'database.db'), str(tmp_path / 'index')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE dictionary (content TEXT)")
+    conn.execute(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, vector TEXT, link TEXT, title TEXT, content TEXT, parsed_content TEXT)")
+    conn.execute("INSERT INTO dictionary VALUES ('apple river garden')")
+    conn.executemany(f"INSERT INTO {TABLE} (vector, link, title, content, parsed_content) VALUES (?, 'l', 't', '', '')",
+                     [('0=2 1=1',), ('0=3 2=1',), ('0=1 1=2',)])
+    conn.commit()
+    conn.close()
+    index = index_store.load_or_build_index(db_path, TABLE, index_dir)
+    assert index['idf_vector'][0] == 0
+    live = live_index.LiveIndex(index, None, text_analyzer.build_term_index(index['dictionary']), db_path, TABLE,
+                                index_dir, live_index.ReadWriteLock())
+
+    live.add_document('New', 'https://example.org/new', 'river garden')
+    assert live.merge()
+    merged = live.main
+    assert merged['idf_vector'][0] > 0
+    assert merged['A_tf'][0].toarray().ravel().tolist() == [2, 3, 1, 0]
+    assert merged['postings']['indptr'][1] - merged['postings']['indptr'][0] == 3
+
+def test_refused_change_is_not_written(live):
+    live.check_writable = lambda: "Other server processes."
+    with pytest.raises(live_index.LiveUpdateError):
+        live.add_document('New', 'https://example.org/new', 'apple river garden')
+    conn = sqlite3.connect(live.db_path)
+    (n_articles,) = conn.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()
+    conn.close()
+    assert n_articles == len(live.main['doc_ids'])
+    assert len(live.delta) == 0
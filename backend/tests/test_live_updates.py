@@ -0,0 +1,16 @@
+import os
+
+from test_index_store import start_server_process
+
+def test_live_updates_are_refused_with_other_servers(app_module, client):
+    process = start_server_process(os.path.abspath(app_module.INDEX_DIR))
+    try:
+        response = client.post('/documents', json={'title': 'New', 'link': 'https://example.org/new', 'content': 'apple'})
+        assert response.status_code == 409
+        assert client.delete('/documents/1').status_code == 409
+        assert client.post('/merge').status_code == 409
+    finally:
+        process.stdin.close()
+        process.wait()
+    assert app_module.live_updates_refused() is None
+    assert len(app_module.live.delta) == 0
@@ -0,0 +1,36 @@
+import numpy as np
+
+import quantization
+import svd_store
+
+def make_store(n_docs=5000, k_max=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'k_max': k_max,
+        'doc_embeddings': rng.standard_normal((n_docs, k_max), dtype=np.float32),
+        'doc_inv_norms': {},
+        'U': np.zeros((1, k_max), dtype=np.float32),
+        's': np.ones(k_max, dtype=np.float32),
+        's_inv': np.ones(k_max, dtype=np.float32),
+        'term_embeddings': np.zeros((1, k_max), dtype=np.float32),
+    }
+
+def test_int8_codes_are_rank_major():
+    store = make_store()
+    quantized = quantization.build_int8(store)
+    assert quantized['codes'].shape == (40, 5000)
+    assert quantized['codes'].flags['C_CONTIGUOUS']
+
+def test_int8_scores_match_dequantized_scan(monkeypatch):
+    # Blocks that do not divide the rank or the number of documents
+    monkeypatch.setattr(quantization, 'INT8_RANK_BLOCK', 16)
+    monkeypatch.setattr(quantization, 'INT8_DOC_BLOCK', 1000 + 7)
+    store = make_store()
+    quantized = quantization.build_int8(store)
+    for k in (1, 25, 40):
+        view = svd_store.rank_view(store, k)
+        q_unit = np.random.default_rng(k).standard_normal(k).astype(np.float32)
+        q_unit /= np.linalg.norm(q_unit)
+        dequantized = quantized['codes'][:k].T * quantized['scales'][:k]
+        expected = (dequantized @ q_unit) * view['doc_inv_norms']
+        np.testing.assert_allclose(quantization.int8_scores(quantized, q_unit, view['doc_inv_norms']), expected, atol=1e-5)
@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import index_store
+import inverted_index
+import shard_search
+from conftest import create_database
+
+QUERY_DELAY = 1.0
+
+@pytest.fixture
+def sharded(tmp_path):
+    db_path, index_dir = str(tmp_path / 'database.db'), str(tmp_path / 'index')
+    create_database(db_path)
+    index = index_store.load_or_build_index(db_path, 'articles_180k', index_dir)
+    shards = shard_search.ShardedIndex(index_dir, str(tmp_path / 'svd'), 2, doc_ids=index['doc_ids'])
+    yield index, shards
+    shards.close()
+
+def queries(index, n):
+    rng = np.random.default_rng(0)
+    n_terms = len(index['dictionary'])
+    result = []
+    for _ in range(n):
+        term_ids = np.sort(rng.choice(n_terms, size=3, replace=False))
+        weights = rng.random(3)
+        result.append((term_ids, weights / np.linalg.norm(weights)))
+    return result
+
+def test_concurrent_queries_get_their_own_rankings(sharded):
+    index, shards = sharded
+    batch = queries(index, 40)
+    with ThreadPoolExecutor(8) as executor:
+        rankings = list(executor.map(lambda query: shards.linear_search([query], 10, threshold=1e-9)[0], batch))
+    for (term_ids, weights), (doc_indices, doc_scores) in zip(batch, rankings):
+        expected_indices, expected_scores = inverted_index.search(index['postings'], term_ids, weights, 10, threshold=1e-9)
+        # Ties may be ordered differently across shards, scores may not
+        np.testing.assert_allclose(doc_scores, expected_scores, rtol=1e-6)
+        assert doc_indices.size == expected_indices.size
+
+def test_independent_queries_run_at_the_same_time(tmp_path, monkeypatch):
+    db_path, index_dir = str(tmp_path / 'database.db'), str(tmp_path / 'index')
+    create_database(db_path)
+    index = index_store.load_or_build_index(db_path, 'articles_180k', index_dir)
+    search = inverted_index.search
+
+    def slow_search(*args, **kwargs):
+        time.sleep(QUERY_DELAY)
+        return search(*args, **kwargs)
+
+    # Patched before the shards are forked, so their workers search slowly
+    monkeypatch.setattr(inverted_index, 'search', slow_search)
+    shards = shard_search.ShardedIndex(index_dir, str(tmp_path / 'svd'), 2, doc_ids=index['doc_ids'])
+    try:
+        batch = queries(index, 2)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lambda query: shards.linear_search([query], 10), batch))
+        assert time.perf_counter() - start < 1.8 * QUERY_DELAY
+    finally:
+        shards.close()
@@ -0,0 +1,33 @@
+import os
+import sqlite3
+
+import numpy as np
+
+import index_store
+import snippet_store
+
+def create_articles(db_path, contents):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE articles_180k (id INTEGER PRIMARY KEY, vector TEXT, link TEXT, title TEXT, content TEXT, parsed_content TEXT)")
+    conn.executemany("INSERT INTO articles_180k (id, content) VALUES (?, ?)", enumerate(contents, start=1))
+    conn.commit()
+    conn.close()
+
+def test_snippets_are_stale_when_content_changes(tmp_path):
+    db_path, index_dir = str(tmp_path / 'database.db'), str(tmp_path / 'index')
+    create_articles(db_path, ['first article', 'second article'])
+    doc_ids = np.array([1, 2])
+    os.makedirs(index_dir)
+    source = index_store.database_fingerprint(db_path, 'articles_180k')
+    snippet_store.save_snippets(index_dir, doc_ids, *snippet_store.build_snippets(db_path, 'articles_180k', doc_ids),
+                                source=source)
+    assert snippet_store.load_snippets(index_dir, doc_ids, db_path, 'articles_180k') is not None
+
+    # Same ids, new content
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE articles_180k SET content = 'rewritten article with a longer text' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert snippet_store.load_snippets(index_dir, doc_ids, db_path, 'articles_180k') is None
+    # Without a database to compare with, only the document ids are checked
+    assert snippet_store.load_snippets(index_dir, doc_ids) is not None
@@ -0,0 +1,46 @@
+import numpy as np
+from scipy.sparse import csc_matrix
+
+import generate_svd_files
+import index_store
+import svd_fold_in
+import svd_store
+
+N_TERMS = 12
+N_DOCS = 30
+RANK = 5
+
+def make_index(A_tf):
+    doc_ids = np.arange(1, A_tf.shape[1] + 1)
+    return index_store.build_index_from_tf([f'term{i}' for i in range(N_TERMS)], doc_ids,
+                                           [f'https://example.org/{i}' for i in doc_ids],
+                                           [f'Article {i}' for i in doc_ids], csc_matrix(A_tf))
+
+def make_store(index, tmp_path):
+    generate_svd_files.compute_and_save_svd(index_store.idf_matrix(index), RANK, str(tmp_path), doc_ids=index['doc_ids'])
+    return svd_store.load_store(str(tmp_path), mmap=False)
+
+def test_replaced_document_is_folded_in_again(tmp_path):
+    rng = np.random.default_rng(0)
+    A_tf = rng.integers(0, 4, size=(N_TERMS, N_DOCS)).astype(np.float64)
+    store = make_store(make_index(A_tf), tmp_path)
+
+    # Article 3 is replaced with new content: same id, new column
+    A_tf[:, 2] = 0
+    A_tf[[0, 1], 2] = 5
+    new_index = make_index(A_tf)
+    old_row = store['doc_embeddings'][2].copy()
+
+    assert svd_fold_in.fold_in_store(store, new_index, changed_doc_ids=[3]) == (1, 0)
+    expected = svd_store.fold_in(index_store.idf_matrix(new_index)[:, [2]], store['term_embeddings'])[0]
+    np.testing.assert_allclose(store['doc_embeddings'][2], expected, rtol=1e-5, atol=1e-6)
+    assert not np.allclose(store['doc_embeddings'][2], old_row)
+    np.testing.assert_array_equal(store['doc_ids'], new_index['doc_ids'])
+
+def test_unchanged_documents_keep_their_rows(tmp_path):
+    rng = np.random.default_rng(1)
+    A_tf = rng.integers(0, 4, size=(N_TERMS, N_DOCS)).astype(np.float64)
+    index = make_index(A_tf)
+    store = make_store(index, tmp_path)
+    assert svd_fold_in.fold_in_store(store, index) == (0, 0)
+    assert svd_fold_in.fold_in_store(store, index, changed_doc_ids=[]) == (0, 0)
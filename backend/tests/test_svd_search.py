@@ -0,0 +1,53 @@
+import joblib
+import numpy as np
+
+import svd_store
+
+def result_cache_hits(client):
+    return client.get('/stats').get_json()['result_cache']['hits']
+
+def test_quantized_search_is_cached(client):
+    query = {'query': 'mountain ocean', 'k': 4, 'quantization': 'int8'}
+    first = client.post('/svd_search', json=query)
+    assert first.status_code == 200
+    assert first.get_json()
+
+    hits = result_cache_hits(client)
+    second = client.post('/svd_search', json=query)
+    assert second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert result_cache_hits(client) == hits + 1
+
+def reset_svd_loading(app_module, monkeypatch, svd_dir):
+    monkeypatch.setattr(app_module, 'SVD_OUTPUT_DIR', svd_dir)
+    monkeypatch.setattr(app_module, 'svd_components_store', None)
+    monkeypatch.setattr(app_module, 'svd_store_failed_load', None)
+    monkeypatch.setattr(app_module, 'legacy_svd_failed_loads', {})
+
+def test_legacy_components_of_other_documents_are_rejected_once(app_module, tmp_path, monkeypatch):
+    # Per-rank file of a collection with one more document (e.g. from before a live merge)
+    k, n_docs = 4, app_module.N_docs + 1
+    joblib.dump({'U_k': np.ones((app_module.M_terms, k)), 's_k': np.ones(k), 's_k_inv': np.ones(k),
+                 'V_k_T': np.ones((k, n_docs)), 'doc_svd_norms': np.ones(n_docs)}, tmp_path / f'svd_k_{k}.joblib')
+    reset_svd_loading(app_module, monkeypatch, str(tmp_path))
+    loads = []
+    real_load = joblib.load
+    monkeypatch.setattr(joblib, 'load', lambda *args, **kwargs: loads.append(args) or real_load(*args, **kwargs))
+
+    assert app_module.load_svd_components(k) is None
+    assert app_module.load_svd_components(k) is None
+    assert len(loads) == 1
+
+def test_missing_store_is_not_reloaded_on_every_request(app_module, tmp_path, monkeypatch):
+    reset_svd_loading(app_module, monkeypatch, str(tmp_path))
+    loads = []
+    real_load_store = svd_store.load_store
+    monkeypatch.setattr(svd_store, 'load_store', lambda *args, **kwargs: loads.append(args) or real_load_store(*args, **kwargs))
+
+    assert app_module.get_svd_store() is None
+    assert app_module.get_svd_store() is None
+    assert len(loads) == 1
+    # A new index version (e.g. after a merge) tries again
+    monkeypatch.setattr(app_module, 'index_version', app_module.index_version + 1)
+    assert app_module.get_svd_store() is None
+    assert len(loads) == 2
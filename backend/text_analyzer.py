@@ -0,0 +1,82 @@
+import re
+import threading
+from functools import lru_cache
+from nltk.stem import WordNetLemmatizer
+from nltk.corpus import stopwords
+
+# Shared text analysis for articles (parse_content.py) and queries (app.py).
+# Both sides must tokenize identically, otherwise query terms miss the dictionary.
+
+# --- Configuration ---
+LEMMA_CACHE_SIZE = 200000 # Max distinct tokens kept in the lemma cache
+MIN_TOKEN_LENGTH = 3
+UNWANTED_WORDS = frozenset({'see', 'also', 'references', 'history', 'value', 'term'})
+
+# Applied in order, each match is removed
+_REMOVE_PATTERNS = [
+    re.compile(r'&lt;.*?&gt;'),       # HTML tags written as entities
+    re.compile(r'<.*?>'),             # Plain HTML tags
+    re.compile(r'\{\{.*?\}\}'),       # Wiki templates
+    re.compile(r'\[\[.*?\]\]'),       # Wiki links
+    re.compile(r'formula[_ ]?\d+'),   # Math placeholders (formula_12, formula 3)
+    re.compile(r'\(formula[^)]*\)'),
+    re.compile(r'oc\+sc'),            # Leftovers after formulas
+    re.compile(r'oc sc'),
+]
+_NON_ALPHA_PATTERN = re.compile(r'[^a-zA-Z\s]')
+
+_stop_words = None
+_lemmatizer = None
+_resources_lock = threading.Lock()
+
+def _load_resources():
+    global _stop_words, _lemmatizer
+    with _resources_lock:
+        if _stop_words is None:
+            # _stop_words is the sentinel checked without the lock, so it is published last
+            _lemmatizer = WordNetLemmatizer()
+            _stop_words = frozenset(stopwords.words('english'))
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(token):
+    """
+    Memoized WordNet lemmatization of a single lowercase token.
+    """
+    if _stop_words is None:
+        _load_resources()
+    return _lemmatizer.lemmatize(token)
+
+def analyze(text):
+    """
+    Cleans, tokenizes and lemmatizes text. Returns the list of tokens.
+    """
+    if not text:
+        return []
+    if _stop_words is None:
+        _load_resources()
+
+    for pattern in _REMOVE_PATTERNS:
+        text = pattern.sub('', text)
+    text = _NON_ALPHA_PATTERN.sub(' ', text).lower()
+
+    stop_words = _stop_words
+    tokens = []
+    for token in text.split():
+        if len(token) < MIN_TOKEN_LENGTH or token in stop_words:
+            continue
+        lemma = lemmatize(token)
+        if lemma not in UNWANTED_WORDS:
+            tokens.append(lemma)
+    return tokens
+
+def clean_text(text):
+    """
+    Text form of analyze(): tokens joined with single spaces.
+    """
+    return ' '.join(analyze(text))
+
+def build_term_index(dictionary):
+    """
+    Maps every dictionary term to its row index in the term-document matrix.
+    """
+    return {term: idx for idx, term in enumerate(dictionary)}
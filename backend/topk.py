@@ -0,0 +1,26 @@
+import numpy as np
+
+# Top-k selection over dense score vectors.
+# Only about offset + limit candidates are ever sorted, the rest is handled by a partition.
+
+def top_k(scores, limit, offset=0, threshold=0.0):
+    """
+    Returns (doc_indices, doc_scores) for ranks [offset, offset + limit)
+    among documents with score > threshold, ordered by descending score
+    (ties broken by ascending document index).
+    """
+    scores = np.asarray(scores)
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+
+    candidates = np.flatnonzero(scores > threshold)
+    needed = offset + limit
+    if candidates.size > needed:
+        # Keep everything tied with the needed-th score, so pages are stable
+        candidate_scores = scores[candidates]
+        kth_score = -np.partition(-candidate_scores, needed - 1)[needed - 1]
+        candidates = candidates[candidate_scores >= kth_score]
+
+    candidate_scores = scores[candidates]
+    order = np.lexsort((candidates, -candidate_scores))[offset:needed]
+    return candidates[order], candidate_scores[order]